@@ -1,111 +1,42 @@
 #-*- coding:utf-8 -*-    --------------Ashare 股票行情数据双核心版( https://github.com/mpquant/Ashare )
 import json,requests,datetime,os;      import pandas as pd  #
+import logging
 from datetime import timezone, timedelta
 
 # 导入配置
-from config import LOCAL_DATA_PATH, get_stock_filename, get_data_file_path
+from config import LOCAL_DATA_PATH, ROLLUPS_ENABLED, SYMBOL_STORE_ENABLED, get_stock_filename, get_data_file_path
+from catalog import get_catalog
+from aggregation import aggregate_bars, aggregate_hourly
+from local_store import estimate_bar_count, list_data_years, load_year_frame, read_years_backward
+from symbol_store import open_symbol_store
+from rollups import DERIVED_FREQUENCIES, ROLLUP_FREQUENCIES, read_rollup_bars
+from trading_calendar import INTRADAY_FREQUENCIES, get_calendar
 
 # 设置北京时区
 BEIJING_TZ = timezone(timedelta(hours=8))
 
+# 读取和聚合过程的日志，Web服务中经队列异步写入（见 request_log.py），进度信息为DEBUG级别
+logger = logging.getLogger(__name__)
+
 def aggregate_hourly_trading_data(df):
     """
     按照股市交易时间聚合小时线数据
     上午：9:30-11:30 (2小时) → 9:30-10:30, 10:30-11:30
     下午：13:00-15:00 (2小时) → 13:00-14:00, 14:00-15:00
+
+    时段划分见 trading_calendar.HOURLY_SESSION_BUCKETS，按时段标记后一次性聚合，不再逐日循环。
     """
     if df.empty:
         return df
 
-    print(f"开始按交易时间聚合小时线数据，原始数据{len(df)}条")
+    logger.debug("开始按交易时间聚合小时线数据，原始数据%d条", len(df))
 
     # 确保数据按时间排序
-    df = df.sort_values('date')
-
-    # 创建结果列表
-    result_data = []
-
-    # 按日期分组处理
-    df['date_only'] = df['date'].dt.date
-    for date, day_data in df.groupby('date_only'):
-        # 上午时段：9:30-11:30
-        morning_data = day_data[
-            (day_data['date'].dt.time >= pd.Timestamp('09:30:00').time()) &
-            (day_data['date'].dt.time < pd.Timestamp('11:30:00').time())
-        ]
-
-        if not morning_data.empty:
-            # 9:30-10:30
-            morning_first_hour = morning_data[
-                morning_data['date'].dt.time < pd.Timestamp('10:30:00').time()
-            ]
-            if not morning_first_hour.empty:
-                result_data.append({
-                    'date': pd.Timestamp(f"{date} 10:30:00"),
-                    'open': morning_first_hour['open'].iloc[0],
-                    'high': morning_first_hour['high'].max(),
-                    'low': morning_first_hour['low'].min(),
-                    'close': morning_first_hour['close'].iloc[-1],
-                    'volume': morning_first_hour['volume'].sum()
-                })
-
-            # 10:30-11:30
-            morning_second_hour = morning_data[
-                morning_data['date'].dt.time >= pd.Timestamp('10:30:00').time()
-            ]
-            if not morning_second_hour.empty:
-                result_data.append({
-                    'date': pd.Timestamp(f"{date} 11:30:00"),
-                    'open': morning_second_hour['open'].iloc[0],
-                    'high': morning_second_hour['high'].max(),
-                    'low': morning_second_hour['low'].min(),
-                    'close': morning_second_hour['close'].iloc[-1],
-                    'volume': morning_second_hour['volume'].sum()
-                })
-
-        # 下午时段：13:00-15:00（包含15:00）
-        afternoon_data = day_data[
-            (day_data['date'].dt.time >= pd.Timestamp('13:00:00').time()) &
-            (day_data['date'].dt.time <= pd.Timestamp('15:00:00').time())
-        ]
-
-        if not afternoon_data.empty:
-            # 13:00-14:00
-            afternoon_first_hour = afternoon_data[
-                afternoon_data['date'].dt.time < pd.Timestamp('14:00:00').time()
-            ]
-            if not afternoon_first_hour.empty:
-                result_data.append({
-                    'date': pd.Timestamp(f"{date} 14:00:00"),
-                    'open': afternoon_first_hour['open'].iloc[0],
-                    'high': afternoon_first_hour['high'].max(),
-                    'low': afternoon_first_hour['low'].min(),
-                    'close': afternoon_first_hour['close'].iloc[-1],
-                    'volume': afternoon_first_hour['volume'].sum()
-                })
-
-            # 14:00-15:00
-            afternoon_second_hour = afternoon_data[
-                afternoon_data['date'].dt.time >= pd.Timestamp('14:00:00').time()
-            ]
-            if not afternoon_second_hour.empty:
-                result_data.append({
-                    'date': pd.Timestamp(f"{date} 15:00:00"),
-                    'open': afternoon_second_hour['open'].iloc[0],
-                    'high': afternoon_second_hour['high'].max(),
-                    'low': afternoon_second_hour['low'].min(),
-                    'close': afternoon_second_hour['close'].iloc[-1],
-                    'volume': afternoon_second_hour['volume'].sum()
-                })
-
-    # 转换为DataFrame
-    if result_data:
-        result = pd.DataFrame(result_data)
-        result = result.sort_values('date')
-        print(f"交易时间聚合完成，返回{len(result)}条小时线数据")
+    result = aggregate_hourly(df.sort_values('date'))
+    if result.empty:
+        logger.debug("没有找到交易时间内的数据")
     else:
-        result = pd.DataFrame(columns=['date', 'open', 'high', 'low', 'close', 'volume'])
-        print("没有找到交易时间内的数据")
+        logger.debug("交易时间聚合完成，返回%d条小时线数据", len(result))
 
     return result
 
@@ -124,252 +55,248 @@ def aggregate_data_by_frequency(df, frequency, target_count=1000):
     if df.empty:
         return df
 
-    print(f"开始聚合数据: 原始数据{len(df)}条, 目标频率{frequency}, 目标数量{target_count}条")
+    logger.debug("开始聚合数据: 原始数据%d条, 目标频率%s, 目标数量%d条", len(df), frequency, target_count)
 
-    # 确保数据按时间排序
-    df = df.sort_values('date')
-
-    if frequency == '1d':  # 日线
-        # 按日期分组聚合
-        df['date_only'] = df['date'].dt.date
-        grouped = df.groupby('date_only').agg({
-            'open': 'first',
-            'high': 'max',
-            'low': 'min',
-            'close': 'last',
-            'volume': 'sum'
-        }).reset_index()
-        grouped['date'] = pd.to_datetime(grouped['date_only'])
-        result = grouped[['date', 'open', 'high', 'low', 'close', 'volume']]
-
-    elif frequency == '1w':  # 周线
-        df_temp = df.copy()
-        df_temp.set_index('date', inplace=True)
-        weekly = df_temp.resample('W').agg({
-            'open': 'first',
-            'high': 'max',
-            'low': 'min',
-            'close': 'last',
-            'volume': 'sum'
-        }).reset_index()
-        result = weekly
-
-    elif frequency == '1M':  # 月线
-        df_temp = df.copy()
-        df_temp.set_index('date', inplace=True)
-        monthly = df_temp.resample('M').agg({
-            'open': 'first',
-            'high': 'max',
-            'low': 'min',
-            'close': 'last',
-            'volume': 'sum'
-        }).reset_index()
-        result = monthly
-
-    elif frequency in ['1m', '5m', '15m', '30m', '60m']:  # 分钟线聚合
-        # 提取分钟数
-        minutes = int(frequency[:-1])
-
-        if minutes == 1:
-            # 1分钟线直接返回
-            result = df
-        elif minutes == 60:
-            # 小时线需要特殊处理，按照股市交易时间聚合
-            result = aggregate_hourly_trading_data(df)
-        else:
-            # 其他分钟线聚合
-            df_temp = df.copy()
-            df_temp.set_index('date', inplace=True)
-
-            # 使用pandas的resample进行时间聚合
-            freq_str = f'{minutes}T'  # T表示分钟
-            aggregated = df_temp.resample(freq_str).agg({
-                'open': 'first',
-                'high': 'max',
-                'low': 'min',
-                'close': 'last',
-                'volume': 'sum'
-            }).reset_index()
-
-            # 过滤掉没有数据的时间段
-            result = aggregated.dropna()
-    else:
-        # 未知频率，直接返回原数据
-        result = df
+    # 聚合规则见 aggregation.aggregate_bars，只聚合生成最后 target_count 根K线所需的数据
+    result = aggregate_bars(df, frequency, target_count)
 
     # 确保返回固定数量的K线（取最新的数据）
     if len(result) > target_count:
         result = result.tail(target_count)
-        print(f"数据量超过目标，截取最新{target_count}条")
+        logger.debug("数据量超过目标，截取最新%d条", target_count)
 
-    print(f"聚合完成: 返回{len(result)}条{frequency}数据")
+    logger.debug("聚合完成: 返回%d条%s数据", len(result), frequency)
     return result
 
-def get_price_local(code, end_date='', count=1000, frequency='1d', start_date=''):
+def _read_local_minutes(code, start_date='', end_date='', count=1000, frequency='1d'):
     """
-    从本地CSV文件读取股票数据 - 智能聚合到指定周期
+    按年份读取本地分钟数据并按日期范围筛选
+
+    未指定开始日期时，从结束年份（未指定时为最新的数据年份）向前逐年读取，
+    估算的K线数量足够 count 条时即停止，不再读取更早的年份。
 
     Args:
         code: 股票代码
+        start_date: 开始日期
         end_date: 结束日期
-        count: 需要的K线数量
+        count: 需要的K线数量（仅在未指定开始日期时用于决定读取的年份）
         frequency: 目标频率
-        start_date: 开始日期
 
     Returns:
-        聚合后的DataFrame，包含指定数量的K线
+        按时间排序的分钟级DataFrame
     """
-    try:
-        # 确定需要读取的年份范围
-        current_year = datetime.datetime.now().year
-        start_year = None
-        end_year = None
-
-        # 解析开始日期
-        if start_date:
-            try:
-                if isinstance(start_date, str):
-                    start_year = datetime.datetime.strptime(start_date.split(' ')[0], '%Y-%m-%d').year
-                else:
-                    start_year = start_date.year
-            except:
-                pass
-
-        # 解析结束日期
-        if end_date:
-            try:
-                if isinstance(end_date, str):
-                    end_year = datetime.datetime.strptime(end_date.split(' ')[0], '%Y-%m-%d').year
-                else:
-                    end_year = end_date.year
-            except:
-                pass
-
-        # 确定最终的年份范围
-        if start_year is None and end_year is None:
-            # 没有指定任何日期，默认使用最近的年份
-            for year in [2025, 2024, 2023, 2022]:
-                test_path = get_data_file_path(code, year)
-                if os.path.exists(test_path):
-                    start_year = end_year = year
-                    break
-            # 如果还是没找到，使用默认值
-            if start_year is None:
-                start_year = end_year = current_year
-        elif start_year is None and end_year is not None:
-            # 只指定了结束日期，从结束年份往前推几年
-            start_year = max(2020, end_year - 2)  # 最多往前推2年，最早到2020年
-        elif end_year is None and start_year is not None:
-            # 只指定了开始日期，从开始年份到当前年份
-            end_year = current_year
-
-        # 确保年份范围有效且不为None
-        if start_year is None:
-            start_year = current_year
+    # 确定需要读取的年份范围
+    current_year = datetime.datetime.now().year
+    start_year = None
+    end_year = None
+
+    # 解析开始日期
+    if start_date:
+        try:
+            if isinstance(start_date, str):
+                start_year = datetime.datetime.strptime(start_date.split(' ')[0], '%Y-%m-%d').year
+            else:
+                start_year = start_date.year
+        except:
+            pass
+
+    # 解析结束日期
+    if end_date:
+        try:
+            if isinstance(end_date, str):
+                end_year = datetime.datetime.strptime(end_date.split(' ')[0], '%Y-%m-%d').year
+            else:
+                end_year = end_date.year
+        except:
+            pass
+
+    # 将截止日期设置为当天的23:59:59，确保包含当天的所有数据
+    end_timestamp = None
+    if end_date:
+        end_date_str = end_date.split(' ')[0] if isinstance(end_date, str) else str(end_date)
+        end_timestamp = pd.to_datetime(end_date_str + ' 23:59:59')
+
+    if start_year is None:
+        # 没有指定开始日期，从结束年份往前逐年读取，直到足够生成count条K线
+        if end_year is None:
+            available_years = list_data_years(code)
+            end_year = available_years[-1] if available_years else current_year
+        # 聚合层默认最多返回1000条，多读一条以免最早的K线不完整
+        bars_needed = min(count, 1000) + 1
+        all_data, years = read_years_backward(code, end_year, bars_needed, frequency, end_timestamp)
+        if not years:
+            years = [end_year]
+    else:
+        # 指定了开始日期，读取开始年份到结束年份（未指定时为当前年份）的所有数据
         if end_year is None:
             end_year = current_year
         if start_year > end_year:
             start_year, end_year = end_year, start_year
+        years = list(range(start_year, end_year + 1))
 
         # 读取跨年份的数据
         all_data = []
-        for year in range(start_year, end_year + 1):
+        catalog = get_catalog()
+        for year in years:
             file_path = get_data_file_path(code, year)
 
-            # 检查文件是否存在
-            if not os.path.exists(file_path):
-                print(f"警告: 数据文件不存在: {file_path}")
+            # 检查文件是否存在（查询数据目录索引）
+            if not catalog.has(code, year):
+                logger.warning("数据文件不存在: %s", file_path)
                 continue
 
-            # 读取CSV文件，处理编码问题
+            # 读取年份数据（优先使用二进制列缓存，避免重复解析CSV）
             try:
-                # 尝试不同的编码
-                for encoding in ['utf-8', 'gbk', 'gb2312']:
-                    try:
-                        df_year = pd.read_csv(file_path, encoding=encoding)
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                else:
-                    raise UnicodeDecodeError("无法解码文件")
-
-                # 检查列数，确保数据格式正确
-                if len(df_year.columns) >= 7:
-                    # 重命名列以匹配原有格式
-                    df_year.columns = ['date', 'code', 'open', 'high', 'low', 'close', 'volume', 'amount'][:len(df_year.columns)]
-
-                    # 转换数据类型
-                    df_year['date'] = pd.to_datetime(df_year['date'])
-                    df_year['open'] = pd.to_numeric(df_year['open'], errors='coerce')
-                    df_year['high'] = pd.to_numeric(df_year['high'], errors='coerce')
-                    df_year['low'] = pd.to_numeric(df_year['low'], errors='coerce')
-                    df_year['close'] = pd.to_numeric(df_year['close'], errors='coerce')
-                    df_year['volume'] = pd.to_numeric(df_year['volume'], errors='coerce')
-
-                    # 过滤掉无效数据
-                    df_year = df_year.dropna()
-
+                df_year = load_year_frame(code, year)
+                if df_year is not None:
                     all_data.append(df_year)
 
             except Exception as e:
-                print(f"读取文件 {file_path} 失败: {e}")
+                logger.warning("读取文件 %s 失败: %s", file_path, e)
                 continue
 
-        # 合并所有年份的数据
-        if not all_data:
-            # 列出尝试过的文件路径，帮助用户调试
-            attempted_paths = []
-            for year in range(start_year, end_year + 1):
-                attempted_paths.append(get_data_file_path(code, year))
-
-            error_msg = f"未找到股票 {code} 的数据文件。尝试过的路径:\n" + "\n".join(attempted_paths)
-            print(error_msg)
-            raise FileNotFoundError(error_msg)
-
-        df = pd.concat(all_data, ignore_index=True)
-
-        # 按日期排序
-        df = df.sort_values('date')
-
-        # 根据日期范围筛选
-        if start_date:
-            start_timestamp = pd.to_datetime(start_date.split(' ')[0] if isinstance(start_date, str) else start_date)
-            df = df[df['date'] >= start_timestamp]
-
-        if end_date:
-            # 将截止日期设置为当天的23:59:59，确保包含当天的所有数据
-            end_date_str = end_date.split(' ')[0] if isinstance(end_date, str) else str(end_date)
-            end_timestamp = pd.to_datetime(end_date_str + ' 23:59:59')
-            df = df[df['date'] <= end_timestamp]
-            print(f"应用截止日期筛选: <= {end_timestamp}, 筛选后数据量: {len(df)}")
-
-        # 根据频率聚合数据
-        df = aggregate_data_by_frequency(df, frequency)
-
-        # 设置日期为索引
-        df.set_index('date', inplace=True)
-        df.index.name = ''
-
-        # 只保留需要的列
-        df = df[['open', 'close', 'high', 'low', 'volume']]
-
-        # 如果指定了日期范围，返回该范围内的所有数据
-        # 如果没有指定日期范围，返回最后count条记录
-        if not start_date and not end_date:
-            # 没有指定日期范围，返回最后count条记录
-            if len(df) > count:
-                df = df.tail(count)
+    # 合并所有年份的数据
+    if not all_data:
+        # 列出尝试过的文件路径，帮助用户调试
+        attempted_paths = []
+        for year in years:
+            attempted_paths.append(get_data_file_path(code, year))
+
+        error_msg = f"未找到股票 {code} 的数据文件。尝试过的路径:\n" + "\n".join(attempted_paths)
+        logger.warning(error_msg)
+        raise FileNotFoundError(error_msg)
+
+    df = pd.concat(all_data, ignore_index=True)
+
+    # 按日期排序
+    df = df.sort_values('date')
+
+    # 根据日期范围筛选
+    if start_date:
+        start_timestamp = pd.to_datetime(start_date.split(' ')[0] if isinstance(start_date, str) else start_date)
+        df = df[df['date'] >= start_timestamp]
+
+    if end_timestamp is not None:
+        df = df[df['date'] <= end_timestamp]
+        logger.debug("应用截止日期筛选: <= %s, 筛选后数据量: %d", end_timestamp, len(df))
+
+    return df
+
+def _read_store_minutes(code, start_date='', end_date='', count=1000, frequency='1d'):
+    """
+    从内存映射存储读取分钟数据，读取范围规则与 _read_local_minutes 保持一致
+
+    Returns:
+        按时间排序的分钟级DataFrame；该股票没有数据时返回None
+    """
+    store = open_symbol_store(code)
+    if store is None or len(store) == 0:
+        return None
+
+    start_timestamp = None
+    end_timestamp = None
+    if start_date:
+        start_timestamp = pd.to_datetime(start_date.split(' ')[0] if isinstance(start_date, str) else start_date)
+    if end_date:
+        end_date_str = end_date.split(' ')[0] if isinstance(end_date, str) else str(end_date)
+        end_timestamp = pd.to_datetime(end_date_str + ' 23:59:59')
+
+    tail = None
+    if start_timestamp is None:
+        # 没有开始日期时，从结束年份往前按年扩展，直到估算的K线数量足够
+        bars_needed = min(count, 1000) + 1
+        last_timestamp = store.last_timestamp()
+        if end_timestamp is None or end_timestamp > last_timestamp:
+            year = last_timestamp.year
         else:
-            # 指定了日期范围，返回该范围内的所有数据（不受count限制）
-            print(f"返回日期范围内的所有数据: {len(df)} 条记录")
+            year = end_timestamp.year
+        first_year = store.first_timestamp().year
+        while True:
+            start_timestamp = pd.Timestamp(year=year, month=1, day=1)
+            lo, hi = store.locate(start_timestamp, end_timestamp)
+            if year <= first_year or estimate_bar_count(store.dates[lo:hi], frequency) >= bars_needed:
+                break
+            year -= 1
 
-        return df
+        # 1分钟线不需要聚合，直接按数量截取尾部
+        if frequency == '1m':
+            tail = bars_needed
+
+    return store.frame(start_timestamp, end_timestamp, tail)
+
+def get_price_local(code, end_date='', count=1000, frequency='1d', start_date=''):
+    """
+    从本地CSV文件读取股票数据 - 智能聚合到指定周期
+
+    Args:
+        code: 股票代码
+        end_date: 结束日期
+        count: 需要的K线数量
+        frequency: 目标频率
+        start_date: 开始日期
+
+    Returns:
+        聚合后的DataFrame，包含指定数量的K线
+    """
+    try:
+        return read_local_bars(code, end_date=end_date, count=count, frequency=frequency, start_date=start_date)
 
     except Exception as e:
-        print(f"读取本地数据失败: {e}")
+        logger.warning("读取本地数据失败: %s", e)
         # 如果本地数据读取失败，返回空DataFrame
         return pd.DataFrame(columns=['open', 'close', 'high', 'low', 'volume'])
 
+def read_local_bars(code, end_date='', count=1000, frequency='1d', start_date=''):
+    """
+    读取本地数据并聚合到指定周期，参数与返回值同 get_price_local，读取失败时抛出异常而不是返回空数据帧
+
+    未指定 start_date 时返回截止到 end_date 的最后 count 根K线（只指定 end_date 时同样受 count 限制），
+    指定 start_date 时返回区间内的全部K线
+    """
+    df = None
+    if ROLLUPS_ENABLED and frequency in ROLLUP_FREQUENCIES + DERIVED_FREQUENCIES:
+        # 直接读取预聚合的K线
+        try:
+            df = read_rollup_bars(code, frequency, start_date=start_date, end_date=end_date, count=count)
+            if df is not None:
+                logger.debug("读取预聚合K线: %d条%s数据", len(df), frequency)
+        except Exception as e:
+            logger.warning("读取预聚合K线失败: %s，改为读取分钟数据", e)
+            df = None
+
+    if df is None:
+        if SYMBOL_STORE_ENABLED:
+            try:
+                df = _read_store_minutes(code, start_date=start_date, end_date=end_date, count=count, frequency=frequency)
+            except Exception as e:
+                logger.warning("读取内存映射存储失败: %s，改为按年份读取", e)
+                df = None
+
+        if df is None:
+            df = _read_local_minutes(code, start_date=start_date, end_date=end_date, count=count, frequency=frequency)
+
+        # 根据频率聚合数据；未指定开始日期时只聚合生成最后 count 根K线所需的分钟数据
+        df = aggregate_data_by_frequency(df, frequency, target_count=1000 if start_date else min(count, 1000))
+
+    # 设置日期为索引
+    df.set_index('date', inplace=True)
+    df.index.name = ''
+
+    # 只保留需要的列
+    df = df[['open', 'close', 'high', 'low', 'volume']]
+
+    # 如果指定了开始日期，返回该范围内的所有数据
+    # 如果没有指定开始日期，返回（截止日期之前的）最后count条记录
+    if not start_date:
+        # 没有指定开始日期，返回最后count条记录
+        if len(df) > count:
+            df = df.tail(count)
+    else:
+        # 指定了开始日期，返回该范围内的所有数据（不受count限制）
+        logger.debug("返回日期范围内的所有数据: %d 条记录", len(df))
+
+    return df
+
 #腾讯日线
 def get_price_day_tx(code, end_date='', count=10, frequency='1d'):     #日线获取  
     unit='week' if frequency in '1w' else 'month' if frequency in '1M' else 'day'     #判断日线，周线，月线
@@ -420,10 +347,10 @@ def get_price(code, end_date='',count=10, frequency='1d', fields=[], start_date=
     try:
         df_local = get_price_local(code, end_date=end_date, count=count, frequency=frequency, start_date=start_date)
         if not df_local.empty:
-            print(f"成功从本地数据源获取 {code} 的数据，共 {len(df_local)} 条记录")
+            logger.debug("成功从本地数据源获取 %s 的数据，共 %d 条记录", code, len(df_local))
             return df_local
     except Exception as e:
-        print(f"本地数据源获取失败: {e}，尝试网络数据源...")
+        logger.warning("本地数据源获取失败: %s，尝试网络数据源...", e)
 
     # 如果本地数据获取失败，使用原有的网络数据源
     xcode= code.replace('.XSHG','').replace('.XSHE','')                      #证券代码编码兼容处理
@@ -438,6 +365,47 @@ def get_price(code, end_date='',count=10, frequency='1d', fields=[], start_date=
          try:    return get_price_sina(  xcode,end_date=end_date,count=count,frequency=frequency)   #主力
          except: return get_price_min_tx(xcode,end_date=end_date,count=count,frequency=frequency)   #备用
         
+def get_price_before(code, before, count=1000, frequency='1d'):
+    """
+    从本地数据获取K线时间早于 before（不含）的最后 count 根K线，用于按游标向前翻页
+
+    读取截止到 before 当天的数据后再按K线时间筛选。日内K线不跨越自然日，日线、周线、月线的时间
+    不早于其包含的最后一个交易日，所以返回的K线都由完整的数据聚合，与一次读取更长区间得到的K线相同，
+    用本页最早一根K线的时间作为下一页的 before 即可无重叠、无遗漏地向前翻页。
+
+    Args:
+        code: 股票代码
+        before: 游标时间，字符串或时间
+        count: 需要的K线数量
+        frequency: 目标频率
+
+    Returns:
+        DataFrame: 格式同 get_price_local，数量可能受单次读取上限限制而少于 count；没有更早的数据或读取失败时为空
+    """
+    try:
+        return read_local_bars_before(code, before, count=count, frequency=frequency)
+
+    except Exception as e:
+        logger.warning("读取本地数据失败: %s", e)
+        return pd.DataFrame(columns=['open', 'close', 'high', 'low', 'volume'])
+
+def read_local_bars_before(code, before, count=1000, frequency='1d'):
+    """
+    读取K线时间早于 before 的最后 count 根K线，参数与返回值同 get_price_before，读取失败时抛出异常而不是返回空数据帧
+    """
+    before = pd.Timestamp(before)
+    # before 当天可能有若干根时间不早于 before 的K线，多读这些数量
+    extra = len(get_calendar().bar_times(frequency)) + 1 if frequency in INTRADAY_FREQUENCIES else 1
+    while True:
+        df = read_local_bars(code, end_date=before.strftime('%Y-%m-%d'), count=count + extra, frequency=frequency)
+        if df.empty:
+            return df
+        older = df[df.index < before]
+        if len(older) >= count or len(df) < count + extra:
+            return older.tail(count)
+        # 当天的K线比预计的多（如包含集合竞价数据），扩大读取数量重试
+        extra *= 2
+
 if __name__ == '__main__':    
     df=get_price('sh000001',frequency='1d',count=10)      #支持'1d'日, '1w'周, '1M'月  
     print('上证指数日线行情\n',df)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分钟数据聚合规则
+
+把清洗后的分钟数据（date/open/high/low/close/volume）聚合为各周期K线：
+    5m/15m/30m  按自然时间向下取整，只生成有数据的K线
+    60m         按A股交易时段划分（10:30、11:30、14:00、15:00 四根，见 trading_calendar.py）
+    1d          按自然日分组
+    1w/1M       按自然周（周日为标签）/自然月（月末为标签）resample
+
+Ashare.get_price_local 的实时聚合、rollups.py 的预聚合和 bar_aggregator.py 的增量聚合
+都使用这里的规则，保证结果一致。
+函数不打印日志，也不截取K线数量。
+"""
+
+import numpy as np
+import pandas as pd
+
+from trading_calendar import HOURLY_SESSION_BUCKETS
+
+# 各列的聚合方式
+OHLCV_AGG = {
+    'open': 'first',
+    'high': 'max',
+    'low': 'min',
+    'close': 'last',
+    'volume': 'sum'
+}
+
+BAR_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume']
+
+_BUCKET_STARTS = np.array([pd.Timedelta(start).value for start, end, label in HOURLY_SESSION_BUCKETS], dtype=np.int64)
+_BUCKET_ENDS = np.array([pd.Timedelta(end).value for start, end, label in HOURLY_SESSION_BUCKETS], dtype=np.int64)
+_BUCKET_LABELS = np.array([pd.Timedelta(label).value for start, end, label in HOURLY_SESSION_BUCKETS], dtype=np.int64)
+
+DAY_NS = 24 * 60 * 60 * 10 ** 9
+MINUTE_NS = 60 * 10 ** 9
+
+# 不属于任何K线的标签（datetime64 的 NaT）
+NAT = np.iinfo(np.int64).min
+
+# 可以直接由分钟数据聚合的周期
+MINUTE_FREQUENCIES = ('1m', '5m', '15m', '30m', '60m')
+
+
+def bar_labels(timestamps, frequency):
+    """
+    计算每条分钟数据所属K线的时间标签，与 aggregate_bars 的规则一致
+
+    Args:
+        timestamps: int64 纳秒时间戳数组
+        frequency: 目标频率
+
+    Returns:
+        ndarray: int64 纳秒时间标签；60m 交易时段之外的数据为 NAT
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    days = timestamps // DAY_NS
+
+    if frequency == '1m':
+        return timestamps.copy()
+
+    if frequency in MINUTE_FREQUENCIES and frequency != '60m':
+        width = int(frequency[:-1]) * MINUTE_NS
+        return timestamps - timestamps % width
+
+    if frequency == '60m':
+        time_of_day = timestamps - days * DAY_NS
+        buckets = np.searchsorted(_BUCKET_STARTS, time_of_day, side='right') - 1
+        in_session = buckets >= 0
+        in_session[in_session] = time_of_day[in_session] < _BUCKET_ENDS[buckets[in_session]]
+        return np.where(in_session, days * DAY_NS + _BUCKET_LABELS[np.maximum(buckets, 0)], NAT)
+
+    if frequency == '1d':
+        return days * DAY_NS
+
+    if frequency == '1w':
+        # 以周日为标签（1970-01-01 为周四）
+        weekday = (days + 3) % 7
+        return (days + 6 - weekday) * DAY_NS
+
+    if frequency == '1M':
+        # 以月末为标签
+        months = timestamps.view('datetime64[ns]').astype('datetime64[M]')
+        return ((months + 1).astype('datetime64[D]') - 1).astype('datetime64[ns]').view(np.int64)
+
+    raise ValueError(f"不支持的频率: {frequency}")
+
+
+def _aggregate_by_labels(df, frequency):
+    """
+    按 bar_labels 给每条分钟数据标记所属K线，再用 reduceat 按连续分组聚合
+
+    只为有数据的K线生成结果，午休、收盘后、周末和节假日不会产生空时间段；
+    标签为 NAT（交易时段之外）的数据被丢弃。
+
+    Args:
+        df: 按时间排序的分钟数据
+        frequency: 日内周期
+
+    Returns:
+        DataFrame: K线；没有可聚合的数据时返回空数据帧
+    """
+    labels = bar_labels(df['date'].values.astype('datetime64[ns]').view(np.int64), frequency)
+    in_session = labels != NAT
+    if not in_session.any():
+        return pd.DataFrame(columns=BAR_COLUMNS)
+
+    # 数据已排序，同一K线的数据连续，按分组起点做 reduceat
+    labels = labels[in_session]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(labels)) + 1))
+    ends = np.append(starts[1:], len(labels)) - 1
+
+    return pd.DataFrame({
+        'date': labels[starts].view('datetime64[ns]'),
+        'open': df['open'].values[in_session][starts],
+        'high': np.fmax.reduceat(df['high'].values[in_session], starts),
+        'low': np.fmin.reduceat(df['low'].values[in_session], starts),
+        'close': df['close'].values[in_session][ends],
+        'volume': np.add.reduceat(df['volume'].values[in_session], starts),
+    })
+
+
+def aggregate_hourly(df):
+    """
+    按交易时段聚合小时线，交易时段之外的数据被丢弃
+
+    Args:
+        df: 按时间排序的分钟数据
+
+    Returns:
+        DataFrame: 小时线；没有交易时段内的数据时返回空数据帧
+    """
+    return _aggregate_by_labels(df, '60m')
+
+
+def _resample(df, rule):
+    """按 pandas 时间规则聚合，空时间段保留为NaN行"""
+    return df.set_index('date').resample(rule).agg(OHLCV_AGG).reset_index()
+
+
+def trailing_window(df, frequency, count):
+    """
+    截取生成最后 count 根K线所需的最少原始数据
+
+    按 bar_labels 给每行标记所属K线，从末尾数 count 个不同的标签，在该K线的第一行处截断，
+    因此边界上的K线仍由完整的数据聚合。周线、月线的空时间段不计数，截取的数据只会多不会少。
+
+    Args:
+        df: 按时间排序的数据
+        frequency: 目标频率
+        count: 需要的K线数量
+
+    Returns:
+        DataFrame: df 的尾部切片；数据不足或频率未知时原样返回
+    """
+    if count is None or len(df) <= count:
+        return df
+    if frequency == '1m':
+        return df.iloc[-count:]
+    if frequency not in MINUTE_FREQUENCIES + ('1d', '1w', '1M'):
+        return df
+
+    timestamps = df['date'].values.astype('datetime64[ns]').view(np.int64)
+
+    # 按时间跨度估算K线数量上限，不可能超过 count 时无需标记
+    span_days = int(timestamps[-1] - timestamps[0]) // DAY_NS + 1
+    max_bars = {'1d': span_days, '1w': span_days // 7 + 2, '1M': span_days // 28 + 2}
+    if max_bars.get(frequency, len(df)) <= count:
+        return df
+
+    # 从末尾开始标记，窗口不够时扩大4倍，只在必要时标记全部数据
+    size = count * 4
+    while True:
+        offset = max(0, len(timestamps) - size)
+        labels = bar_labels(timestamps[offset:], frequency)
+        starts = np.concatenate(([0], np.flatnonzero(labels[1:] != labels[:-1]) + 1))
+        starts = starts[labels[starts] != NAT]
+        # 窗口内第一根K线可能不完整，需要多出一根才能确定截断位置
+        if len(starts) > count or offset == 0:
+            break
+        size *= 4
+
+    if len(starts) <= count:
+        return df
+    return df.iloc[offset + starts[-count]:]
+
+
+def aggregate_bars(df, frequency, count=None):
+    """
+    把分钟数据（1w/1M 也可以是日线数据）聚合到指定周期
+
+    Args:
+        df: 数据，不要求已排序
+        frequency: 目标频率 ('1d', '1w', '1M', '1m', '5m', '15m', '30m', '60m')，未知频率原样返回
+        count: 只需要最后 count 根K线时，先截取所需的原始数据再聚合（见 trailing_window），
+            返回的K线可能多于 count 根，但最后 count 根与聚合全部数据的结果相同
+
+    Returns:
+        DataFrame: 按时间排序的K线
+    """
+    if df.empty:
+        return df
+
+    # 确保数据按时间排序
+    df = df.sort_values('date')
+    df = trailing_window(df, frequency, count)
+
+    if frequency == '1d':  # 日线
+        # 按日期分组聚合
+        grouped = df.groupby(df['date'].dt.date.rename('date_only')).agg(OHLCV_AGG).reset_index()
+        grouped['date'] = pd.to_datetime(grouped['date_only'])
+        return grouped[BAR_COLUMNS]
+
+    if frequency == '1w':  # 周线
+        return _resample(df, 'W')
+
+    if frequency == '1M':  # 月线
+        return _resample(df, 'M')
+
+    if frequency == '1m':
+        # 1分钟线直接返回
+        return df
+
+    if frequency == '60m':
+        # 小时线需要特殊处理，按照股市交易时间聚合
+        return aggregate_hourly(df)
+
+    if frequency in MINUTE_FREQUENCIES:
+        # 其他分钟线按自然时间聚合，只生成有数据的K线
+        return _aggregate_by_labels(df, frequency)
+
+    # 未知频率，直接返回原数据
+    return df
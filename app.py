@@ -1,9 +1,11 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 import pandas as pd
 import numpy as np
 import sys
 import os
+import json
 import logging
+import time
 import traceback
 from datetime import datetime
 
@@ -12,32 +14,109 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # 导入Ashare模块
 import Ashare
+from catalog import get_catalog
+from config import KLINE_BATCH_MAX_SPECS, LOCAL_DATA_PATH, REPLAY_MAX_SPEED, REPLAY_MIN_INTERVAL, REPLAY_RETRY_MS, get_stock_filename
+from bar_aggregator import get_latest_bars, latest_bars_cache
+from trading_calendar import INTRADAY_FREQUENCIES, get_calendar
+from kline_json import LAYOUTS, kline_to_json
+from kline_batch import batch_to_json, fetch_batch
+from kline_binary import MIME_TYPE as KLINE_MIME_TYPE, pack_kline
+from http_cache import compress_response, is_not_modified, kline_validators, set_cache_headers
+from response_cache import cache_stats, canonical_query, lookup_response, store_response
+from local_store import frame_cache
+from replay import replay_batches
+from indicators import compute_indicators, indicators_to_json, parse_indicator_specs
 
-# 配置日志
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('backend_debug.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+from request_log import install_request_logging, note, setup_logging, stage
+
+# 配置日志：经队列由后台线程写入轮转日志文件和控制台，每个请求输出一条结构化记录
+setup_logging()
 
 app = Flask(__name__)
+install_request_logging(app)
+
+# 前端周期参数到 Ashare 频率的映射
+PERIOD_MAP = {
+    'D': '1d',     # 日线
+    'W': '1w',     # 周线
+    'M': '1M',     # 月线
+    '1': '1m',     # 1分钟
+    '5': '5m',     # 5分钟
+    '15': '15m',   # 15分钟
+    '30': '30m',   # 30分钟
+    '60': '60m'    # 60分钟
+}
 
-def log_function_call(func_name, **kwargs):
-    """记录函数调用"""
-    logging.info(f"🔵 调用函数: {func_name}")
-    for key, value in kwargs.items():
-        logging.info(f"   参数 {key}: {value}")
+# K线接口支持的返回格式
+KLINE_FORMATS = LAYOUTS + ('binary',)
 
 def log_error(func_name, error, **kwargs):
-    """记录错误"""
-    logging.error(f"❌ 函数 {func_name} 出错: {str(error)}")
-    logging.error(f"   错误类型: {type(error).__name__}")
-    for key, value in kwargs.items():
-        logging.error(f"   参数 {key}: {value}")
-    logging.error(f"   堆栈跟踪: {traceback.format_exc()}")
+    """记录错误：请求记录中标记错误，堆栈跟踪单独输出一条记录"""
+    note(error=f"{type(error).__name__}: {error}")
+    params = ', '.join(f"{key}={value}" for key, value in kwargs.items())
+    logging.error(f"❌ 函数 {func_name} 出错: {error} ({params})\n{traceback.format_exc()}")
+
+def negotiate_kline_format():
+    """确定K线接口的返回格式：优先使用 format 参数；Accept 头中二进制格式优先于JSON时返回二进制；默认 rows"""
+    layout = request.args.get('format')
+    if layout:
+        return layout
+    accept = request.accept_mimetypes
+    if accept[KLINE_MIME_TYPE] > accept['application/json']:
+        return 'binary'
+    return 'rows'
+
+def kline_response(df, layout):
+    """按返回格式序列化K线数据"""
+    if layout == 'binary':
+        response = Response(pack_kline(df), mimetype=KLINE_MIME_TYPE)
+    else:
+        response = Response(kline_to_json(df, layout), mimetype='application/json')
+    response.vary.add('Accept')
+    return response
+
+def read_kline_frame(code, frequency, count, start_date=None, end_date=None, before=None, local=True):
+    """
+    按 /api/kline 的参数读取K线数据
+
+    before 不为空时只读取游标之前的一页；local 为 False 或本地没有数据时由 Ashare.get_price 从网络获取。
+
+    Returns:
+        tuple: (df, 是否读取的本地数据)，从网络获取的结果不应缓存
+    """
+    if before:
+        return Ashare.get_price_before(code, before, count=count, frequency=frequency), True
+    if local:
+        df = Ashare.get_price_local(code, frequency=frequency, count=count, end_date=end_date, start_date=start_date)
+        if df is not None and not df.empty:
+            return df, True
+    return Ashare.get_price(code, frequency=frequency, count=count, end_date=end_date, start_date=start_date), False
+
+def cached_kline_response(entry):
+    """由缓存的响应体构造响应"""
+    body, mimetype, headers = entry
+    response = Response(body, mimetype=mimetype, headers=headers)
+    response.vary.add('Accept')
+    note(cache='hit')
+    return response
+
+def store_kline_response(query, layout, signature, response):
+    """缓存序列化后的K线响应"""
+    headers = {key: response.headers[key] for key in ('X-Next-Before',) if key in response.headers}
+    store_response(query, layout, signature, response.get_data(), response.mimetype, headers)
+    return response
+
+def not_modified_response(validators):
+    """客户端缓存仍然有效时返回的304响应"""
+    response = Response(status=304)
+    response.vary.add('Accept')
+    note(cache='not_modified')
+    return set_cache_headers(response, validators)
+
+@app.after_request
+def compress(response):
+    """按 Accept-Encoding 压缩响应"""
+    return compress_response(response, request.accept_encodings)
 
 @app.route('/')
 def index():
@@ -55,68 +134,55 @@ def get_kline():
         end_date = request.args.get('end_date')  # 获取截止日期参数
         start_date = request.args.get('start_date')  # 获取开始日期参数
         page = int(request.args.get('page', 1))  # 获取页码，默认为第1页
+        before = request.args.get('before')  # 翻页游标：只返回K线时间早于该时间的K线
+        layout = negotiate_kline_format()  # 返回格式：rows（默认）、columnar 或 binary
+
+        note(format=layout)
 
-        # 记录API调用
-        log_function_call('get_kline',
-                         code=code, period=period, limit=limit,
-                         end_date=end_date, start_date=start_date, page=page)
+        if layout not in KLINE_FORMATS:
+            note(error=f'不支持的格式: {layout}')
+            return jsonify({'error': f'不支持的格式: {layout}'})
         
         # 转换周期格式
-        period_map = {
-            'D': '1d',     # 日线
-            'W': '1w',     # 周线
-            'M': '1M',     # 月线
-            '1': '1m',     # 1分钟
-            '5': '5m',     # 5分钟
-            '15': '15m',   # 15分钟
-            '30': '30m',   # 30分钟
-            '60': '60m'    # 60分钟
-        }
-        
-        frequency = period_map.get(period, '1d')
-        
-        # 计算实际需要获取的数据量
-        actual_limit = limit * page
+        frequency = PERIOD_MAP.get(period, '1d')
 
-        # 使用Ashare获取股票数据
-        logging.info(f"🔍 开始获取股票数据: {code}, 周期: {frequency}, 数量: {actual_limit}")
-        df = Ashare.get_price(code, frequency=frequency, count=actual_limit, end_date=end_date, start_date=start_date)
+        # 不同写法的代码和日期规范化为同一查询，用于计算 ETag 和查找响应缓存
+        actual_limit = limit * page  # 计算实际需要获取的数据量
+        query = canonical_query(code, frequency, limit if before else actual_limit,
+                                start_date=start_date, end_date=end_date, before=before)
 
-        if df is None:
-            logging.error("❌ Ashare.get_price 返回 None")
-            return jsonify({'error': 'Failed to get data from Ashare'})
+        # 由数据文件签名和查询计算 ETag，客户端缓存仍然有效时不读取数据
+        validators = kline_validators(code, before or end_date, (query, layout)) if query else None
+        if validators and is_not_modified(request, validators):
+            return not_modified_response(validators)
 
-        logging.info(f"✅ 获取到数据，形状: {df.shape}")
-        logging.info(f"📊 数据列: {list(df.columns)}")
-        logging.info(f"📅 索引类型: {type(df.index)}")
+        cached, signature = lookup_response(query, layout)
+        if cached is not None:
+            response = cached_kline_response(cached)
+            return set_cache_headers(response, validators) if validators else response
 
-        # 转换日期格式
-        try:
-            df['date'] = df.index.strftime('%Y-%m-%d %H:%M:%S')
-            logging.info("✅ 日期格式转换成功")
-        except Exception as date_error:
-            logging.error(f"❌ 日期格式转换失败: {date_error}")
-            # 尝试其他方式转换日期
-            df['date'] = df.index.astype(str)
+        with stage('read'):
+            df, local = read_kline_frame(code, frequency, limit if before else actual_limit,
+                                         start_date, end_date, before, local=signature is not None)
+        if not local:
+            # 从网络获取的结果不缓存
+            signature = validators = None
+
+        if df is None:
+            note(error='Ashare.get_price 返回 None')
+            return jsonify({'error': 'Failed to get data from Ashare'})
 
         # 确保数据按时间升序排列
         df = df.sort_index()
-        logging.info(f"✅ 数据排序完成，最终数据量: {len(df)}")
-        
-        # 转换为JSON格式
-        result = []
-        for _, row in df.iterrows():
-            result.append({
-                'date': row['date'],
-                'open': float(row['open']),
-                'close': float(row['close']),
-                'low': float(row['low']),
-                'high': float(row['high']),
-                'volume': float(row['volume'])
-            })
-        
-        logging.info(f"✅ API调用成功，返回 {len(result)} 条数据")
-        return jsonify(result)
+
+        with stage('serialize'):
+            response = kline_response(df, layout)
+        if before and not df.empty:
+            # 游标翻页：下一页的游标为本页最早一根K线的时间
+            response.headers['X-Next-Before'] = df.index[0].strftime('%Y-%m-%d %H:%M:%S')
+        store_kline_response(query, layout, signature, response)
+        note(rows=len(df), cache='miss' if signature else 'none')
+        return set_cache_headers(response, validators) if validators else response
 
     except Exception as e:
         log_error('get_kline', e,
@@ -124,5 +190,255 @@ def get_kline():
                  end_date=end_date, start_date=start_date, page=page)
         return jsonify({'error': str(e)})
 
+@app.route('/api/kline/latest')
+def get_latest_kline():
+    """获取最近N根K线的API，由增量聚合器维护，不重新聚合历史数据"""
+    try:
+        code = request.args.get('code', 'sh000001')
+        period = request.args.get('period', 'D')
+        limit = int(request.args.get('limit', 100))
+        layout = negotiate_kline_format()
+
+        note(format=layout)
+
+        if layout not in KLINE_FORMATS:
+            note(error=f'不支持的格式: {layout}')
+            return jsonify({'error': f'不支持的格式: {layout}'})
+
+        frequency = PERIOD_MAP.get(period, '1d')
+
+        market, stock_code, filename = get_stock_filename(code)
+        validators = kline_validators(code, None, ('latest', market, stock_code, frequency, limit, layout))
+        if validators and is_not_modified(request, validators):
+            return not_modified_response(validators)
+
+        with stage('read'):
+            df = get_latest_bars(code, frequency, limit)
+
+        note(rows=len(df))
+        response = kline_response(df, layout)
+        return set_cache_headers(response, validators) if validators else response
+
+    except Exception as e:
+        log_error('get_latest_kline', e, code=request.args.get('code'), period=request.args.get('period'))
+        return jsonify({'error': str(e)})
+
+@app.route('/api/kline/batch', methods=['POST'])
+def get_kline_batch():
+    """
+    批量获取K线的API，用于自选股列表、多窗口布局等一次需要多组K线的页面
+
+    请求体为 {"requests": [{"code": "sh600000", "period": "D", "limit": 100}, ...], "format": "columnar"}，
+    每项的参数与 /api/kline 相同（code/period/limit/start_date/end_date/before），format 为 rows（默认）或 columnar。
+    返回 {"results": [{"data": K线, "next_before": 游标}, {"error": 错误信息}, ...]}，与请求一一对应。
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        items = payload.get('requests')
+        layout = payload.get('format', 'rows')
+
+        if layout not in LAYOUTS:
+            note(error=f'不支持的格式: {layout}')
+            return jsonify({'error': f'不支持的格式: {layout}'})
+        if not isinstance(items, list) or not 0 < len(items) <= KLINE_BATCH_MAX_SPECS:
+            note(error='requests 应为非空数组')
+            return jsonify({'error': f'requests 应为包含 1~{KLINE_BATCH_MAX_SPECS} 项查询的数组'})
+
+        try:
+            specs = [{
+                'code': str(item['code']),
+                'frequency': PERIOD_MAP.get(str(item.get('period', 'D')), '1d'),
+                'count': int(item.get('limit', 1000)),
+                'start_date': item.get('start_date'),
+                'end_date': item.get('end_date'),
+                'before': item.get('before'),
+            } for item in items]
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            note(error=f'查询参数错误: {e!r}')
+            return jsonify({'error': f'查询参数错误，每项需包含 code，limit 应为整数: {e!r}'})
+
+        with stage('read'):
+            results = fetch_batch(specs, layout)
+        with stage('serialize'):
+            body = batch_to_json(results)
+
+        note(specs=len(specs), cache_hits=sum(result.get('cache') == 'hit' for result in results),
+             failed=sum('error' in result for result in results))
+        return Response(body, mimetype='application/json')
+
+    except Exception as e:
+        log_error('get_kline_batch', e)
+        return jsonify({'error': f"{type(e).__name__}: {e}"})
+
+@app.route('/api/indicators')
+def get_indicators():
+    """计算技术指标的API：K线范围参数与 /api/kline 相同，由 MyTT 对同一段K线计算，结果按K线时间列式返回"""
+    try:
+        code = request.args.get('code', 'sh000001')
+        period = request.args.get('period', 'D')
+        limit = int(request.args.get('limit', 1000))
+        end_date = request.args.get('end_date')
+        start_date = request.args.get('start_date')
+        page = int(request.args.get('page', 1))
+        before = request.args.get('before')
+        names = request.args.get('names', 'MA:5,MA:10,MA:20')
+
+        try:
+            specs = parse_indicator_specs(names)
+        except ValueError as e:
+            note(error=str(e))
+            return jsonify({'error': str(e)})
+
+        frequency = PERIOD_MAP.get(period, '1d')
+        actual_limit = limit * page
+        query = canonical_query(code, frequency, limit if before else actual_limit,
+                                start_date=start_date, end_date=end_date, before=before)
+
+        # 与K线共用数据文件签名，按 (规范化查询, 指标及参数) 计算 ETag 和缓存结果
+        key = ('indicators', specs)
+        validators = kline_validators(code, before or end_date, (query, key)) if query else None
+        if validators and is_not_modified(request, validators):
+            return not_modified_response(validators)
+
+        cached, signature = lookup_response(query, key)
+        if cached is not None:
+            response = cached_kline_response(cached)
+            return set_cache_headers(response, validators) if validators else response
+
+        with stage('read'):
+            df, local = read_kline_frame(code, frequency, limit if before else actual_limit,
+                                         start_date, end_date, before, local=signature is not None)
+        if not local:
+            signature = validators = None
+
+        if df is None:
+            note(error='Ashare.get_price 返回 None')
+            return jsonify({'error': 'Failed to get data from Ashare'})
+
+        df = df.sort_index()
+        with stage('compute'):
+            results = compute_indicators(df, specs)
+        with stage('serialize'):
+            response = Response(indicators_to_json(df, results), mimetype='application/json')
+        store_kline_response(query, key, signature, response)
+        note(rows=len(df), indicators=len(specs), cache='miss' if signature else 'none')
+        return set_cache_headers(response, validators) if validators else response
+
+    except Exception as e:
+        log_error('get_indicators', e, code=request.args.get('code'), period=request.args.get('period'),
+                  names=request.args.get('names'))
+        return jsonify({'error': str(e)})
+
+@app.route('/api/replay')
+def replay_minutes():
+    """
+    分钟数据回放（Server-Sent Events）
+
+    按 speed（每秒分钟数）推送 start 当天开始的分钟数据，聚合为 period 周期的K线。
+    每条消息的 id 是本批最后一分钟，data 为 {"minute": ..., "bars": [...]}，bars 为本批新建或更新过的K线；
+    回放结束时发送 end 事件。暂停即关闭连接，继续、改变速度或跳转时以 after=最后收到的 id
+    （或新的 start）重新打开；浏览器自动重连时凭 Last-Event-ID 从断开处继续。
+    """
+    try:
+        code = request.args.get('code', 'sh000001')
+        period = request.args.get('period', '1')
+        frequency = PERIOD_MAP.get(period)
+        speed = float(request.args.get('speed', 1))
+        after = request.headers.get('Last-Event-ID') or request.args.get('after')
+        start = request.args.get('start')
+        end = request.args.get('end')
+
+        if frequency is None:
+            note(error=f'不支持的周期: {period}')
+            return jsonify({'error': f'不支持的周期: {period}'}), 400
+        if not 0 < speed <= REPLAY_MAX_SPEED:
+            note(error=f'回放速度应在 0 到 {REPLAY_MAX_SPEED} 之间: {speed}')
+            return jsonify({'error': f'回放速度应在 0 到 {REPLAY_MAX_SPEED} 之间: {speed}'}), 400
+
+        # 从 start 当天的第一分钟开始
+        if after:
+            after = pd.Timestamp(after)
+        elif start:
+            after = pd.Timestamp(start) - pd.Timedelta(1, 'ns')
+        if end and len(end) == 10:
+            end = f'{end} 23:59:59'
+
+        # 速度较快时合并多分钟为一次推送，推送间隔不低于 REPLAY_MIN_INTERVAL
+        interval = max(1 / speed, REPLAY_MIN_INTERVAL)
+        batch_minutes = max(1, round(speed * interval))
+        note(frequency=frequency, after=after, batch=batch_minutes)
+
+    except Exception as e:
+        log_error('replay_minutes', e, code=request.args.get('code'), after=request.args.get('after'))
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        yield f"retry: {REPLAY_RETRY_MS}\n\n"
+        try:
+            next_at = time.monotonic()
+            for minute, bars in replay_batches(code, frequency, after, end, batch_minutes):
+                yield f"id: {minute}\ndata: {json.dumps({'minute': minute, 'bars': bars})}\n\n"
+                next_at += interval
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield "event: end\ndata: {}\n\n"
+        except Exception as e:
+            log_error('replay_minutes', e, code=code, after=after)
+            yield f"event: end\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    """获取各级缓存的统计信息，用于调整缓存大小"""
+    return jsonify({
+        'response_cache': cache_stats(),
+        'frame_cache': frame_cache.stats(),
+        'latest_bars_cache': latest_bars_cache.stats(),
+        'catalog': get_catalog().stats()
+    })
+
+@app.route('/api/calendar')
+def get_trading_calendar():
+    """获取交易日历：区间内的交易日、半日市收盘时间，以及各日内周期的K线时间"""
+    try:
+        current_year = datetime.now().year
+        start = request.args.get('start', f'{current_year - 10}-01-01')
+        end = request.args.get('end', f'{current_year + 1}-12-31')
+
+        calendar = get_calendar()
+        trading_days = calendar.trading_days(start, end)
+
+        def format_bar_times(day=None):
+            return {
+                period: [str(pd.Timedelta(int(value)))[-8:] for value in calendar.bar_times(frequency, day)]
+                for period, frequency in PERIOD_MAP.items() if frequency in INTRADAY_FREQUENCIES
+            }
+
+        # 半日市当天的K线时间与平时不同，单独给出
+        early_closes = {
+            str(day): {'close': str(pd.Timedelta(int(close)))[-8:-3], 'bar_times': format_bar_times(day)}
+            for day, close in calendar.early_closes.items()
+            if trading_days.size and trading_days[0] <= pd.Timestamp(day) <= trading_days[-1]
+        }
+        bar_times = format_bar_times()
+
+        note(rows=len(trading_days))
+        return jsonify({
+            'trading_days': trading_days.strftime('%Y-%m-%d').tolist(),
+            'early_closes': early_closes,
+            'bar_times': bar_times
+        })
+
+    except Exception as e:
+        log_error('get_trading_calendar', e, start=request.args.get('start'), end=request.args.get('end'))
+        return jsonify({'error': str(e)})
+
 if __name__ == '__main__':
+    # 启动时构建数据目录索引，之后的请求直接查询索引
+    catalog_stats = get_catalog().stats()
+    logging.info(f"📁 数据目录: {LOCAL_DATA_PATH}")
+    logging.info(f"📁 数据目录索引: {catalog_stats['symbols']} 只股票, {catalog_stats['files']} 个文件")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
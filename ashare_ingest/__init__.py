@@ -0,0 +1,5 @@
+"""
+Ashare 本地数据批量导入工具
+"""
+
+__version__ = "1.0.0"
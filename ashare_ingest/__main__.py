@@ -0,0 +1,41 @@
+"""
+Ashare 本地数据批量导入入口点
+
+用法: python -m ashare_ingest [--workers N] [--codes sh600000,sz000001] [--years 2024,2025]
+                              [--normalize-encoding] [--force] [--symbol-store]
+"""
+
+import argparse
+from .ingest import run_ingest
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+
+def main():
+    """批量转换本地数据目录"""
+    parser = argparse.ArgumentParser(description="Ashare 本地数据批量导入")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数，默认使用全部CPU核心")
+    parser.add_argument("--codes", default=None, help="只处理这些股票代码，逗号分隔")
+    parser.add_argument("--years", default=None, help="只处理这些年份，逗号分隔")
+    parser.add_argument("--normalize-encoding", action="store_true", default=None, help="把非UTF-8的CSV原地转换为UTF-8")
+    parser.add_argument("--force", action="store_true", help="忽略已有缓存，全部重新转换")
+    parser.add_argument("--symbol-store", action="store_true", help="同时构建按股票的内存映射存储")
+
+    args = parser.parse_args()
+    years = [int(year) for year in _split(args.years)] if args.years else None
+
+    summary = run_ingest(
+        workers=args.workers,
+        codes=_split(args.codes),
+        years=years,
+        normalize=args.normalize_encoding,
+        force=args.force,
+        symbol_store=args.symbol_store,
+    )
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
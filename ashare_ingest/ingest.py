@@ -0,0 +1,182 @@
+"""
+本地数据批量导入
+
+遍历 {LOCAL_DATA_PATH}/{year}/{MARKET}.{code}.csv，清洗并转换为二进制列缓存，
+生成多周期预聚合K线，更新数据目录索引，可选地构建按股票的内存映射存储。
+转换在进程池中并行执行；缓存已是最新的文件会被跳过，因此可以中断后重新运行，也可以增量运行。
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 导入配置
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import INGEST_WORKERS, NORMALIZE_CSV_ENCODING, ROLLUPS_ENABLED, get_data_file_path, get_stock_filename
+from catalog import get_catalog
+from local_store import (binary_cache_signature, convert_year_file, get_source_signature, normalize_csv_encoding,
+                         read_binary_cache)
+from rollups import build_rollups, rollup_signature, write_rollups
+from symbol_store import build_symbol_store
+
+
+def ingest_file(code, year, signature, encoding=None, normalize=False, force=False):
+    """
+    转换单个年份文件，在子进程中执行
+
+    Args:
+        code: 股票代码
+        year: 年份
+        signature: 源文件的 (mtime_ns, size)
+        encoding: 索引中识别出的文件编码
+        normalize: 是否把非UTF-8文件原地转换为UTF-8
+        force: 缓存已是最新时是否仍重新转换
+
+    Returns:
+        dict: 转换结果，status 为 converted / skipped / invalid / failed，rollups 表示是否生成了预聚合K线
+    """
+    result = {'code': code, 'year': year, 'status': 'skipped', 'rows': 0, 'dropped': 0,
+              'normalized': False, 'rollups': False, 'error': None}
+    try:
+        if normalize and encoding and encoding != 'utf-8':
+            file_path = get_data_file_path(code, year)
+            result['normalized'] = normalize_csv_encoding(file_path, encoding)
+            signature = get_source_signature(file_path)
+            encoding = 'utf-8'
+        signature = tuple(signature)
+
+        if force or binary_cache_signature(code, year) != signature:
+            converted = convert_year_file(code, year, signature, encoding)
+            if converted is None:
+                result['status'] = 'invalid'
+                return result
+            result.update(converted)
+            result['status'] = 'converted'
+
+        if ROLLUPS_ENABLED and (force or rollup_signature(code, year) != signature):
+            df_year = read_binary_cache(code, year, signature)
+            if df_year is None or not write_rollups(code, year, signature, build_rollups(df_year)):
+                raise OSError("生成预聚合K线失败")
+            result['rollups'] = True
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = str(e)
+    return result
+
+
+def build_store(code):
+    """构建单只股票的内存映射存储，在子进程中执行"""
+    try:
+        build_symbol_store(code)
+        return {'code': code, 'status': 'built', 'error': None}
+    except Exception as e:
+        return {'code': code, 'status': 'failed', 'error': str(e)}
+
+
+class ProgressReporter:
+    """按固定时间间隔打印进度"""
+
+    def __init__(self, label, total, interval=2.0):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.started_at = time.time()
+        self.reported_at = 0.0
+
+    def update(self):
+        self.done += 1
+        now = time.time()
+        if self.done < self.total and now - self.reported_at < self.interval:
+            return
+        self.reported_at = now
+
+        elapsed = max(now - self.started_at, 1e-6)
+        rate = self.done / elapsed
+        remaining = (self.total - self.done) / rate if rate else 0
+        percent = self.done * 100.0 / self.total if self.total else 100.0
+        print(f"[{self.label}] {self.done}/{self.total} ({percent:.1f}%) "
+              f"{rate:.1f} 个/秒, 已用 {elapsed:.0f} 秒, 预计剩余 {remaining:.0f} 秒")
+
+
+def _run_in_pool(label, function, tasks, workers):
+    """在进程池中执行任务，逐个返回结果并打印进度"""
+    progress = ProgressReporter(label, len(tasks))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(function, *task) for task in tasks]
+        for future in as_completed(futures):
+            progress.update()
+            yield future.result()
+
+
+def run_ingest(workers=None, codes=None, years=None, normalize=None, force=False, symbol_store=False):
+    """
+    批量导入本地数据
+
+    Args:
+        workers: 进程数，默认取 INGEST_WORKERS，为0时使用全部CPU核心
+        codes: 只处理这些股票代码，默认全部
+        years: 只处理这些年份，默认全部
+        normalize: 是否把非UTF-8文件转换为UTF-8，默认取 NORMALIZE_CSV_ENCODING
+        force: 是否忽略已有缓存重新转换
+        symbol_store: 是否同时构建按股票的内存映射存储
+
+    Returns:
+        dict: 各状态的文件数量及失败明细
+    """
+    workers = workers or INGEST_WORKERS or os.cpu_count()
+    normalize = NORMALIZE_CSV_ENCODING if normalize is None else normalize
+
+    catalog = get_catalog()
+    catalog.refresh()
+    print(f"数据目录: {catalog.data_path}, 共 {catalog.stats()['symbols']} 只股票, {catalog.stats()['files']} 个文件")
+
+    wanted_symbols = None
+    if codes:
+        wanted_symbols = set()
+        for code in codes:
+            market, stock_code, filename = get_stock_filename(code)
+            wanted_symbols.add((market, stock_code))
+
+    symbol_codes = []
+    tasks = []
+    for market, stock_code in catalog.symbols():
+        if wanted_symbols is not None and (market, stock_code) not in wanted_symbols:
+            continue
+        code = f"{market.lower()}{stock_code}"
+        symbol_codes.append(code)
+        for year in catalog.years(code):
+            if years and year not in years:
+                continue
+            record = catalog.entry(code, year)
+            tasks.append((code, year, catalog.signature(code, year), record.get('encoding'), normalize, force))
+
+    summary = {'converted': 0, 'skipped': 0, 'invalid': 0, 'failed': 0, 'normalized': 0, 'rollups': 0,
+               'rows': 0, 'dropped': 0, 'errors': []}
+    started_at = time.time()
+    print(f"开始转换 {len(tasks)} 个文件，进程数 {workers}")
+    for result in _run_in_pool('转换', ingest_file, tasks, workers):
+        summary[result['status']] += 1
+        summary['rows'] += result['rows']
+        summary['dropped'] += result['dropped']
+        summary['normalized'] += int(result['normalized'])
+        summary['rollups'] += int(result['rollups'])
+        if result['status'] in ('invalid', 'failed'):
+            summary['errors'].append(f"{result['code']} {result['year']}: {result['error'] or '列数不足'}")
+
+    # 编码转换会修改源文件，重新扫描索引
+    catalog.refresh()
+
+    if symbol_store and symbol_codes:
+        print(f"开始构建 {len(symbol_codes)} 只股票的内存映射存储")
+        for result in _run_in_pool('存储', build_store, [(code,) for code in symbol_codes], workers):
+            if result['status'] == 'failed':
+                summary['errors'].append(f"{result['code']} 存储: {result['error']}")
+
+    print(f"导入完成，用时 {time.time() - started_at:.1f} 秒: 转换 {summary['converted']} 个, "
+          f"跳过 {summary['skipped']} 个, 格式错误 {summary['invalid']} 个, 失败 {summary['failed']} 个, "
+          f"转为UTF-8 {summary['normalized']} 个, 生成预聚合 {summary['rollups']} 个, 有效行 {summary['rows']}, 清洗掉 {summary['dropped']} 行")
+    for error in summary['errors']:
+        print(f"  ❌ {error}")
+    return summary
@@ -18,6 +18,9 @@ from typing import Annotated
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from config import LOCAL_DATA_PATH, get_stock_filename, get_data_file_path
+from catalog import get_catalog
+from local_store import load_year_frame
+from bar_aggregator import get_latest_bars
 
 async def get_price_local_async(code: str, end_date: str = '', count: int = 10, frequency: str = '1d', start_date: str = '') -> pd.DataFrame:
     """从本地CSV文件读取股票数据 - 异步版本，支持跨年份数据读取"""
@@ -49,36 +52,30 @@ async def get_price_local_async(code: str, end_date: str = '', count: int = 10,
 
         # 如果没有指定日期范围，默认使用最近的年份
         if not start_date and not end_date:
-            # 尝试从2025年开始，如果文件不存在则尝试其他年份
-            for year in [2025, 2024, 2023, 2022]:
-                test_path = get_data_file_path(code, year)
-                if os.path.exists(test_path):
-                    start_year = end_year = year
-                    break
-
-        # 读取跨年份的数据
-        all_data = []
+            # 使用数据目录索引中最新的年份
+            available_years = get_catalog().years(code)
+            if available_years:
+                start_year = end_year = available_years[-1]
+
+        # 读取跨年份的数据（与 Ashare.get_price_local 共享进程内数据帧缓存）
+        catalog = get_catalog()
+        years = []
         for year in range(start_year, end_year + 1):
             file_path = get_data_file_path(code, year)
+            if catalog.has(code, year):
+                years.append(year)
 
         # 检查文件是否存在
-        if not os.path.exists(file_path):
+        if not years:
             raise FileNotFoundError(f"数据文件不存在: {file_path}")
 
         # 使用异步执行文件读取
         loop = asyncio.get_event_loop()
-        df = await loop.run_in_executor(None, lambda: pd.read_csv(file_path, encoding='utf-8'))
-
-        # 重命名列以匹配原有格式
-        df.columns = ['date', 'code', 'open', 'high', 'low', 'close', 'volume', 'amount']
-
-        # 转换数据类型
-        df['date'] = pd.to_datetime(df['date'])
-        df['open'] = df['open'].astype(float)
-        df['high'] = df['high'].astype(float)
-        df['low'] = df['low'].astype(float)
-        df['close'] = df['close'].astype(float)
-        df['volume'] = df['volume'].astype(float)
+        frames = await loop.run_in_executor(None, lambda: [load_year_frame(code, year) for year in years])
+        frames = [frame for frame in frames if frame is not None]
+        if not frames:
+            raise ValueError(f"数据文件格式不正确: {file_path}")
+        df = pd.concat(frames, ignore_index=True)
 
         # 设置日期为索引
         df.set_index('date', inplace=True)
@@ -292,3 +289,41 @@ async def get_price(
             message=f"获取数据失败: {str(e)}"
         )
 
+# MCP 工具 - 获取最近N根K线（增量聚合）
+@mcp.tool()
+async def get_latest_price(
+    code: Annotated[str, Field(description="证券代码，如'sh000001'或'000001.XSHG'")],
+    count: Annotated[int, Field(description="获取的K线数量")] = 10,
+    frequency: Annotated[Literal['1m', '5m', '15m', '30m', '60m', '1d', '1w', '1M'],
+                         Field(description="K线周期，分钟线：'1m', '5m', '15m', '30m', '60m'，日线：'1d'，周线：'1w'，月线：'1M'")] = '1d'
+) -> StockData:
+    """
+    获取本地数据中最近的K线。每个 (股票, 周期) 维护一个增量聚合器，
+    新的分钟数据只更新最后一根K线或追加新K线，不重新聚合历史数据。
+
+    Args:
+        code: 证券代码，如'sh000001'或'000001.XSHG'
+        count: 获取的K线数量
+        frequency: K线周期
+
+    Returns:
+        StockData: 包含股票代码、行情数据和处理消息的对象
+    """
+    try:
+        loop = asyncio.get_event_loop()
+        df = await loop.run_in_executor(None, lambda: get_latest_bars(code, frequency, count))
+        if df.empty:
+            return StockData(code=code, data={}, message=f"本地没有{code}的数据")
+
+        data_dict = df.reset_index().to_dict(orient='records')
+        return StockData(
+            code=code,
+            data={"records": data_dict, "columns": list(df.reset_index().columns)},
+            message=f"成功获取{code}最近{len(df)}条{frequency}周期数据"
+        )
+    except Exception as e:
+        return StockData(
+            code=code,
+            data={},
+            message=f"获取数据失败: {str(e)}"
+        )
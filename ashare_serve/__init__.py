@@ -0,0 +1,5 @@
+"""
+Ashare Web服务的多进程生产部署
+"""
+
+__version__ = "1.0.0"
@@ -0,0 +1,37 @@
+"""
+Ashare Web服务生产部署入口点
+
+用法: python -m ashare_serve [--workers N] [--host 0.0.0.0] [--port 5000]
+                             [--preload sh600000,sz000001 | --preload '*'] [--preload-years N]
+"""
+
+import argparse
+from .server import serve
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+
+def main():
+    """启动多进程Web服务"""
+    parser = argparse.ArgumentParser(description="Ashare Web服务（多进程）")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数，默认取 SERVE_WORKERS，为0时使用全部CPU核心")
+    parser.add_argument("--host", default=None, help="监听地址，默认取 SERVE_HOST")
+    parser.add_argument("--port", type=int, default=None, help="监听端口，默认取 SERVE_PORT")
+    parser.add_argument("--preload", default=None, help="预先加载的股票代码，逗号分隔，'*' 表示全部股票，默认取 PRELOAD_CODES")
+    parser.add_argument("--preload-years", type=int, default=None, help="每只股票预先加载最近几年的数据，0 表示全部年份")
+
+    args = parser.parse_args()
+    serve(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        preload_codes=_split(args.preload),
+        preload_years=args.preload_years,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,72 @@
+"""
+启动时预加载数据
+
+在创建工作进程之前把常用股票的数据载入内存缓存，工作进程 fork 后以写时复制方式共享，
+首个请求也不必再读取文件。
+"""
+
+import logging
+import time
+
+from config import PRELOAD_YEARS, ROLLUPS_ENABLED
+from catalog import get_catalog
+from local_store import frame_cache, load_year_frame
+from rollups import load_year_rollups
+from trading_calendar import INTRADAY_FREQUENCIES, get_calendar
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_preload_codes(codes):
+    """展开预加载列表，'*' 表示数据目录中的全部股票"""
+    if codes and '*' in codes:
+        return [f"{market.lower()}{stock_code}" for market, stock_code in get_catalog().symbols()]
+    return list(codes or [])
+
+
+def preload(codes, years=PRELOAD_YEARS):
+    """
+    把股票最近几年的分钟数据和预聚合K线载入内存缓存
+
+    缓存放满（开始淘汰）时停止预加载，以免后加载的数据挤掉先加载的数据。
+
+    Args:
+        codes: 股票代码列表
+        years: 每只股票加载最近几年，0 表示全部年份
+
+    Returns:
+        dict: 预加载统计
+    """
+    catalog = get_catalog()
+    calendar = get_calendar()
+    for frequency in INTRADAY_FREQUENCIES:
+        calendar.bar_times(frequency)
+
+    started_at = time.time()
+    evictions = frame_cache.stats()['evictions']
+    summary = {'symbols': 0, 'files': 0, 'failed': 0, 'complete': True}
+    for code in codes:
+        code_years = catalog.years(code)
+        if years:
+            code_years = code_years[-years:]
+        for year in code_years:
+            try:
+                load_year_frame(code, year)
+                if ROLLUPS_ENABLED:
+                    load_year_rollups(code, year)
+                summary['files'] += 1
+            except Exception as e:
+                summary['failed'] += 1
+                logger.warning("❌ 预加载 %s %s年数据失败: %s", code, year, e)
+        summary['symbols'] += 1
+
+        if frame_cache.stats()['evictions'] > evictions:
+            summary['complete'] = False
+            logger.warning("⚠️ 内存缓存已满（FRAME_CACHE_MAX_BYTES），预加载在 %s 处停止", code)
+            break
+
+    summary['bytes'] = frame_cache.stats()['bytes']
+    summary['seconds'] = round(time.time() - started_at, 2)
+    logger.info("📦 预加载完成: %d 只股票, %d 个年份文件, %.1f MB, 用时 %s 秒",
+                summary['symbols'], summary['files'], summary['bytes'] / 1024 / 1024, summary['seconds'])
+    return summary
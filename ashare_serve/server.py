@@ -0,0 +1,144 @@
+"""
+多进程Web服务
+
+主进程先构建数据目录索引和交易日历，把预加载股票最近几年的分钟数据和预聚合K线载入内存缓存，
+然后监听端口，再以 fork 方式创建多个工作进程共用同一个监听套接字，由内核把连接分配给各进程。
+
+预加载的数据在 fork 之后以写时复制方式共享：fork 前先 gc.freeze()，避免垃圾回收改写对象头导致页面被复制，
+NumPy 列数据只读不写，所以多个工作进程不会各占一份。每个工作进程是多线程的 WSGI 服务，
+各自维护响应缓存和之后新加载的数据；工作进程异常退出时由主进程重新创建。
+fork 前主进程等待数据目录索引的后台扫描结束并停止自动刷新，工作进程启动时重新扫描一次，再恢复自动刷新。
+工作进程的日志经 multiprocessing 队列交给主进程，由主进程统一写入日志文件。
+
+Windows 不支持 fork，此时在当前进程中以多线程方式运行。
+"""
+
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from multiprocessing.connection import wait
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+# 导入配置
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import PRELOAD_CODES, PRELOAD_YEARS, SERVE_HOST, SERVE_PORT, SERVE_WORKERS
+from catalog import get_catalog, pause_auto_refresh, refresh_catalog, resume_auto_refresh
+from request_log import setup_logging, stop_logging
+from app import app
+from .preload import preload, resolve_preload_codes
+
+logger = logging.getLogger(__name__)
+
+# 监听队列长度
+LISTEN_BACKLOG = 128
+
+# 工作进程退出后重新创建前等待的秒数，避免启动即崩溃时反复创建
+RESPAWN_DELAY = 1.0
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """不输出 werkzeug 的访问日志，每个请求的记录由 request_log 输出"""
+
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+def _listen(host, port):
+    """创建并监听套接字，由所有工作进程共用"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(LISTEN_BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(index, fd, host, port):
+    """工作进程：在共用的监听套接字上运行多线程 WSGI 服务，直到被主进程终止"""
+    # Ctrl+C 由主进程处理，工作进程只响应主进程发来的 SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # 主进程在 fork 前暂停了自动刷新；先按当前文件重新扫描一次，再恢复本进程的自动刷新
+    refresh_catalog()
+    resume_auto_refresh()
+    server = make_server(host, port, app, threaded=True, request_handler=QuietRequestHandler, fd=fd)
+    logger.info("🚀 工作进程 %d 已启动 (pid %d)", index, os.getpid())
+    server.serve_forever()
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(host=None, port=None, workers=None, preload_codes=None, preload_years=None):
+    """
+    启动多进程Web服务，直到收到 SIGINT/SIGTERM
+
+    Args:
+        host: 监听地址，默认取 SERVE_HOST
+        port: 监听端口，默认取 SERVE_PORT
+        workers: 工作进程数，默认取 SERVE_WORKERS，为0时使用全部CPU核心
+        preload_codes: 预先加载的股票代码，默认取 PRELOAD_CODES
+        preload_years: 每只股票预先加载最近几年，默认取 PRELOAD_YEARS
+    """
+    host = host or SERVE_HOST
+    port = port or SERVE_PORT
+    workers = workers or SERVE_WORKERS or os.cpu_count()
+    preload_codes = PRELOAD_CODES if preload_codes is None else preload_codes
+    preload_years = PRELOAD_YEARS if preload_years is None else preload_years
+
+    catalog_stats = get_catalog().stats()
+    logger.info("📁 数据目录索引: %d 只股票, %d 个文件", catalog_stats['symbols'], catalog_stats['files'])
+    preload(resolve_preload_codes(preload_codes), preload_years)
+
+    if not hasattr(os, 'fork'):
+        logger.info("🚀 当前系统不支持 fork，以单进程多线程方式运行: http://%s:%s", host, port)
+        make_server(host, port, app, threaded=True, request_handler=QuietRequestHandler).serve_forever()
+        return
+
+    context = multiprocessing.get_context('fork')
+    setup_logging(log_queue=context.Queue())
+    sock = _listen(host, port)
+    logger.info("🚀 启动 %d 个工作进程: http://%s:%s", workers, host, port)
+
+    # 预加载期间可能已启动后台扫描，等它结束并在主进程中停止自动刷新，
+    # 避免 fork 时子进程复制到被扫描线程持有的锁；主进程不处理请求，之后不再需要刷新
+    pause_auto_refresh()
+
+    # 预加载的对象不再参与垃圾回收，fork 之后不会因回收扫描而复制页面
+    gc.collect()
+    gc.freeze()
+
+    def start_worker(index):
+        process = context.Process(target=_run_worker, args=(index, sock.fileno(), host, port),
+                                  name=f"ashare-worker-{index}", daemon=True)
+        process.start()
+        return process
+
+    processes = {index: start_worker(index) for index in range(workers)}
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    try:
+        while True:
+            ready = wait([process.sentinel for process in processes.values()])
+            for index, process in list(processes.items()):
+                if process.sentinel in ready:
+                    process.join()
+                    logger.warning("⚠️ 工作进程 %d 已退出 (exit code %s)，重新创建", index, process.exitcode)
+                    time.sleep(RESPAWN_DELAY)
+                    processes[index] = start_worker(index)
+    except KeyboardInterrupt:
+        logger.info("🛑 正在停止工作进程")
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+        sock.close()
+        stop_logging()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量K线聚合
+
+回放或实时行情中每来一根新的分钟K线，只更新最后一根聚合K线或新开一根，
+不再重新读取和聚合全部历史数据。K线归属（5/15/30分钟按自然时间、60分钟按交易时段、
+日/周/月按自然日期）与 aggregation.py 完全相同，逐根推入分钟数据得到的结果与批量聚合一致
+（唯一的区别是周线、月线不会生成整周/整月没有交易的空K线）。
+
+    aggregator = BarAggregator('60m')
+    aggregator.seed(history_bars)              # 可选：用已聚合的历史K线初始化
+    event = aggregator.push(timestamp, open, high, low, close, volume)
+    # event: {'type': 'new' / 'update', 'bar': {...}}，被忽略的分钟返回None
+    latest = aggregator.bars(100)
+
+get_latest_bars() 为每个 (股票, 频率) 维护一个聚合器，按数据目录索引发现的新分钟数据增量更新，
+供Web服务和MCP服务回答"最近N根K线"。
+"""
+
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from aggregation import NAT, bar_labels
+from config import LATEST_BARS_CACHE_MAX_BYTES, get_stock_filename
+from catalog import get_catalog
+from Ashare import get_price_local
+from frame_cache import ByteLRUCache
+from local_store import load_year_frame
+
+# 每个聚合器默认保留的K线数量
+DEFAULT_MAX_BARS = 1000
+
+# 输出数据帧的列，与 Ashare.get_price_local 一致
+OUTPUT_COLUMNS = ['open', 'close', 'high', 'low', 'volume']
+
+
+class BarAggregator:
+    """单只股票单个频率的增量聚合器，非线程安全"""
+
+    def __init__(self, frequency, max_bars=DEFAULT_MAX_BARS):
+        self.frequency = frequency
+        self.max_bars = max_bars
+        self._bars = deque(maxlen=max_bars)  # [label_ns, open, high, low, close, volume]
+        self._last_minute = None   # 最后推入的分钟时间戳
+        self._last_values = None   # 最后推入的分钟 (open, high, low, close, volume)
+        self._base = None          # 最后一根K线在最后一分钟之前的状态，None 表示该K线由最后一分钟新开
+
+    def __len__(self):
+        return len(self._bars)
+
+    @property
+    def last_minute(self):
+        """最后处理的分钟时间（pd.Timestamp），尚未推入数据时为None"""
+        return pd.Timestamp(self._last_minute) if self._last_minute is not None else None
+
+    def seed(self, bars, last_minute=None):
+        """
+        用已聚合的历史K线初始化，最后一根K线可以是未完成的，之后推入的分钟会继续合并进去
+
+        Args:
+            bars: 以日期为索引、包含 open/high/low/close/volume 列的数据帧（get_price_local 的返回格式）
+            last_minute: 生成这些K线的最后一分钟时间，更早的分钟之后推入时会被忽略
+        """
+        self._bars.clear()
+        dates = pd.DatetimeIndex(bars.index).values.astype('datetime64[ns]').view(np.int64)
+        for label, row in zip(dates, bars[['open', 'high', 'low', 'close', 'volume']].itertuples(index=False)):
+            self._bars.append([int(label), *row])
+
+        if last_minute is not None:
+            self._last_minute = pd.Timestamp(last_minute).value
+        elif len(dates):
+            self._last_minute = int(dates[-1])
+        # 历史K线的最后一分钟无法拆分，不支持修正
+        self._last_values = None
+        self._base = None
+
+    def push(self, timestamp, open, high, low, close, volume):
+        """
+        推入一根分钟K线
+
+        与最后推入的分钟时间相同时视为对该分钟的修正，替换而不是累加。
+
+        Returns:
+            dict: {'type': 'new' 或 'update', 'bar': K线}；早于最后一分钟或不在交易时段内时返回None
+        """
+        ts = pd.Timestamp(timestamp).value
+        values = (open, high, low, close, volume)
+
+        if self._last_minute is not None and ts <= self._last_minute:
+            if ts < self._last_minute or self._last_values is None:
+                return None
+            # 修正最后一分钟：从该分钟之前的状态重新合并
+            if self._base is None:
+                self._bars[-1] = [self._bars[-1][0], *values]
+            else:
+                self._bars[-1] = _merge(list(self._base), values)
+            self._last_values = values
+            return {'type': 'update', 'bar': self._bar_dict(self._bars[-1])}
+
+        label = int(bar_labels(np.array([ts], dtype=np.int64), self.frequency)[0])
+        if label == NAT:
+            return None
+
+        self._last_minute = ts
+        self._last_values = values
+        if self._bars and self._bars[-1][0] == label:
+            self._base = tuple(self._bars[-1])
+            self._bars[-1] = _merge(self._bars[-1], values)
+            return {'type': 'update', 'bar': self._bar_dict(self._bars[-1])}
+
+        self._base = None
+        self._bars.append([label, *values])
+        return {'type': 'new', 'bar': self._bar_dict(self._bars[-1])}
+
+    def push_frame(self, df):
+        """按时间顺序推入多根分钟K线（包含 date/open/high/low/close/volume 列），返回事件列表"""
+        events = []
+        for row in df[['date', 'open', 'high', 'low', 'close', 'volume']].itertuples(index=False):
+            event = self.push(*row)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def bars(self, count=None):
+        """
+        最近的K线
+
+        Returns:
+            DataFrame: 以日期为索引，列与 get_price_local 返回值相同
+        """
+        rows = list(self._bars)
+        if count is not None:
+            rows = rows[-count:] if count > 0 else []
+        df = pd.DataFrame(rows, columns=['date', 'open', 'high', 'low', 'close', 'volume'])
+        df['date'] = df['date'].astype(np.int64).values.view('datetime64[ns]')
+        df.set_index('date', inplace=True)
+        df.index.name = ''
+        return df[OUTPUT_COLUMNS]
+
+    @staticmethod
+    def _bar_dict(bar):
+        return {
+            'date': pd.Timestamp(bar[0]),
+            'open': bar[1],
+            'high': bar[2],
+            'low': bar[3],
+            'close': bar[4],
+            'volume': bar[5],
+        }
+
+
+def _merge(bar, values):
+    """把一分钟数据合并进K线"""
+    open, high, low, close, volume = values
+    return [bar[0], bar[1], max(bar[2], high), min(bar[3], low), close, bar[5] + volume]
+
+
+# 每个 (股票, 频率) 一个聚合器，总占用按估算字节数限制，按最近最少使用淘汰
+latest_bars_cache = ByteLRUCache(LATEST_BARS_CACHE_MAX_BYTES)
+# 只保护条目的查找和创建，读取数据和聚合在各条目自己的锁内进行
+_entries_lock = threading.Lock()
+
+# 聚合器中每根K线的估算内存占用（列表和其中的Python数值对象）
+BAR_BYTES = 256
+
+
+class _LatestBars:
+    """某个 (股票, 频率) 的聚合器及初始化时的数据文件签名"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.aggregator = None
+        self.signatures = None
+
+
+def _appended_only(old, new):
+    """
+    数据文件签名的变化是否只是在末尾追加了数据
+
+    只允许最新年份的文件变大或出现更晚的年份；更早年份的文件变化、最新年份的文件大小不变或变小
+    都视为改写，需要重新初始化聚合器。
+    """
+    if old == new:
+        return True
+    old_years = {year: (mtime_ns, size) for year, mtime_ns, size in old}
+    new_years = {year: (mtime_ns, size) for year, mtime_ns, size in new}
+    if not old_years:
+        return False
+    last_year = max(old_years)
+    for year, (mtime_ns, size) in old_years.items():
+        if year not in new_years:
+            return False
+        if new_years[year] != (mtime_ns, size) and (year != last_year or new_years[year][1] <= size):
+            return False
+    return all(year in old_years or year > last_year for year in new_years)
+
+
+def _new_minutes(code, after):
+    """读取某只股票最新年份中晚于 after 的分钟数据"""
+    catalog = get_catalog()
+    frames = []
+    for year in reversed(catalog.years(code)):
+        if year < after.year:
+            break
+        df_year = load_year_frame(code, year)
+        if df_year is None or df_year.empty:
+            continue
+        dates = df_year['date'].values.astype('datetime64[ns]').view(np.int64)
+        lo = int(np.searchsorted(dates, after.value, side='left'))
+        frames.insert(0, df_year.iloc[lo:])
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def get_latest_bars(code, frequency, count=DEFAULT_MAX_BARS):
+    """
+    获取某只股票最近 count 根K线，由该 (股票, 频率) 的聚合器增量维护
+
+    首次调用时用 get_price_local 的结果初始化；之后只读取数据目录索引中新出现的分钟数据
+    （最新年份的数据帧通常已在内存缓存中）并推入聚合器，不重新聚合历史数据。
+    数据文件不是只在末尾追加（见 _appended_only）时重新初始化。
+
+    Returns:
+        DataFrame: 以日期为索引，列与 get_price_local 返回值相同；没有数据时为空
+    """
+    catalog = get_catalog()
+    latest = catalog.latest_timestamp(code)
+    if latest is None:
+        return pd.DataFrame(columns=OUTPUT_COLUMNS)
+    latest = pd.Timestamp(latest)
+    signatures = catalog.signatures(code)
+
+    market, stock_code, filename = get_stock_filename(code)
+    key = (market, stock_code, frequency)
+    with _entries_lock:
+        entry = latest_bars_cache.get(key)
+        if entry is None:
+            entry = _LatestBars()
+            latest_bars_cache.put(key, entry, DEFAULT_MAX_BARS * BAR_BYTES)
+
+    # 冷启动读取历史数据时只阻塞同一 (股票, 频率) 的请求
+    with entry.lock:
+        aggregator = entry.aggregator
+        if (aggregator is None or aggregator.max_bars < count
+                or not _appended_only(entry.signatures, signatures)):
+            max_bars = max(count, DEFAULT_MAX_BARS)
+            aggregator = BarAggregator(frequency, max_bars)
+            aggregator.seed(get_price_local(code, count=max_bars, frequency=frequency), latest)
+            entry.aggregator = aggregator
+            if max_bars > DEFAULT_MAX_BARS:
+                latest_bars_cache.put(key, entry, max_bars * BAR_BYTES)
+        elif latest > aggregator.last_minute:
+            # 从最后处理的那一分钟开始推入，该分钟的数据若被修正也会替换
+            new_minutes = _new_minutes(code, aggregator.last_minute)
+            if new_minutes is not None:
+                aggregator.push_frame(new_minutes)
+        entry.signatures = signatures
+        return aggregator.bars(count)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多只股票批量读取本地数据
+
+    frames, errors = get_price_many(['sh600000', 'sz000001'], frequency='60m', count=500)
+    # frames: {股票代码: 与 get_price_local 格式相同的数据帧}，errors: {股票代码: 错误信息}
+
+    df, errors = get_price_many(codes, frequency='1d', count=100, long_format=True)
+    # df: 长表，列为 code/date/open/close/high/low/volume
+
+读取和聚合在进程池中并行执行（进程数见 BATCH_WORKERS），每个任务处理一组股票；
+子进程只返回各列的 NumPy 数组，由主进程组装数据帧，避免序列化整个数据帧。
+进程池在首次使用时创建并复用，子进程中的内存缓存在多次调用之间保持有效。
+单只股票读取失败只记录在 errors 中，不影响其他股票。
+
+Windows 下子进程以 spawn 方式启动，调用脚本需放在 if __name__ == '__main__': 之下。
+"""
+
+import atexit
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from config import BATCH_WORKERS
+from Ashare import read_local_bars
+
+logger = logging.getLogger(__name__)
+
+# 返回数据帧的列，与 Ashare.get_price_local 一致
+OUTPUT_COLUMNS = ['open', 'close', 'high', 'low', 'volume']
+
+# 每个进程平均分到的任务数，任务越多负载越均衡，但调度开销越大
+TASKS_PER_WORKER = 4
+
+
+def _frame_to_columns(df):
+    """数据帧 -> {列名: 数组}，日期转为 int64 纳秒"""
+    columns = {'date': pd.DatetimeIndex(df.index).values.astype('datetime64[ns]').view(np.int64)}
+    for column in OUTPUT_COLUMNS:
+        columns[column] = df[column].to_numpy()
+    return columns
+
+
+def _columns_to_frame(columns):
+    """{列名: 数组} -> 以日期为索引的数据帧"""
+    df = pd.DataFrame({column: columns[column] for column in OUTPUT_COLUMNS},
+                      index=pd.DatetimeIndex(columns['date'].view('datetime64[ns]')))
+    df.index.name = ''
+    return df
+
+
+def fetch_chunk(codes, frequency, count, start_date, end_date):
+    """
+    读取一组股票，在子进程中执行
+
+    Returns:
+        list: [(股票代码, 列数组字典, None) 或 (股票代码, None, 错误信息)]
+    """
+    results = []
+    for code in codes:
+        try:
+            df = read_local_bars(code, end_date=end_date, count=count, frequency=frequency, start_date=start_date)
+            if df.empty:
+                results.append((code, None, '没有数据'))
+            else:
+                results.append((code, _frame_to_columns(df), None))
+        except Exception as e:
+            results.append((code, None, f"{type(e).__name__}: {e}"))
+    return results
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    """获取共享的进程池，进程数变化时重建"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    """关闭共享的进程池，下次批量读取时重新创建"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+            _pool_workers = 0
+
+
+atexit.register(shutdown_pool)
+
+
+def _chunks(codes, size):
+    return [codes[i:i + size] for i in range(0, len(codes), size)]
+
+
+def get_price_many(codes, frequency='1d', count=1000, start_date='', end_date='', workers=None, long_format=False):
+    """
+    批量读取多只股票的本地数据，日期范围与数量规则同 get_price_local
+
+    Args:
+        codes: 股票代码列表，重复的代码只读取一次
+        frequency: 目标频率
+        count: 每只股票需要的K线数量
+        start_date: 开始日期
+        end_date: 结束日期
+        workers: 进程数，默认取 BATCH_WORKERS，为0时使用全部CPU核心，为1时在当前进程中读取
+        long_format: 为True时把所有股票合并为一个长表返回
+
+    Returns:
+        tuple: (结果, 错误)
+            结果为 {股票代码: 数据帧}（按 codes 的顺序），long_format 为True时为包含 code 列的长表；
+            错误为 {股票代码: 错误信息}，只包含读取失败或没有数据的股票
+    """
+    codes = list(dict.fromkeys(codes))
+    workers = workers or BATCH_WORKERS or os.cpu_count()
+    workers = min(workers, len(codes)) if codes else 1
+
+    if workers <= 1:
+        results = fetch_chunk(codes, frequency, count, start_date, end_date)
+    else:
+        chunks = _chunks(codes, max(1, -(-len(codes) // (workers * TASKS_PER_WORKER))))
+        pool = _get_pool(workers)
+        futures = [pool.submit(fetch_chunk, chunk, frequency, count, start_date, end_date) for chunk in chunks]
+        results = []
+        for chunk, future in zip(chunks, futures):
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                # 子进程异常退出等，整组记为失败
+                results.extend((code, None, f"{type(e).__name__}: {e}") for code in chunk)
+
+    columns_by_code = {}
+    errors = {}
+    for code, columns, error in results:
+        if error is not None:
+            errors[code] = error
+        else:
+            columns_by_code[code] = columns
+
+    logger.info("批量读取 %d 只股票完成: 成功 %d 只, 失败 %d 只", len(codes), len(columns_by_code), len(errors))
+
+    if long_format:
+        return _long_frame(columns_by_code), errors
+    return {code: _columns_to_frame(columns) for code, columns in columns_by_code.items()}, errors
+
+
+def _long_frame(columns_by_code):
+    """把各股票的列数组直接拼接为长表"""
+    if not columns_by_code:
+        return pd.DataFrame({'code': pd.Series([], dtype=object),
+                             'date': np.array([], dtype='datetime64[ns]'),
+                             **{column: np.array([], dtype=np.float64) for column in OUTPUT_COLUMNS}})
+
+    arrays = list(columns_by_code.values())
+    lengths = [len(columns['date']) for columns in arrays]
+    return pd.DataFrame({
+        'code': np.repeat(np.array(list(columns_by_code), dtype=object), lengths),
+        'date': np.concatenate([columns['date'] for columns in arrays]).view('datetime64[ns]'),
+        **{column: np.concatenate([columns[column] for columns in arrays]) for column in OUTPUT_COLUMNS},
+    })
+
+
+if __name__ == '__main__':
+    import time
+
+    from catalog import get_catalog
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    all_codes = [f"{market.lower()}{stock_code}" for market, stock_code in get_catalog().symbols()]
+    started_at = time.time()
+    frames, failed = get_price_many(all_codes, frequency='1d', count=100)
+    print(f"用时 {time.time() - started_at:.2f} 秒")
+    for failed_code, message in failed.items():
+        print(f"  ❌ {failed_code}: {message}")
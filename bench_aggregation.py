@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+小时线聚合性能测试
+
+生成多年的模拟分钟数据，对比逐日循环的原实现与按时段标记的向量化实现，
+检查两者输出一致并打印耗时。
+
+用法: python bench_aggregation.py [年数]
+"""
+
+import contextlib
+import io
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from Ashare import aggregate_hourly_trading_data
+
+
+def make_minute_data(years=3, seed=0):
+    """
+    生成模拟的A股分钟数据
+
+    每个工作日包含 09:30-11:30 与 13:00-15:00 的每分钟数据，另外夹杂少量
+    集合竞价（09:25）和盘后（15:05）数据，用于检查交易时段之外的数据被丢弃。
+    """
+    days = pd.bdate_range('2015-01-05', periods=250 * years)
+    minutes = np.concatenate([
+        [9 * 60 + 25],
+        np.arange(9 * 60 + 30, 11 * 60 + 31),
+        np.arange(13 * 60, 15 * 60 + 1),
+        [15 * 60 + 5],
+    ])
+    dates = (days.values.astype('datetime64[m]')[:, None] + minutes[None, :].astype('timedelta64[m]')).ravel()
+
+    rng = np.random.default_rng(seed)
+    close = np.round(10 + np.cumsum(rng.normal(0, 0.01, len(dates))), 2)
+    open_ = np.round(close + rng.normal(0, 0.01, len(dates)), 2)
+    spread = np.round(np.abs(rng.normal(0, 0.02, len(dates))), 2)
+    return pd.DataFrame({
+        'date': dates.astype('datetime64[ns]'),
+        'open': open_,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+        'close': close,
+        'volume': rng.integers(100, 10000, len(dates)),
+    })
+
+
+def legacy_aggregate_hourly(df):
+    """原有的逐日循环实现，仅作为对照"""
+    df = df.sort_values('date')
+    result_data = []
+    df['date_only'] = df['date'].dt.date
+    sessions = [('09:30:00', '10:30:00', False), ('10:30:00', '11:30:00', False),
+                ('13:00:00', '14:00:00', False), ('14:00:00', '15:00:00', True)]
+    for date, day_data in df.groupby('date_only'):
+        times = day_data['date'].dt.time
+        for start, end, closing in sessions:
+            end_time = pd.Timestamp(end).time()
+            mask = (times >= pd.Timestamp(start).time()) & ((times <= end_time) if closing else (times < end_time))
+            bucket = day_data[mask]
+            if not bucket.empty:
+                result_data.append({
+                    'date': pd.Timestamp(f"{date} {end}"),
+                    'open': bucket['open'].iloc[0],
+                    'high': bucket['high'].max(),
+                    'low': bucket['low'].min(),
+                    'close': bucket['close'].iloc[-1],
+                    'volume': bucket['volume'].sum()
+                })
+    return pd.DataFrame(result_data)
+
+
+def _timed(function, df, repeat):
+    best = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = function(df)
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    df = make_minute_data(years)
+    print(f"模拟数据: {years} 年, {len(df)} 条分钟数据")
+
+    expected, legacy_time = _timed(legacy_aggregate_hourly, df, 1)
+    actual, vector_time = _timed(aggregate_hourly_trading_data, df, 5)
+    pd.testing.assert_frame_equal(actual, expected)
+
+    print(f"逐日循环:   {legacy_time * 1000:.1f} ms")
+    print(f"向量化:     {vector_time * 1000:.1f} ms")
+    print(f"加速比:     {legacy_time / vector_time:.1f}x，输出 {len(actual)} 条小时线，结果一致")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地数据目录索引
+
+启动时扫描一次 {LOCAL_DATA_PATH}/{year}/{MARKET}.{code}.csv，记录每个文件的
+大小、修改时间、首末行时间、数据行数和编码，并持久化到 {CACHE_PATH}/catalog.json。
+之后"某只股票有哪些年份"、"最新K线时间"、股票列表等查询都是字典查找，
+请求路径上不再调用 os.path.exists / os.stat。
+
+文件签名未变的条目直接复用索引文件中的记录，只有新增或修改过的文件才会重新统计。
+索引每隔 CATALOG_REFRESH_INTERVAL 秒在后台线程中自动刷新一次，也可以调用 refresh() 手动刷新。
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from config import CACHE_PATH, CATALOG_REFRESH_INTERVAL, LOCAL_DATA_PATH, get_stock_filename
+
+logger = logging.getLogger(__name__)
+
+# 索引文件格式版本，格式变化时递增
+CATALOG_FORMAT_VERSION = 2
+
+# 依次尝试的文件编码
+CSV_ENCODINGS = ('utf-8', 'gbk', 'gb2312')
+
+# 识别编码时读取的文件开头字节数
+ENCODING_SNIFF_BYTES = 64 * 1024
+
+# 数据文件名：SH.600000.csv / SZ.000001.csv
+DATA_FILE_PATTERN = re.compile(r'^(SH|SZ)\.(\w+)\.csv$', re.IGNORECASE)
+
+# 读取首末行时使用的块大小
+_BLOCK_SIZE = 64 * 1024
+
+
+def _first_field(line):
+    """取CSV行的第一列（日期）"""
+    return line.decode('ascii', errors='ignore').split(',', 1)[0].strip()
+
+
+def sniff_encoding(prefix):
+    """
+    根据文件开头的字节判断编码
+
+    Args:
+        prefix: 文件开头的原始字节，末尾可能截断在多字节字符中间
+
+    Returns:
+        str: 编码名称，都无法解码时返回None
+    """
+    for encoding in CSV_ENCODINGS:
+        try:
+            prefix.decode(encoding)
+            return encoding
+        except UnicodeDecodeError as e:
+            # 只有末尾被截断的字符解码失败时仍视为该编码
+            if e.start >= len(prefix) - 3 and e.reason.startswith('unexpected end'):
+                return encoding
+    return None
+
+
+def scan_csv_file(file_path):
+    """
+    统计CSV文件的数据行数、首末行时间和编码，只读取原始字节，不做完整解析
+
+    Returns:
+        dict: {'rows', 'first', 'last', 'encoding'}，时间为 'YYYY-MM-DD HH:MM:SS' 字符串，无数据时为None
+    """
+    rows = 0
+    last_line = b''
+    with open(file_path, 'rb') as f:
+        encoding = sniff_encoding(f.read(ENCODING_SNIFF_BYTES))
+        f.seek(0)
+        f.readline()  # 跳过表头
+        first_line = f.readline()
+        if first_line.strip():
+            rows = 1
+        pending = b''
+        while True:
+            block = f.read(_BLOCK_SIZE)
+            if not block:
+                break
+            rows += block.count(b'\n')
+            pending = (pending + block)[-4096:]
+        if pending and not pending.endswith(b'\n'):
+            rows += 1
+
+    lines = [line for line in (pending or first_line).splitlines() if line.strip()]
+    if lines:
+        last_line = lines[-1]
+    elif first_line.strip():
+        last_line = first_line
+
+    def normalize(line):
+        value = _first_field(line) if line and line.strip() else ''
+        try:
+            return pd.Timestamp(value).strftime('%Y-%m-%d %H:%M:%S') if value else None
+        except Exception:
+            return None
+
+    return {'rows': rows, 'first': normalize(first_line), 'last': normalize(last_line), 'encoding': encoding}
+
+
+class DataCatalog:
+    """股票数据文件索引"""
+
+    def __init__(self, data_path, index_path):
+        self.data_path = data_path
+        self.index_path = index_path
+        self.built_at = 0.0
+        self.version = 0
+        self._files = {}    # 相对路径 -> 文件记录
+        self._symbols = {}  # (market, stock_code) -> {year: 文件记录}
+        self._lock = threading.Lock()
+
+    def _load_index(self):
+        """读取持久化的索引文件"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == CATALOG_FORMAT_VERSION and data.get('data_path') == self.data_path:
+                return data.get('files', {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _save_index(self):
+        """原子写入索引文件"""
+        try:
+            index_dir = os.path.dirname(self.index_path)
+            os.makedirs(index_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=index_dir)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': CATALOG_FORMAT_VERSION, 'data_path': self.data_path, 'files': self._files}, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.warning("写入数据索引 %s 失败: %s", self.index_path, e)
+
+    def refresh(self):
+        """
+        重新扫描数据目录，签名未变化的文件沿用已有记录
+
+        Returns:
+            bool: 是否有文件新增、修改或删除
+        """
+        with self._lock:
+            previous = self._files or self._load_index()
+            files = {}
+
+            if os.path.isdir(self.data_path):
+                for year_name in os.listdir(self.data_path):
+                    year_dir = os.path.join(self.data_path, year_name)
+                    if not year_name.isdigit() or not os.path.isdir(year_dir):
+                        continue
+                    with os.scandir(year_dir) as entries:
+                        for entry in entries:
+                            match = DATA_FILE_PATTERN.match(entry.name)
+                            if not match or not entry.is_file():
+                                continue
+                            stat = entry.stat()
+                            relative_path = f"{year_name}/{entry.name}"
+                            record = previous.get(relative_path)
+                            if record is None or record['mtime_ns'] != stat.st_mtime_ns or record['size'] != stat.st_size:
+                                record = {
+                                    'market': match.group(1).upper(),
+                                    'code': match.group(2),
+                                    'year': int(year_name),
+                                    'mtime_ns': int(stat.st_mtime_ns),
+                                    'size': int(stat.st_size),
+                                }
+                                try:
+                                    record.update(scan_csv_file(entry.path))
+                                except OSError as e:
+                                    logger.warning("扫描数据文件 %s 失败: %s", entry.path, e)
+                                    continue
+                            files[relative_path] = record
+
+            changed = files != self._files
+            symbols = {}
+            for record in files.values():
+                symbols.setdefault((record['market'], record['code']), {})[record['year']] = record
+
+            self._files = files
+            self._symbols = symbols
+            self.built_at = time.time()
+            if changed:
+                self.version += 1
+                if files != previous:
+                    self._save_index()
+            return changed
+
+    def _symbol(self, code):
+        market, stock_code, filename = get_stock_filename(code)
+        return self._symbols.get((market, stock_code), {})
+
+    def years(self, code):
+        """某只股票存在数据文件的年份，升序"""
+        return sorted(self._symbol(code))
+
+    def has(self, code, year):
+        """某只股票某一年的数据文件是否存在"""
+        return int(year) in self._symbol(code)
+
+    def entry(self, code, year):
+        """某只股票某一年的文件记录，不存在时返回None"""
+        return self._symbol(code).get(int(year))
+
+    def signature(self, code, year):
+        """某只股票某一年数据文件的 (mtime_ns, size)，不存在时返回None"""
+        record = self.entry(code, year)
+        return (record['mtime_ns'], record['size']) if record else None
+
+    def signatures(self, code, until_year=None):
+        """
+        某只股票各年份数据文件的签名，用于判断由这些文件计算出的结果是否失效
+
+        Args:
+            code: 股票代码
+            until_year: 只包含不晚于该年份的文件（没有这样的文件时取最早一年），None 表示全部年份
+
+        Returns:
+            tuple: ((year, mtime_ns, size), ...)，没有数据文件时为空元组
+        """
+        records = self._symbol(code)
+        years = sorted(records)
+        if until_year is not None:
+            years = [year for year in years if year <= until_year] or years[:1]
+        return tuple((year, records[year]['mtime_ns'], records[year]['size']) for year in years)
+
+    def encoding(self, code, year):
+        """某只股票某一年数据文件识别出的编码，未知时返回None"""
+        record = self.entry(code, year)
+        return record.get('encoding') if record else None
+
+    def set_encoding(self, code, year, encoding):
+        """完整解析时发现编码与识别结果不符，更新记录并保存索引"""
+        record = self.entry(code, year)
+        if record is None or record.get('encoding') == encoding:
+            return
+        with self._lock:
+            record['encoding'] = encoding
+            self._save_index()
+
+    def latest_timestamp(self, code):
+        """某只股票最新一条数据的时间字符串，没有数据时返回None"""
+        records = self._symbol(code)
+        if not records:
+            return None
+        return records[max(records)]['last']
+
+    def symbols(self):
+        """所有股票，格式为 [(market, stock_code), ...]"""
+        return sorted(self._symbols)
+
+    def stats(self):
+        """索引统计信息"""
+        return {
+            'symbols': len(self._symbols),
+            'files': len(self._files),
+            'version': self.version,
+            'built_at': self.built_at,
+        }
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+# 自动刷新时持有，保证同一时间只有一个后台线程在扫描
+_refresh_lock = threading.Lock()
+
+
+def _refresh_in_background(catalog):
+    try:
+        catalog.refresh()
+    finally:
+        _refresh_lock.release()
+
+
+def get_catalog():
+    """
+    获取全局数据索引，首次调用时构建；超过刷新间隔后在后台线程中重新扫描，
+    扫描完成前的调用继续使用现有索引，不等待扫描
+
+    Returns:
+        DataCatalog
+    """
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                catalog = DataCatalog(LOCAL_DATA_PATH, os.path.join(CACHE_PATH, 'catalog.json'))
+                catalog.refresh()
+                _catalog = catalog
+    elif (CATALOG_REFRESH_INTERVAL and time.time() - _catalog.built_at > CATALOG_REFRESH_INTERVAL
+          and _refresh_lock.acquire(blocking=False)):
+        threading.Thread(target=_refresh_in_background, args=(_catalog,),
+                         name='catalog-refresh', daemon=True).start()
+    return _catalog
+
+
+def refresh_catalog():
+    """立即重新扫描数据目录"""
+    return get_catalog().refresh()
+
+
+def pause_auto_refresh():
+    """
+    暂停自动刷新：等待正在进行的后台扫描结束，之后不再启动新的扫描，直到调用 resume_auto_refresh()
+
+    fork 之前调用，保证子进程复制的刷新锁和索引锁都没有被扫描线程持有。
+    """
+    _refresh_lock.acquire()
+
+
+def resume_auto_refresh():
+    """恢复自动刷新，与 pause_auto_refresh() 成对调用；fork 出的子进程中调用时恢复该子进程的自动刷新"""
+    _refresh_lock.release()
+
+
+if __name__ == '__main__':
+    catalog = get_catalog()
+    print(f"数据目录: {catalog.data_path}")
+    print(f"索引文件: {catalog.index_path}")
+    for market, stock_code in catalog.symbols():
+        code = f"{market.lower()}{stock_code}"
+        print(f"  {market}.{stock_code}: 年份 {catalog.years(code)}, 最新数据 {catalog.latest_timestamp(code)}")
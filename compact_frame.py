@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分钟数据的紧凑列存储
+
+把 date/open/high/low/close/volume 数据帧按列压缩为更小的定长类型：
+    date    int32，自1970年起的分钟数（存在非整分钟时间时保留 int64 纳秒）
+    价格    int32，单位为分（0.01元）；不是整分时依次尝试 float32、float64
+    volume  uint32 / int32；超出范围时保留 int64，存在小数时按价格列处理
+
+每列只有在能无损还原时才使用紧凑类型，to_frame() 还原出的数据帧与压缩前完全一致
+（列、数值和 dtype 都相同）。分钟数据的内存占用约为原来的一半以下。
+"""
+
+import numpy as np
+import pandas as pd
+
+# 价格定点数的倍数，存储值 1 表示 0.01 元
+PRICE_SCALE = 100
+
+MINUTE_NS = 60 * 10 ** 9
+
+_INT32_MIN = np.iinfo(np.int32).min
+_INT32_MAX = np.iinfo(np.int32).max
+_UINT32_MAX = np.iinfo(np.uint32).max
+
+# 列的编码方式
+RAW = 'raw'          # 原样保存（可能降为 float32）
+FIXED = 'fixed'      # 定点数，值 = 存储值 / PRICE_SCALE
+MINUTES = 'minutes'  # 分钟时间戳，值 = 存储值 * MINUTE_NS
+
+
+def _fits_int32(values):
+    return len(values) == 0 or (values.min() >= _INT32_MIN and values.max() <= _INT32_MAX)
+
+
+def _compact_dates(values):
+    """datetime64[ns] -> int32 分钟数"""
+    ns = values.view(np.int64)
+    if np.all(ns % MINUTE_NS == 0):
+        minutes = ns // MINUTE_NS
+        if _fits_int32(minutes):
+            return minutes.astype(np.int32), MINUTES
+    return ns.copy(), RAW
+
+
+def _compact_float(values):
+    """浮点价格 -> int32 分 / float32 / float64"""
+    if not np.all(np.isfinite(values)):
+        return values.copy(), RAW
+
+    if values.dtype == np.float64:
+        fixed = np.rint(values * PRICE_SCALE)
+        if _fits_int32(fixed) and np.array_equal(fixed / PRICE_SCALE, values):
+            return fixed.astype(np.int32), FIXED
+
+    single = values.astype(np.float32)
+    if np.array_equal(single.astype(values.dtype), values):
+        return single, RAW
+    return values.copy(), RAW
+
+
+def _compact_integer(values):
+    """整数成交量 -> uint32 / int32 / int64"""
+    if len(values) == 0 or (values.min() >= 0 and values.max() <= _UINT32_MAX):
+        return values.astype(np.uint32), RAW
+    if _fits_int32(values):
+        return values.astype(np.int32), RAW
+    return values.copy(), RAW
+
+
+def _compact_column(values):
+    """按 dtype 选择最小的无损编码，返回 (存储数组, 编码方式)"""
+    if values.dtype.kind == 'M':
+        return _compact_dates(values.astype('datetime64[ns]'))
+    if values.dtype.kind == 'f':
+        return _compact_float(values)
+    if values.dtype.kind in 'iu':
+        return _compact_integer(values)
+    return values.copy(), RAW
+
+
+class CompactFrame:
+    """紧凑存储的数据帧，可无损还原为 pandas DataFrame"""
+
+    def __init__(self, columns, encodings, dtypes):
+        self.columns = columns      # 列名 -> 存储数组
+        self.encodings = encodings  # 列名 -> 编码方式
+        self.dtypes = dtypes        # 列名 -> 原始 dtype
+
+    @classmethod
+    def from_frame(cls, df):
+        """压缩数据帧，数据帧的索引应为默认的 RangeIndex"""
+        columns, encodings, dtypes = {}, {}, {}
+        for name in df.columns:
+            values = df[name].to_numpy()
+            columns[name], encodings[name] = _compact_column(values)
+            dtypes[name] = values.dtype
+        return cls(columns, encodings, dtypes)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    @property
+    def nbytes(self):
+        """存储数组占用的字节数"""
+        return sum(values.nbytes for values in self.columns.values())
+
+    def column(self, name):
+        """还原单列为原始 dtype 的数组"""
+        values = self.columns[name]
+        encoding = self.encodings[name]
+        dtype = self.dtypes[name]
+        if encoding == MINUTES:
+            return (values.astype(np.int64) * MINUTE_NS).view('datetime64[ns]')
+        if encoding == FIXED:
+            return values.astype(np.float64) / PRICE_SCALE
+        if dtype.kind == 'M':
+            return values.view('datetime64[ns]')
+        return values.astype(dtype)
+
+    def to_frame(self):
+        """还原为与压缩前一致的数据帧"""
+        return pd.DataFrame({name: self.column(name) for name in self.columns}, columns=list(self.columns))
@@ -4,7 +4,11 @@
 数据源配置文件
 """
 
+import logging
 import os
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
 
 # 本地数据源配置
 # 用户可以修改这个路径指向自己的股票数据目录
@@ -13,14 +17,106 @@ LOCAL_DATA_PATH = r'E:\work\stock\data'
 # 如果指定路径不存在，则使用项目内的测试数据
 if not os.path.exists(LOCAL_DATA_PATH):
     LOCAL_DATA_PATH = os.path.join(os.path.dirname(__file__), 'test_data')
-    print(f"使用项目内测试数据: {LOCAL_DATA_PATH}")
+    logger.info("使用项目内测试数据: %s", LOCAL_DATA_PATH)
 else:
-    print(f"使用本地数据源: {LOCAL_DATA_PATH}")
+    logger.info("使用本地数据源: %s", LOCAL_DATA_PATH)
+
+# 二进制列缓存配置
+# 首次读取CSV后，将清洗后的列数据写入 .npz 文件，源文件修改时间或大小变化时自动失效
+BINARY_CACHE_ENABLED = True
+CACHE_PATH = os.path.join(LOCAL_DATA_PATH, '.ashare_cache')
+
+# 数据目录索引配置
+# 索引在首次使用时构建并保存到 {CACHE_PATH}/catalog.json，超过该秒数后自动重新扫描，0 表示不自动刷新
+CATALOG_REFRESH_INTERVAL = 60
+
+# 进程内数据缓存配置
+# 已清洗的 (股票, 年份) 数据帧缓存在内存中，超过该字节数时按最近最少使用淘汰
+FRAME_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# 启用后缓存中的数据以紧凑类型保存（价格为 int32 分，时间为 int32 分钟），
+# 内存占用约减半，同样的预算可以缓存更多年份，每次读取时需还原为数据帧
+COMPACT_FRAME_CACHE = False
+
+# 最近N根K线配置（/api/kline/latest）
+# 每个 (股票, 频率) 的增量聚合器按估算大小计入该字节数，超过时按最近最少使用淘汰
+LATEST_BARS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# 末尾读取配置
+# 只请求最近若干根K线且年份文件尚未缓存时，从CSV末尾向前按块读取，首块大小为 TAIL_READ_BLOCK_SIZE 字节
+TAIL_READ_ENABLED = True
+TAIL_READ_BLOCK_SIZE = 256 * 1024
+
+# 多周期预聚合配置
+# 启用后 5m/15m/30m/60m/日/周/月线直接读取按 (股票, 年份) 预聚合的K线，保存在 {CACHE_PATH}/rollups/ 下，
+# 首次读取某一年时生成，源文件变化后自动重建；1分钟线始终读取原始数据
+ROLLUPS_ENABLED = True
+
+# 批量导入配置（python -m ashare_ingest）
+# 并行进程数，0 表示使用全部CPU核心
+INGEST_WORKERS = 0
+# 导入时是否把GBK等非UTF-8编码的CSV原地转换为UTF-8
+NORMALIZE_CSV_ENCODING = False
+
+# 多股票批量读取配置（batch_fetch.get_price_many）
+# 并行进程数，0 表示使用全部CPU核心，1 表示在当前进程中逐只读取
+BATCH_WORKERS = 0
+
+# 按股票的内存映射存储配置
+# 启用后首次查询某只股票时，把其所有年份数据合并为按时间排序的列文件，之后按日期二分定位切片
+SYMBOL_STORE_ENABLED = False
+
+# 交易日历配置
+# 休市日与半日市列表，每行一个日期，周末无需列出；文件不存在时只按周末判断交易日
+HOLIDAYS_FILE = os.path.join(os.path.dirname(__file__), 'trading_holidays.txt')
+
+# HTTP缓存与压缩配置
+# 结束时间早于最新数据日期的K线查询允许浏览器缓存的秒数，到期后凭 ETag 确认，数据未变化时返回304
+HISTORY_CACHE_MAX_AGE = 24 * 3600
+# 响应体不小于该字节数时按 Accept-Encoding 压缩（gzip，安装 brotli 后优先使用 br）
+COMPRESSION_MIN_SIZE = 1024
+
+# K线响应缓存配置
+# 按规范化查询缓存序列化后的响应体，总大小超过该字节数时按最近最少使用淘汰，0 表示不缓存
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# K线批量接口配置（/api/kline/batch）
+# 一次请求最多包含的查询数；同一股票的查询依次执行，不同股票由最多 KLINE_BATCH_THREADS 个线程并行读取
+KLINE_BATCH_MAX_SPECS = 200
+KLINE_BATCH_THREADS = 4
+
+# 分钟数据回放配置（/api/replay）
+# 两次推送之间的最短秒数，回放速度较快时每次推送多分钟的数据；速度上限为每秒 REPLAY_MAX_SPEED 分钟
+REPLAY_MIN_INTERVAL = 0.05
+REPLAY_MAX_SPEED = 2400
+# 连接断开后浏览器自动重连前等待的毫秒数，重连时凭 Last-Event-ID 从断开处继续
+REPLAY_RETRY_MS = 3000
+
+# Web服务日志配置
+# 日志经队列由后台线程写入，文件超过 LOG_MAX_BYTES 字节后轮转，保留 LOG_BACKUP_COUNT 个旧文件
+LOG_FILE = 'backend_debug.log'
+LOG_LEVEL = 'INFO'
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+# 每个请求一条记录，成功的请求按该比例抽样记录（1 表示全部记录）；出错或耗时超过 LOG_SLOW_REQUEST_MS 毫秒的请求总是记录
+LOG_SAMPLE_RATE = 1.0
+LOG_SLOW_REQUEST_MS = 1000
+
+# 多进程生产服务配置（python -m ashare_serve）
+# 工作进程数，0 表示使用全部CPU核心；Windows 不支持 fork，始终以单进程多线程运行
+SERVE_WORKERS = 0
+SERVE_HOST = '0.0.0.0'
+SERVE_PORT = 5000
+# 创建工作进程之前预先加载到内存缓存的股票，各工作进程以写时复制方式共享这些数据；'*' 表示全部股票。
+# 每只股票加载最近 PRELOAD_YEARS 年（0 表示全部年份），总量受 FRAME_CACHE_MAX_BYTES 限制，
+# 该预算按进程计算，预加载部分由所有工作进程共享，之后各进程新加载的数据各占一份
+PRELOAD_CODES = []
+PRELOAD_YEARS = 1
 
 # 数据文件格式配置
 CSV_COLUMNS = ['日期', '代码', '开盘价', '最高价', '最低价', '收盘价', '成交量（手）', '成交额（元）']
 
 # 股票代码映射配置
+@lru_cache(maxsize=4096)
 def get_stock_filename(code):
     """
     根据股票代码生成文件名
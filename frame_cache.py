@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按字节预算限制的进程内LRU缓存
+
+每个条目带有一个签名（如源文件的 (mtime_ns, size)），读取时签名不一致即视为失效。
+超出字节预算时按最近最少使用顺序淘汰。
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ByteLRUCache:
+    """按字节预算淘汰的LRU缓存，线程安全"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (signature, value, nbytes)
+        self._lock = threading.Lock()
+
+    def get(self, key, signature=None):
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+            signature: 当前签名，与写入时不一致则删除该条目
+
+        Returns:
+            缓存值，未命中时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry[0] != signature:
+                self._remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, nbytes, signature=None):
+        """
+        写入缓存，超出预算时淘汰最久未使用的条目
+
+        Returns:
+            bool: 是否写入（单个值超过总预算时不缓存）
+        """
+        if nbytes > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (signature, value, nbytes)
+            self.current_bytes += nbytes
+
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, key):
+        """删除指定条目"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        """清空缓存，不重置计数"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def _remove(self, key):
+        signature, value, nbytes = self._entries.pop(key)
+        self.current_bytes -= nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
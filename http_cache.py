@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K线接口的条件请求与响应压缩
+
+K线数据完全由数据文件决定，因此 ETag 和 Last-Modified 直接由数据目录索引中相关年份文件的
+(修改时间, 大小) 与请求参数计算，不需要读取或聚合数据：
+
+    validators = kline_validators(code, end, query)    # 没有本地数据时为None
+    if validators and is_not_modified(request, validators):
+        return set_cache_headers(Response(status=304), validators)
+
+结束时间早于最新数据所在日期的查询为"已收盘的历史区间"，允许浏览器缓存 HISTORY_CACHE_MAX_AGE 秒；
+其余查询每次都需要向服务器确认（no-cache），数据未变化时只返回304。
+指定了结束时间的查询只依赖不晚于结束年份的文件，当年文件追加数据不会使更早的历史区间失效。
+
+compress_response() 在 after_request 中对 JSON、二进制K线和静态文本文件按 Accept-Encoding 压缩，
+安装了 brotli 时优先使用 br，否则使用 gzip。
+"""
+
+import gzip
+import hashlib
+from datetime import datetime, timezone
+
+import pandas as pd
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from catalog import get_catalog
+from config import COMPRESSION_MIN_SIZE, HISTORY_CACHE_MAX_AGE
+from kline_binary import MIME_TYPE as KLINE_MIME_TYPE
+
+# 响应内容的格式版本，序列化方式或聚合规则变化时递增，使客户端已缓存的响应失效
+RESPONSE_VERSION = 1
+
+# 压缩等级：gzip 为 1-9，brotli 为 0-11
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# 需要压缩的响应类型
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    KLINE_MIME_TYPE,
+    'application/javascript',
+    'text/javascript',
+    'text/css',
+    'text/html',
+    'text/plain',
+}
+
+
+def _parse_end(end):
+    """结束时间参数 -> Timestamp，未指定或无法解析时返回None"""
+    if not end:
+        return None
+    try:
+        return pd.Timestamp(end)
+    except (ValueError, TypeError):
+        return None
+
+
+def kline_validators(code, end, query):
+    """
+    由数据目录索引计算K线响应的缓存校验信息
+
+    Args:
+        code: 股票代码
+        end: 查询的结束时间（end_date 或 before），未指定表示查询到最新数据
+        query: 决定响应内容的规范化查询参数（包括返回格式），repr 结果需稳定
+
+    Returns:
+        tuple: (etag, last_modified, closed)，closed 表示查询区间已早于最新数据所在日期；
+            没有本地数据时返回None（将从网络获取，不做缓存）
+    """
+    catalog = get_catalog()
+    end_time = _parse_end(end)
+    signatures = catalog.signatures(code, end_time.year if end_time is not None else None)
+    if not signatures:
+        return None
+
+    key = repr((RESPONSE_VERSION, signatures, query))
+    etag = hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+    last_modified = datetime.fromtimestamp(max(mtime_ns for year, mtime_ns, size in signatures) // 10 ** 9,
+                                           tz=timezone.utc)
+
+    latest = catalog.latest_timestamp(code)
+    closed = end_time is not None and latest is not None and \
+        end_time.normalize() < pd.Timestamp(latest).normalize()
+    return etag, last_modified, closed
+
+
+def is_not_modified(request, validators):
+    """客户端缓存的响应是否仍然有效；同时带 If-None-Match 和 If-Modified-Since 时只看前者"""
+    etag, last_modified, closed = validators
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def set_cache_headers(response, validators):
+    """设置 ETag、Last-Modified 和 Cache-Control"""
+    etag, last_modified, closed = validators
+    # 同一内容可能以不同压缩方式传输，使用弱校验
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    if closed:
+        response.cache_control.public = True
+        response.cache_control.max_age = HISTORY_CACHE_MAX_AGE
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def choose_encoding(accept_encodings):
+    """按 Accept-Encoding 选择压缩方式，都不接受时返回None"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response, accept_encodings):
+    """
+    按客户端接受的方式压缩响应体，供 after_request 使用
+
+    只处理状态码200、类型可压缩且尚未压缩的响应；小于 COMPRESSION_MIN_SIZE 字节的响应不压缩。
+    """
+    if response.status_code != 200 or 'Content-Encoding' in response.headers or \
+            response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    # 静态文件以文件流返回，需要先读入内存
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+
+    if encoding == 'br':
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+
+    # 压缩后字节不同，强校验的 ETag（静态文件）改为弱校验
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
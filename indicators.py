@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务端技术指标计算（MyTT）
+
+指标用 names 参数指定，逗号分隔，指标名后可用冒号跟参数，省略的参数取 MyTT 的默认值：
+
+    MA:5,MA:10,MACD,KDJ:9:3:3,BOLL
+
+每个指标对整段K线的 NumPy 列向量化计算一次，结果按K线时间以列式JSON返回：
+
+    {"t": ["2024-01-02 00:00:00", ...],
+     "MA:5": [null, null, null, null, 10.12, ...],
+     "MACD": {"DIF": [...], "DEA": [...], "MACD": [...]}}
+
+只有一个输出的指标为数组，多个输出的指标为 {输出名: 数组}；数据不足的位置为 null。
+"""
+
+import inspect
+
+import numpy as np
+
+import MyTT
+from kline_json import date_strings, number_strings
+
+# 指标名 -> (MyTT 函数, 输入列, 输出名)，输出名为 None 表示只有一个输出
+INDICATORS = {
+    'MA': (MyTT.MA, ('close',), None),
+    'EMA': (MyTT.EMA, ('close',), None),
+    'MACD': (MyTT.MACD, ('close',), ('DIF', 'DEA', 'MACD')),
+    'KDJ': (MyTT.KDJ, ('close', 'high', 'low'), ('K', 'D', 'J')),
+    'RSI': (MyTT.RSI, ('close',), None),
+    'WR': (MyTT.WR, ('close', 'high', 'low'), ('WR', 'WR1')),
+    'BIAS': (MyTT.BIAS, ('close',), ('BIAS1', 'BIAS2', 'BIAS3')),
+    'BOLL': (MyTT.BOLL, ('close',), ('UPPER', 'MID', 'LOWER')),
+    'PSY': (MyTT.PSY, ('close',), ('PSY', 'PSYMA')),
+    'CCI': (MyTT.CCI, ('close', 'high', 'low'), None),
+    'ATR': (MyTT.ATR, ('close', 'high', 'low'), None),
+    'BBI': (MyTT.BBI, ('close',), None),
+    'DMI': (MyTT.DMI, ('close', 'high', 'low'), ('PDI', 'MDI', 'ADX', 'ADXR')),
+    'TAQ': (MyTT.TAQ, ('high', 'low'), ('UP', 'MID', 'DOWN')),
+    'TRIX': (MyTT.TRIX, ('close',), ('TRIX', 'TRMA')),
+    'VR': (MyTT.VR, ('close', 'volume'), None),
+    'EMV': (MyTT.EMV, ('high', 'low', 'volume'), ('EMV', 'MAEMV')),
+    'DPO': (MyTT.DPO, ('close',), ('DPO', 'MADPO')),
+    'BRAR': (MyTT.BRAR, ('open', 'close', 'high', 'low'), ('AR', 'BR')),
+    'DMA': (MyTT.DMA, ('close',), ('DIF', 'DIFMA')),
+    'MTM': (MyTT.MTM, ('close',), ('MTM', 'MTMMA')),
+    'ROC': (MyTT.ROC, ('close',), ('ROC', 'MAROC')),
+}
+
+# 可取小数的参数（倍数），其余参数都是周期，须为整数
+FLOAT_PARAMETERS = {'BOLL': ('P',)}
+
+# 指标值保留的小数位数
+DECIMALS = 4
+
+
+def _parameters(name):
+    """指标函数除输入列以外的参数"""
+    function, inputs, outputs = INDICATORS[name]
+    return list(inspect.signature(function).parameters.values())[len(inputs):]
+
+
+def _parameter_counts(name):
+    """指标参数的 (必填个数, 最多个数)"""
+    parameters = _parameters(name)
+    required = sum(1 for parameter in parameters if parameter.default is inspect.Parameter.empty)
+    return required, len(parameters)
+
+
+def _parse_number(text):
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+
+def parse_indicator_specs(names):
+    """
+    解析 names 参数
+
+    Args:
+        names: 如 'MA:5,MA:10,MACD,BOLL:20:2'
+
+    Returns:
+        tuple: ((指标名, (参数, ...)), ...)，去掉重复的指标，可作为缓存键
+
+    Raises:
+        ValueError: 指标名不支持或参数不合法
+    """
+    specs = []
+    for item in names.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, *params = item.split(':')
+        name = name.strip().upper()
+        if name not in INDICATORS:
+            raise ValueError(f"不支持的指标: {name}，支持 {', '.join(INDICATORS)}")
+        try:
+            params = tuple(_parse_number(param) for param in params)
+        except ValueError:
+            raise ValueError(f"指标参数应为数字: {item}")
+        required, maximum = _parameter_counts(name)
+        if not required <= len(params) <= maximum:
+            expected = required if required == maximum else f"{required}~{maximum}"
+            raise ValueError(f"指标 {name} 需要 {expected} 个参数: {item}")
+        if any(param <= 0 for param in params):
+            raise ValueError(f"指标参数应为正数: {item}")
+        if any(isinstance(param, float) and parameter.name not in FLOAT_PARAMETERS.get(name, ())
+               for parameter, param in zip(_parameters(name), params)):
+            raise ValueError(f"指标参数应为整数: {item}")
+        spec = (name, params)
+        if spec not in specs:
+            specs.append(spec)
+    if not specs:
+        raise ValueError('未指定指标')
+    return tuple(specs)
+
+
+def spec_key(spec):
+    """(指标名, 参数) -> 返回结果中的键，如 'MA:5'、'MACD'"""
+    name, params = spec
+    return ':'.join([name, *map(str, params)])
+
+
+def compute_indicators(df, specs):
+    """
+    计算技术指标
+
+    Args:
+        df: 以日期为索引、包含 open/close/high/low/volume 列的数据帧（get_price 的返回格式）
+        specs: parse_indicator_specs 的返回值
+
+    Returns:
+        dict: {键: 数组} 或 {键: {输出名: 数组}}，数组与 df 的行一一对应
+    """
+    columns = {column: df[column].to_numpy(dtype=np.float64) for column in ('open', 'close', 'high', 'low', 'volume')}
+    results = {}
+    # 数据不足或分母为0时产生 NaN/无穷大，返回时写为 null
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for spec in specs:
+            name, params = spec
+            function, inputs, outputs = INDICATORS[name]
+            values = function(*(columns[column] for column in inputs), *params)
+            if outputs is None:
+                results[spec_key(spec)] = np.asarray(values, dtype=np.float64)
+            else:
+                results[spec_key(spec)] = {output: np.asarray(value, dtype=np.float64)
+                                           for output, value in zip(outputs, values)}
+    return results
+
+
+def _json_array(values):
+    return '[' + ','.join(number_strings(np.round(values, DECIMALS))) + ']'
+
+
+def indicators_to_json(df, results):
+    """把 compute_indicators 的结果和K线时间序列化为列式JSON"""
+    parts = ['"t":[' + ','.join('"%s"' % date for date in date_strings(df.index)) + ']']
+    for key, value in results.items():
+        if isinstance(value, dict):
+            value = '{' + ','.join(f'"{output}":{_json_array(array)}' for output, array in value.items()) + '}'
+        else:
+            value = _json_array(value)
+        parts.append(f'"{key}":{value}')
+    return '{' + ','.join(parts) + '}'
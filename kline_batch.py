@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K线批量查询（/api/kline/batch）
+
+    results = fetch_batch([
+        {'code': 'sh600000', 'frequency': '1d', 'count': 100},
+        {'code': 'sz000001', 'frequency': '60m', 'count': 1000, 'start_date': '2024-03-01'},
+    ], layout='columnar')
+    body = batch_to_json(results)  # {"results": [{"data": ...}, {"data": ...}]}
+
+每项查询先按规范化查询查找响应缓存，未命中时读取本地数据并写入缓存，与 /api/kline 共用缓存条目。
+同一股票的查询在同一线程中依次执行，后面的查询直接使用前面读入内存缓存的年份数据，
+不同股票由线程池（KLINE_BATCH_THREADS 个线程）并行读取。
+批量查询只读取本地数据，没有本地数据或读取失败的查询在结果中为 {"error": ...}，不影响其他查询。
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import Ashare
+from config import KLINE_BATCH_THREADS, get_stock_filename
+from kline_json import kline_to_json
+from response_cache import canonical_query, lookup_response, store_response
+
+_executor = ThreadPoolExecutor(max_workers=KLINE_BATCH_THREADS, thread_name_prefix='kline-batch')
+
+
+def fetch_kline_json(spec, layout):
+    """
+    读取一项查询并序列化为JSON
+
+    Args:
+        spec: {'code', 'frequency', 'count', 'start_date', 'end_date', 'before'}，后三项可省略
+        layout: 'rows' 或 'columnar'
+
+    Returns:
+        dict: {'body': JSON字节串, 'next_before': 下一页游标或None, 'cache': 'hit' 或 'miss'}
+
+    Raises:
+        Exception: 查询参数错误、没有本地数据或读取失败
+    """
+    code, frequency, count = spec['code'], spec['frequency'], spec['count']
+    start_date, end_date, before = spec.get('start_date') or '', spec.get('end_date') or '', spec.get('before')
+
+    query = canonical_query(code, frequency, count, start_date=start_date, end_date=end_date, before=before)
+    if query is None:
+        raise ValueError(f"日期格式错误: {start_date or end_date or before}")
+    cached, signature = lookup_response(query, layout)
+    if signature is None:
+        raise ValueError(f"没有本地数据: {code}")
+    if cached is not None:
+        body, mimetype, headers = cached
+        return {'body': body, 'next_before': headers.get('X-Next-Before'), 'cache': 'hit'}
+
+    if before:
+        df = Ashare.read_local_bars_before(code, before, count=count, frequency=frequency)
+    else:
+        df = Ashare.read_local_bars(code, frequency=frequency, count=count, end_date=end_date, start_date=start_date)
+    df = df.sort_index()
+
+    body = kline_to_json(df, layout)
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    headers = {}
+    if before and not df.empty:
+        headers['X-Next-Before'] = df.index[0].strftime('%Y-%m-%d %H:%M:%S')
+    # 空结果不缓存：/api/kline 在本地没有数据时会改为从网络获取
+    if not df.empty:
+        store_response(query, layout, signature, body, 'application/json', headers)
+    return {'body': body, 'next_before': headers.get('X-Next-Before'), 'cache': 'miss'}
+
+
+def fetch_batch(specs, layout='rows'):
+    """
+    执行一组查询，同一股票的查询依次执行，不同股票并行
+
+    Returns:
+        list: 与 specs 一一对应，成功时为 fetch_kline_json 的返回值，失败时为 {'error': 错误信息}
+    """
+    groups = {}
+    for index, spec in enumerate(specs):
+        market, stock_code, filename = get_stock_filename(spec['code'])
+        groups.setdefault((market, stock_code), []).append(index)
+
+    results = [None] * len(specs)
+
+    def run(indexes):
+        for index in indexes:
+            try:
+                results[index] = fetch_kline_json(specs[index], layout)
+            except Exception as e:
+                results[index] = {'error': f"{type(e).__name__}: {e}"}
+
+    if len(groups) <= 1:
+        for indexes in groups.values():
+            run(indexes)
+    else:
+        for future in [_executor.submit(run, indexes) for indexes in groups.values()]:
+            future.result()
+    return results
+
+
+def batch_to_json(results):
+    """把 fetch_batch 的结果拼接为一个JSON响应体，各项的K线JSON直接拼接，不重新序列化"""
+    parts = []
+    for result in results:
+        if 'error' in result:
+            parts.append(json.dumps({'error': result['error']}, ensure_ascii=False).encode('utf-8'))
+            continue
+        item = b'{"data":' + result['body']
+        if result['next_before']:
+            item += b',"next_before":"' + result['next_before'].encode('ascii') + b'"'
+        parts.append(item + b'}')
+    return b'{"results":[' + b','.join(parts) + b']}'
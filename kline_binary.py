@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K线数据的二进制格式（application/x-ashare-kline）
+
+浏览器可直接用 TypedArray 读取，无需解析文本。所有数值均为小端序，n 为K线数量：
+
+    偏移    类型              内容
+    0       char[4]           魔数 'AKLN'
+    4       uint16            格式版本，当前为 1
+    6       uint16            标志位，bit0 为1时价格为 float64，否则为 float32
+    8       uint32            K线数量 n
+    12      uint32            保留，为0
+    16      int64[n]          K线时间，秒（北京时间按UTC计的时间戳，与 JSON 中的日期字符串一一对应）
+    16+8n   float64[n]        成交量
+    16+16n  price[n] x 4      开盘价、最高价、最低价、收盘价，依次排列
+
+价格默认用 float32 传输，解码时四舍五入到3位小数；只有当这样无法还原原始价格时才改用 float64。
+"""
+
+import struct
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'AKLN'
+FORMAT_VERSION = 1
+MIME_TYPE = 'application/x-ashare-kline'
+
+# 标志位：价格为 float64
+FLAG_FLOAT64_PRICES = 1
+
+# float32 价格解码时保留的小数位数
+PRICE_DECIMALS = 3
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+
+_HEADER = struct.Struct('<4sHHII')
+
+
+def _price_dtype(prices):
+    """价格能否用 float32 传输并在解码时无损还原"""
+    restored = np.round(prices.astype('<f4').astype(np.float64), PRICE_DECIMALS)
+    return '<f4' if np.array_equal(restored, prices, equal_nan=True) else '<f8'
+
+
+def pack_kline(df):
+    """
+    把K线数据帧打包为二进制格式
+
+    Args:
+        df: 以日期为索引、包含 open/close/high/low/volume 列的数据帧（get_price 的返回格式）
+
+    Returns:
+        bytes
+    """
+    count = len(df)
+    seconds = pd.DatetimeIndex(df.index).values.astype('datetime64[s]').view(np.int64)
+    prices = np.vstack([df[column].to_numpy(dtype=np.float64) for column in PRICE_COLUMNS]) if count else \
+        np.empty((len(PRICE_COLUMNS), 0))
+    price_dtype = _price_dtype(prices)
+    flags = FLAG_FLOAT64_PRICES if price_dtype == '<f8' else 0
+
+    return b''.join([
+        _HEADER.pack(MAGIC, FORMAT_VERSION, flags, count, 0),
+        seconds.astype('<i8').tobytes(),
+        df['volume'].to_numpy(dtype='<f8').tobytes(),
+        prices.astype(price_dtype).tobytes(),
+    ])
+
+
+def unpack_kline(data):
+    """
+    解析二进制格式，返回与 pack_kline 输入格式相同的数据帧（供 Python 客户端和测试使用）
+
+    Raises:
+        ValueError: 数据格式不正确
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("数据长度不足")
+    magic, version, flags, count, reserved = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"不支持的数据格式: {magic!r} 版本 {version}")
+
+    price_dtype = '<f8' if flags & FLAG_FLOAT64_PRICES else '<f4'
+    offset = _HEADER.size
+    seconds = np.frombuffer(data, dtype='<i8', count=count, offset=offset)
+    offset += 8 * count
+    volume = np.frombuffer(data, dtype='<f8', count=count, offset=offset)
+    offset += 8 * count
+    prices = np.frombuffer(data, dtype=price_dtype, count=count * len(PRICE_COLUMNS), offset=offset)
+    prices = prices.astype(np.float64).reshape(len(PRICE_COLUMNS), count)
+    if price_dtype == '<f4':
+        prices = np.round(prices, PRICE_DECIMALS)
+
+    columns = dict(zip(PRICE_COLUMNS, prices))
+    df = pd.DataFrame({column: columns[column] for column in ['open', 'close', 'high', 'low']},
+                      index=pd.DatetimeIndex(seconds.astype('datetime64[s]').astype('datetime64[ns]')))
+    df['volume'] = volume
+    df.index.name = ''
+    return df
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K线数据的JSON序列化
+
+    rows      [{"date": "2024-01-02 10:30:00", "open": 10.0, "close": 10.2, "low": 9.8, "high": 10.5, "volume": 1000.0}, ...]
+    columnar  {"t": ["2024-01-02 10:30:00", ...], "o": [...], "h": [...], "l": [...], "c": [...], "v": [...]}
+
+rows 为 /api/kline 的默认格式，columnar 需通过 format=columnar 指定，体积更小、前端解析更快。
+两种格式都由 NumPy 列直接生成JSON文本，不逐行构造字典；有限数字的写法与 json.dumps 相同，
+NaN 和无穷大写为 null（与 orjson 一致，json.dumps 写出的 NaN 不是合法的JSON）。
+安装了 orjson 时，columnar 格式改用 orjson 序列化。
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 支持的输出格式
+LAYOUTS = ('rows', 'columnar')
+
+# 行格式的字段顺序与 (列名, 列式格式中的键)
+ROW_FIELDS = [('open', 'o'), ('close', 'c'), ('low', 'l'), ('high', 'h'), ('volume', 'v')]
+
+_ROW_TEMPLATE = '{"date":"%s","open":%s,"close":%s,"low":%s,"high":%s,"volume":%s}'
+
+
+def date_strings(index):
+    """日期索引 -> 'YYYY-MM-DD HH:MM:SS' 字符串列表"""
+    if not isinstance(index, pd.DatetimeIndex):
+        return [str(value) for value in index]
+    text = np.datetime_as_string(index.values.astype('datetime64[s]'), unit='s')
+    return np.char.replace(text, 'T', ' ').tolist()
+
+
+def number_strings(values):
+    """数值列 -> JSON数字字符串列表，NaN/无穷大写为 null"""
+    values = np.asarray(values, dtype=np.float64)
+    text = values.astype(str)
+    finite = np.isfinite(values)
+    if not finite.all():
+        text = text.astype(object)
+        text[~finite] = 'null'
+    return text.tolist()
+
+
+def kline_to_json(df, layout='rows'):
+    """
+    把K线数据帧序列化为JSON
+
+    Args:
+        df: 以日期为索引、包含 open/close/high/low/volume 列的数据帧（get_price 的返回格式）
+        layout: 'rows' 或 'columnar'
+
+    Returns:
+        str 或 bytes: JSON文本
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"不支持的格式: {layout}")
+
+    dates = date_strings(df.index)
+
+    if layout == 'columnar':
+        if orjson is not None:
+            columns = {'t': dates}
+            for column, key in ROW_FIELDS:
+                columns[key] = np.ascontiguousarray(df[column].to_numpy(dtype=np.float64))
+            return orjson.dumps(columns, option=orjson.OPT_SERIALIZE_NUMPY)
+
+        parts = ['"t":[' + ','.join('"%s"' % date for date in dates) + ']']
+        for column, key in ROW_FIELDS:
+            parts.append(f'"{key}":[' + ','.join(number_strings(df[column].to_numpy())) + ']')
+        return '{' + ','.join(parts) + '}'
+
+    columns = [number_strings(df[column].to_numpy()) for column, key in ROW_FIELDS]
+    return '[' + ','.join(_ROW_TEMPLATE % row for row in zip(dates, *columns)) + ']'
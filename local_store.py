@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地数据读取层
+
+负责把 {LOCAL_DATA_PATH}/{year}/{MARKET}.{code}.csv 解析为清洗后的分钟级数据，
+并把解析结果以列式二进制格式(.npz)缓存到 CACHE_PATH 下，
+后续读取直接加载列数组，跳过文本解析。
+已加载的数据帧同时保存在进程内的LRU缓存中，由 FRAME_CACHE_MAX_BYTES 限制内存占用，
+启用 COMPACT_FRAME_CACHE 时以紧凑类型保存（见 compact_frame.py）。
+只需要最近若干根K线且文件尚未缓存时，从文件末尾向前分块读取，不解析整个文件。
+文件编码在数据目录索引中识别并记录，解析时直接使用，不再逐个编码试错。
+"""
+
+import io
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from config import (BINARY_CACHE_ENABLED, CACHE_PATH, COMPACT_FRAME_CACHE, FRAME_CACHE_MAX_BYTES,
+                    TAIL_READ_ENABLED, TAIL_READ_BLOCK_SIZE, get_stock_filename, get_data_file_path)
+from frame_cache import ByteLRUCache
+from compact_frame import CompactFrame
+from catalog import CSV_ENCODINGS, ENCODING_SNIFF_BYTES, get_catalog, sniff_encoding
+
+logger = logging.getLogger(__name__)
+
+# 缓存文件格式版本，格式变化时递增以使旧缓存失效
+CACHE_FORMAT_VERSION = 1
+
+# 清洗后数据帧的列
+FRAME_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume']
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+# 各周期每个交易日产生的K线数量估计（A股每天240分钟交易时间）
+BARS_PER_DAY = {
+    '1m': 240,
+    '5m': 48,
+    '15m': 16,
+    '30m': 8,
+    '60m': 4,
+    '1d': 1,
+    '1w': 1 / 5,
+    '1M': 1 / 21,
+}
+
+DAY_NS = 24 * 60 * 60 * 10 ** 9
+
+# 允许只读取文件末尾的目标周期
+TAIL_READ_FREQUENCIES = ('1m', '5m', '15m', '30m', '60m', '1d')
+
+# 已清洗的 (市场, 代码, 年份) 数据帧缓存，签名为源文件的 (mtime_ns, size)
+frame_cache = ByteLRUCache(FRAME_CACHE_MAX_BYTES)
+
+
+def get_cache_file_path(code, year):
+    """
+    获取某只股票某一年数据的二进制缓存文件路径
+
+    Args:
+        code: 股票代码
+        year: 年份
+
+    Returns:
+        str: 缓存文件路径，如 {CACHE_PATH}/2024/SH.600000.npz
+    """
+    market, stock_code, filename = get_stock_filename(code)
+    return os.path.join(CACHE_PATH, str(year), f"{market}.{stock_code}.npz")
+
+
+def list_data_years(code):
+    """
+    列出某只股票存在数据文件的年份（来自数据目录索引，不访问文件系统）
+
+    Args:
+        code: 股票代码
+
+    Returns:
+        list: 升序排列的年份列表
+    """
+    return get_catalog().years(code)
+
+
+def get_source_signature(file_path):
+    """返回源文件的 (mtime_ns, size)，用于判断缓存是否失效"""
+    stat = os.stat(file_path)
+    return int(stat.st_mtime_ns), int(stat.st_size)
+
+
+def _read_csv(source, encoding=None):
+    """
+    读取CSV（文件路径或原始字节）
+
+    已知编码时只解析一次；编码未知或解码失败时依次尝试常见编码。
+
+    Returns:
+        tuple: (原始DataFrame, 实际使用的编码)
+    """
+    encodings = list(CSV_ENCODINGS)
+    if encoding:
+        encodings = [encoding] + [candidate for candidate in encodings if candidate != encoding]
+
+    for candidate in encodings:
+        try:
+            if isinstance(source, bytes):
+                return pd.read_csv(io.BytesIO(source), encoding=candidate), candidate
+            return pd.read_csv(source, encoding=candidate), candidate
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("无法解码文件")
+
+
+def clean_csv_frame(df_year):
+    """
+    清洗刚读取的原始CSV数据
+
+    Returns:
+        DataFrame: 包含 date/open/high/low/close/volume 列的数据；列数不足时返回None
+    """
+    # 检查列数，确保数据格式正确
+    if len(df_year.columns) < 7:
+        return None
+
+    # 重命名列以匹配原有格式
+    df_year.columns = ['date', 'code', 'open', 'high', 'low', 'close', 'volume', 'amount'][:len(df_year.columns)]
+
+    # 转换数据类型
+    df_year['date'] = pd.to_datetime(df_year['date'])
+    for column in PRICE_COLUMNS:
+        df_year[column] = pd.to_numeric(df_year[column], errors='coerce')
+
+    # 过滤掉无效数据
+    df_year = df_year.dropna()
+
+    return df_year[FRAME_COLUMNS].reset_index(drop=True)
+
+
+def parse_csv_file(file_path, encoding=None):
+    """
+    解析单个年份的CSV文件并清洗
+
+    Args:
+        file_path: CSV文件路径
+        encoding: 已知的文件编码，None 时依次尝试
+
+    Returns:
+        DataFrame: 包含 date/open/high/low/close/volume 列的数据；列数不足时返回None
+    """
+    df_year, encoding = _read_csv(file_path, encoding)
+    return clean_csv_frame(df_year)
+
+
+def normalize_csv_encoding(file_path, encoding=None):
+    """
+    把非UTF-8编码的CSV文件原地转换为UTF-8（先写临时文件再替换）
+
+    Args:
+        file_path: CSV文件路径
+        encoding: 已知的文件编码，None 时根据文件开头识别
+
+    Returns:
+        bool: 是否进行了转换
+    """
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+
+    if encoding is None:
+        encoding = sniff_encoding(raw[:ENCODING_SNIFF_BYTES])
+    if encoding is None:
+        raise ValueError(f"无法识别文件编码: {file_path}")
+    if encoding == 'utf-8':
+        return False
+
+    text = raw.decode(encoding)
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(file_path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(text.encode('utf-8'))
+        os.replace(tmp_path, file_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return True
+
+
+def read_csv_tail(file_path, bars_needed, frequency, encoding=None):
+    """
+    从CSV文件末尾向前分块读取，估算的K线数量足够时停止，不解析文件前面的部分
+
+    每次读取的块大小翻4倍；块开头不完整的一行会被丢弃，表头从文件开头单独读取。
+    块内第一天的数据可能不完整，不计入估算。
+
+    Args:
+        file_path: CSV文件路径
+        bars_needed: 需要的K线数量
+        frequency: 目标频率
+        encoding: 已知的文件编码
+
+    Returns:
+        tuple: (清洗后的DataFrame或None, 是否已读到文件开头)
+    """
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        data_start = f.tell()
+        size = f.seek(0, os.SEEK_END)
+        block_size = TAIL_READ_BLOCK_SIZE
+
+        while True:
+            offset = max(data_start, size - block_size)
+            f.seek(offset)
+            chunk = f.read(size - offset)
+            complete = offset == data_start
+            if not complete:
+                chunk = chunk[chunk.find(b'\n') + 1:]
+
+            df, encoding = _read_csv(header + chunk, encoding)
+            df = clean_csv_frame(df)
+            if df is None or complete:
+                return df, complete
+
+            dates = df['date'].values.view(np.int64)
+            if len(dates):
+                days = dates // DAY_NS
+                if estimate_bar_count(dates[days > days.min()], frequency) >= bars_needed:
+                    return df, False
+
+            block_size *= 4
+
+
+def _load_binary_cache(cache_path, signature):
+    """加载二进制缓存，缓存不存在、版本不符或源文件已变化时返回None"""
+    try:
+        with np.load(cache_path, allow_pickle=False) as data:
+            meta = data['meta']
+            if int(meta[0]) != CACHE_FORMAT_VERSION or (int(meta[1]), int(meta[2])) != signature:
+                return None
+            columns = {'date': data['date'].view('datetime64[ns]')}
+            for column in PRICE_COLUMNS:
+                columns[column] = data[column]
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("读取缓存文件 %s 失败: %s", cache_path, e)
+        return None
+
+    return pd.DataFrame(columns, columns=FRAME_COLUMNS)
+
+
+def _write_binary_cache(cache_path, signature, df):
+    """把清洗后的数据写入二进制缓存，先写临时文件再原子替换；返回是否写入成功"""
+    try:
+        cache_dir = os.path.dirname(cache_path)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        arrays = {
+            'meta': np.array([CACHE_FORMAT_VERSION, signature[0], signature[1]], dtype=np.int64),
+            'date': df['date'].values.astype('datetime64[ns]').view(np.int64),
+        }
+        for column in PRICE_COLUMNS:
+            arrays[column] = df[column].to_numpy()
+
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, cache_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+    except Exception as e:
+        logger.warning("写入缓存文件 %s 失败: %s", cache_path, e)
+        return False
+    return True
+
+
+def binary_cache_signature(code, year):
+    """
+    读取二进制缓存中记录的源文件签名，只加载元数据
+
+    Returns:
+        tuple: (mtime_ns, size)；缓存不存在、损坏或版本不符时返回None
+    """
+    try:
+        with np.load(get_cache_file_path(code, year), allow_pickle=False) as data:
+            meta = data['meta']
+            if int(meta[0]) != CACHE_FORMAT_VERSION:
+                return None
+            return int(meta[1]), int(meta[2])
+    except Exception:
+        return None
+
+
+def read_binary_cache(code, year, signature):
+    """
+    直接读取某只股票某一年的二进制缓存，不经过数据目录索引和内存缓存
+
+    Returns:
+        DataFrame: 缓存不存在或已过期时返回None
+    """
+    return _load_binary_cache(get_cache_file_path(code, year), tuple(signature))
+
+
+def convert_year_file(code, year, signature, encoding=None):
+    """
+    解析并清洗某只股票某一年的CSV，写入二进制缓存
+
+    不经过数据目录索引和内存缓存，供批量导入在子进程中调用。
+
+    Args:
+        code: 股票代码
+        year: 年份
+        signature: 源文件的 (mtime_ns, size)
+        encoding: 已知的文件编码
+
+    Returns:
+        dict: {'rows': 有效行数, 'dropped': 清洗掉的行数}；列数不足时返回None
+    """
+    df_raw, encoding = _read_csv(get_data_file_path(code, year), encoding)
+    raw_rows = len(df_raw)
+    df_year = clean_csv_frame(df_raw)
+    if df_year is None:
+        return None
+
+    cache_path = get_cache_file_path(code, year)
+    if not _write_binary_cache(cache_path, signature, df_year):
+        raise OSError(f"写入缓存文件 {cache_path} 失败")
+    return {'rows': len(df_year), 'dropped': raw_rows - len(df_year)}
+
+
+def _year_signature(code, year):
+    """从数据目录索引获取源文件签名，文件不存在时抛出 FileNotFoundError"""
+    signature = get_catalog().signature(code, year)
+    if signature is None:
+        raise FileNotFoundError(f"数据文件不存在: {get_data_file_path(code, year)}")
+    return signature
+
+
+def _year_cache_key(code, year):
+    market, stock_code, filename = get_stock_filename(code)
+    return market, stock_code, int(year)
+
+
+def _remember_year_frame(code, year, signature, df_year, write_binary=True):
+    """把解析结果写入二进制缓存和内存缓存"""
+    if BINARY_CACHE_ENABLED and write_binary:
+        _write_binary_cache(get_cache_file_path(code, year), signature, df_year)
+    if COMPACT_FRAME_CACHE:
+        compact = CompactFrame.from_frame(df_year)
+        frame_cache.put(_year_cache_key(code, year), compact, compact.nbytes, signature)
+    else:
+        frame_cache.put(_year_cache_key(code, year), df_year, int(df_year.memory_usage(index=True).sum()), signature)
+
+
+def peek_year_frame(code, year):
+    """
+    只从内存缓存和二进制缓存读取某只股票某一年的数据，不解析CSV
+
+    Returns:
+        DataFrame: 未缓存时返回None
+    """
+    signature = _year_signature(code, year)
+    df_year = frame_cache.get(_year_cache_key(code, year), signature)
+    if isinstance(df_year, CompactFrame):
+        return df_year.to_frame()
+    if df_year is not None:
+        return df_year
+
+    if BINARY_CACHE_ENABLED:
+        df_year = _load_binary_cache(get_cache_file_path(code, year), signature)
+        if df_year is not None:
+            _remember_year_frame(code, year, signature, df_year, write_binary=False)
+    return df_year
+
+
+def load_year_frame(code, year):
+    """
+    读取某只股票某一年的清洗后数据，依次使用内存缓存、二进制缓存、CSV解析
+
+    返回的数据帧可能被多个请求共享，调用方不应原地修改。
+
+    Args:
+        code: 股票代码
+        year: 年份
+
+    Returns:
+        DataFrame: 包含 date/open/high/low/close/volume 列的数据；文件格式不正确时返回None
+
+    Raises:
+        FileNotFoundError: 数据文件不存在
+    """
+    df_year = peek_year_frame(code, year)
+    if df_year is not None:
+        return df_year
+
+    catalog = get_catalog()
+    known_encoding = catalog.encoding(code, year)
+    df_year, encoding = _read_csv(get_data_file_path(code, year), known_encoding)
+    if encoding != known_encoding:
+        catalog.set_encoding(code, year, encoding)
+
+    df_year = clean_csv_frame(df_year)
+    if df_year is not None:
+        _remember_year_frame(code, year, _year_signature(code, year), df_year)
+    return df_year
+
+
+def estimate_bar_count(dates, frequency):
+    """
+    估算一段数据聚合到指定周期后能产生的K线数量
+
+    按交易日数乘以该周期每日K线数估算；数据本身比周期粗（如日线数据请求分钟线）时，
+    以每日实际行数为上限。
+
+    Args:
+        dates: int64 纳秒时间戳数组
+        frequency: 目标频率
+
+    Returns:
+        int: 估算的K线数量
+    """
+    if len(dates) == 0:
+        return 0
+
+    days = len(np.unique(np.asarray(dates) // DAY_NS))
+    bars_per_day = min(BARS_PER_DAY.get(frequency, 1), len(dates) / days)
+    return int(days * bars_per_day)
+
+
+def read_years_backward(code, end_year, bars_needed, frequency, end_timestamp=None):
+    """
+    从结束年份开始向前逐年读取，估算的K线数量足够时停止
+
+    尚未缓存的年份文件在条件允许时只从末尾读取所需部分（见 read_csv_tail）。
+
+    Args:
+        code: 股票代码
+        end_year: 结束年份
+        bars_needed: 需要的K线数量
+        frequency: 目标频率
+        end_timestamp: 结束时间，只统计该时间之前的数据
+
+    Returns:
+        tuple: (按年份升序的数据帧列表, 读取的年份列表)
+    """
+    frames = []
+    years = []
+    bars = 0
+    catalog = get_catalog()
+    for year in reversed(catalog.years(code)):
+        if year > end_year:
+            continue
+
+        df_year = None
+        if _can_tail_read(catalog.entry(code, year), frequency, end_timestamp):
+            df_year = peek_year_frame(code, year)
+            if df_year is None:
+                # 文件尚未缓存，只从末尾读取所需的部分
+                df_year, complete = read_csv_tail(get_data_file_path(code, year), bars_needed - bars, frequency,
+                                                  catalog.encoding(code, year))
+                if complete and df_year is not None:
+                    _remember_year_frame(code, year, _year_signature(code, year), df_year)
+        if df_year is None:
+            df_year = load_year_frame(code, year)
+
+        years.insert(0, year)
+        if df_year is None:
+            continue
+        frames.insert(0, df_year)
+
+        dates = df_year['date'].values.view(np.int64)
+        if end_timestamp is not None and year == end_year:
+            dates = dates[dates <= pd.Timestamp(end_timestamp).value]
+        bars += estimate_bar_count(dates, frequency)
+        if bars >= bars_needed:
+            break
+
+    return frames, years
+
+
+def _can_tail_read(record, frequency, end_timestamp):
+    """
+    判断某个年份文件能否只从末尾读取：未设截止时间或截止时间晚于文件最后一条数据，
+    且目标周期不超过日线（周线、月线的首根K线跨度太大，无法可靠判断是否完整）
+    """
+    if not TAIL_READ_ENABLED or frequency not in TAIL_READ_FREQUENCIES or record is None:
+        return False
+    if end_timestamp is None:
+        return True
+    return record.get('last') is not None and pd.Timestamp(record['last']) <= pd.Timestamp(end_timestamp)
+
+
+def get_frame_cache_stats():
+    """返回进程内数据帧缓存的统计信息"""
+    return frame_cache.stats()
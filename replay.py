@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分钟数据回放
+
+    for minute, bars in replay_batches('sh600000', '5m', after='2024-03-01 10:30:00', batch_minutes=10):
+        ...  # minute: 本批最后一分钟的时间；bars: 本批新建或更新过的K线，按时间顺序，每根K线只给出最终状态
+
+回放从 after 之后的第一分钟开始，按年份顺序读取分钟数据（年份数据帧通常已在内存缓存中），
+逐分钟推入 BarAggregator 得到目标周期的K线。after 落在某根K线中间时，先把这根K线已经发生的分钟
+推入聚合器，因此从任意位置续播时，正在形成的K线与不中断播放完全一致。
+回放位置只由 after 决定，暂停、跳转、改变速度都可以通过以新的 after 重新打开回放实现，服务端不保存会话。
+"""
+
+import numpy as np
+import pandas as pd
+
+from aggregation import bar_labels
+from bar_aggregator import BarAggregator
+from catalog import get_catalog
+from local_store import load_year_frame
+
+# 续播时向前查找当前K线已发生分钟的最大天数（月线最长跨越31天）
+SEED_LOOKBACK_DAYS = 31
+
+MINUTE_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume']
+
+
+def format_time(value):
+    """时间 -> 'YYYY-MM-DD HH:MM:SS'"""
+    return pd.Timestamp(value).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _year_minutes(code, year):
+    """某一年的分钟数据和 int64 纳秒时间数组"""
+    df_year = load_year_frame(code, year)
+    if df_year is None or df_year.empty:
+        return None, None
+    return df_year, df_year['date'].values.astype('datetime64[ns]').view(np.int64)
+
+
+def iter_minutes(code, after=None, end=None):
+    """
+    按时间顺序逐年产出晚于 after、不晚于 end 的分钟数据
+
+    Yields:
+        DataFrame: 某一年内的一段分钟数据，包含 date/open/high/low/close/volume 列
+    """
+    after = pd.Timestamp(after) if after is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    for year in get_catalog().years(code):
+        if after is not None and year < after.year:
+            continue
+        if end is not None and year > end.year:
+            break
+        df_year, dates = _year_minutes(code, year)
+        if df_year is None:
+            continue
+        lo = int(np.searchsorted(dates, after.value, side='right')) if after is not None else 0
+        hi = int(np.searchsorted(dates, end.value, side='right')) if end is not None else len(dates)
+        if lo < hi:
+            yield df_year.iloc[lo:hi][MINUTE_COLUMNS]
+
+
+def _seed_current_bar(aggregator, code, after):
+    """把 after 所在K线中不晚于 after 的分钟推入聚合器，不产生事件"""
+    after = pd.Timestamp(after)
+    frames = list(iter_minutes(code, after - pd.Timedelta(days=SEED_LOOKBACK_DAYS), after))
+    if not frames:
+        return
+    window = pd.concat(frames, ignore_index=True)
+    labels = bar_labels(window['date'].values.astype('datetime64[ns]').view(np.int64), aggregator.frequency)
+    for row in window[labels == labels[-1]].itertuples(index=False):
+        aggregator.push(*row)
+
+
+def replay_batches(code, frequency, after=None, end=None, batch_minutes=1):
+    """
+    回放某只股票的分钟数据，聚合为目标周期的K线
+
+    Args:
+        code: 股票代码
+        frequency: 目标频率，1m 时直接回放分钟K线
+        after: 从晚于该时间的第一分钟开始，None 表示从最早的数据开始
+        end: 回放到该时间为止（含），None 表示到最新数据
+        batch_minutes: 每批包含的分钟数
+
+    Yields:
+        tuple: (本批最后一分钟的时间字符串, [K线字典, ...])，K线字典包含 date/open/high/low/close/volume
+    """
+    aggregator = BarAggregator(frequency, max_bars=2)
+    if after is not None:
+        _seed_current_bar(aggregator, code, after)
+
+    batch = {}
+    count = 0
+    for df in iter_minutes(code, after, end):
+        for row in df.itertuples(index=False):
+            event = aggregator.push(*row)
+            count += 1
+            if event is not None:
+                bar = event['bar']
+                batch[bar['date']] = bar
+            if count >= batch_minutes:
+                yield format_time(row.date), _format_bars(batch)
+                batch = {}
+                count = 0
+    if count:
+        yield format_time(aggregator.last_minute), _format_bars(batch)
+
+
+def _format_bars(batch):
+    bars = []
+    for label in sorted(batch):
+        bar = dict(batch[label])
+        bar['date'] = format_time(label)
+        bars.append(bar)
+    return bars
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Web服务的异步日志与请求记录
+
+setup_logging() 把根日志改为只向内存队列投递记录，由后台线程写入按大小轮转的日志文件
+（LOG_FILE，超过 LOG_MAX_BYTES 后轮转，保留 LOG_BACKUP_COUNT 个旧文件）和控制台，
+请求线程不做文件或控制台I/O。
+
+install_request_logging(app) 之后每个请求只输出一条结构化记录（JSON）：
+
+    {"method": "GET", "path": "/api/kline", "status": 200, "ms": 12.4,
+     "params": {"code": "sh600000", "period": "60"}, "rows": 1000, "bytes": 20714,
+     "stages": {"read": 9.8, "serialize": 1.6}, "cache": "miss"}
+
+视图函数用 stage() 统计各阶段用时，用 note() 补充字段。成功的请求按 LOG_SAMPLE_RATE 抽样记录，
+出错（状态码 >= 400 或记录了 error 字段）和耗时超过 LOG_SLOW_REQUEST_MS 的请求总是记录。
+"""
+
+import atexit
+import json
+import logging
+import queue
+import random
+import time
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, has_request_context, request
+
+from config import LOG_BACKUP_COUNT, LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_SAMPLE_RATE, LOG_SLOW_REQUEST_MS
+
+# 请求记录使用的日志名
+REQUEST_LOGGER = 'request'
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+
+logger = logging.getLogger(REQUEST_LOGGER)
+
+_listener = None
+
+
+def setup_logging(log_file=LOG_FILE, level=LOG_LEVEL, log_queue=None):
+    """
+    配置根日志：记录经队列交给后台线程，写入轮转日志文件和控制台；重复调用时替换之前的配置
+
+    Args:
+        log_file: 日志文件路径
+        level: 日志级别，如 'INFO'、'DEBUG'
+        log_queue: 日志队列，默认为进程内队列；多进程服务传入 multiprocessing 队列，
+            工作进程的记录都由主进程的后台线程写入同一个文件
+    """
+    global _listener
+    stop_logging()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                       encoding='utf-8', delay=True)
+    console_handler = logging.StreamHandler()
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    if log_queue is None:
+        log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, file_handler, console_handler)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.handlers[:] = [QueueHandler(log_queue)]
+    root.setLevel(level)
+
+
+def stop_logging():
+    """写完队列中剩余的记录并停止后台线程"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+def note(**fields):
+    """为当前请求的记录补充字段，不在请求中时忽略"""
+    if has_request_context() and 'request_log' in g:
+        g.request_log['fields'].update(fields)
+
+
+@contextmanager
+def stage(name):
+    """统计当前请求某一阶段的用时（毫秒）"""
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context() and 'request_log' in g:
+            g.request_log['stages'][name] = round((time.perf_counter() - started_at) * 1000, 2)
+
+
+def _should_log(status, elapsed_ms, fields):
+    if status >= 400 or 'error' in fields or elapsed_ms >= LOG_SLOW_REQUEST_MS:
+        return True
+    return LOG_SAMPLE_RATE >= 1 or random.random() < LOG_SAMPLE_RATE
+
+
+def install_request_logging(app):
+    """
+    为 Flask 应用注册请求记录
+
+    应在注册其他 after_request 函数之前调用，这样记录的是压缩等处理之后的最终响应。
+    """
+
+    @app.before_request
+    def start_request_log():
+        g.request_log = {'started_at': time.perf_counter(), 'fields': {}, 'stages': {}}
+
+    @app.after_request
+    def finish_request_log(response):
+        request_log = g.pop('request_log', None)
+        if request_log is None:
+            return response
+
+        elapsed_ms = round((time.perf_counter() - request_log['started_at']) * 1000, 2)
+        fields = request_log['fields']
+        if not _should_log(response.status_code, elapsed_ms, fields):
+            return response
+
+        record = {'method': request.method, 'path': request.path, 'status': response.status_code, 'ms': elapsed_ms}
+        if request.args:
+            record['params'] = request.args.to_dict()
+        if not response.direct_passthrough:
+            record['bytes'] = response.content_length
+        if request_log['stages']:
+            record['stages'] = request_log['stages']
+        record.update(fields)
+
+        level = logging.ERROR if response.status_code >= 500 or 'error' in fields else logging.INFO
+        logger.log(level, json.dumps(record, ensure_ascii=False, default=str))
+        return response
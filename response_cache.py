@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K线接口的响应缓存
+
+sh600000 / 600000.XSHG / 600000 等不同写法的股票代码、带或不带时间的 end_date 读取的是同一份数据，
+因此先把查询规范化为 (market, stock_code, frequency, start, end, before, count)，
+再以 (规范化查询, 返回格式) 为键缓存序列化后的响应体：
+
+    cached, signature = lookup_response(query, layout)
+    if cached is None:
+        ...  # 读取数据并序列化
+        store_response(query, layout, signature, body, mimetype, headers)
+
+条目的签名为查询所依赖的数据文件签名（见 DataCatalog.signatures），数据目录索引发现文件变化后
+签名不同，条目在下次读取时失效。缓存总大小不超过 RESPONSE_CACHE_MAX_BYTES，按最近最少使用淘汰。
+"""
+
+import datetime
+
+import pandas as pd
+
+from catalog import get_catalog
+from config import RESPONSE_CACHE_MAX_BYTES, get_stock_filename
+from frame_cache import ByteLRUCache
+
+# 每个条目除响应体外的估算开销（键、响应头等）
+ENTRY_OVERHEAD_BYTES = 512
+
+response_cache = ByteLRUCache(RESPONSE_CACHE_MAX_BYTES)
+
+
+def _parse_day(value):
+    """与本地读取相同的日期解析：只取日期部分"""
+    return datetime.datetime.strptime(value.split(' ')[0], '%Y-%m-%d').strftime('%Y-%m-%d')
+
+
+def canonical_query(code, frequency, count, start_date='', end_date='', before=None):
+    """
+    规范化K线查询，读取结果相同的查询得到相同的值
+
+    指定开始日期时返回区间内的全部数据，count 不影响结果，记为None。
+
+    Returns:
+        tuple: (market, stock_code, frequency, start, end, before, count)，日期无法解析时返回None（不缓存）
+    """
+    market, stock_code, filename = get_stock_filename(code)
+    try:
+        start = _parse_day(start_date) if start_date else None
+        end = _parse_day(end_date) if end_date else None
+        before = pd.Timestamp(before).strftime('%Y-%m-%d %H:%M:%S') if before else None
+    except (ValueError, TypeError):
+        return None
+    return market, stock_code, frequency, start, end, before, None if start else int(count)
+
+
+def query_signature(query):
+    """查询所依赖的数据文件签名，没有本地数据时返回None"""
+    market, stock_code, frequency, start, end, before, count = query
+    end_time = before or end
+    code = f"{market.lower()}{stock_code}"
+    return get_catalog().signatures(code, int(end_time[:4]) if end_time else None) or None
+
+
+def lookup_response(query, layout):
+    """
+    查找缓存的响应
+
+    Returns:
+        tuple: (条目, 签名)，条目为 (body, mimetype, headers)，未命中时为None；
+            签名用于随后的 store_response，没有本地数据时为None
+    """
+    if query is None:
+        return None, None
+    signature = query_signature(query)
+    if signature is None:
+        return None, None
+    return response_cache.get((query, layout), signature), signature
+
+
+def store_response(query, layout, signature, body, mimetype, headers=None):
+    """缓存序列化后的响应体，签名为读取数据前由 lookup_response 得到的签名"""
+    if query is None or signature is None:
+        return False
+    return response_cache.put((query, layout), (body, mimetype, dict(headers or {})),
+                              len(body) + ENTRY_OVERHEAD_BYTES, signature)
+
+
+def cache_stats():
+    """响应缓存统计信息"""
+    return response_cache.stats()
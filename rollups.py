@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多周期预聚合K线
+
+按 (股票, 年份) 把分钟数据预先聚合为 5m/15m/30m/60m/1d 五种周期，保存在
+{CACHE_PATH}/rollups/{year}/{MARKET}.{code}.npz；周线、月线由日线汇总再聚合得到。
+聚合规则与实时聚合相同（见 aggregation.py），因此结果一致。
+
+这些周期的K线都不跨越自然日，而查询的日期范围也以整天为单位，
+所以按年份拼接、再按K线时间筛选，与先筛选分钟数据再聚合的结果完全相同。
+汇总文件记录源文件签名，源文件变化后自动重建；python -m ashare_ingest 会在导入时一并生成。
+"""
+
+import datetime
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from config import CACHE_PATH, get_stock_filename
+from catalog import get_catalog
+from aggregation import BAR_COLUMNS, aggregate_bars
+from local_store import frame_cache, load_year_frame
+
+logger = logging.getLogger(__name__)
+
+# 汇总文件格式版本，格式或聚合规则变化时递增
+ROLLUP_FORMAT_VERSION = 1
+
+# 按年份预聚合的周期
+ROLLUP_FREQUENCIES = ('5m', '15m', '30m', '60m', '1d')
+
+# 由日线汇总再聚合的周期
+DERIVED_FREQUENCIES = ('1w', '1M')
+
+# 与 aggregate_data_by_frequency 默认的数量上限一致
+MAX_BARS = 1000
+
+
+def get_rollup_file_path(code, year):
+    """获取某只股票某一年的汇总文件路径，如 {CACHE_PATH}/rollups/2024/SH.600000.npz"""
+    market, stock_code, filename = get_stock_filename(code)
+    return os.path.join(CACHE_PATH, 'rollups', str(year), f"{market}.{stock_code}.npz")
+
+
+def build_rollups(df_year):
+    """
+    把一年的分钟数据聚合为各周期K线
+
+    Returns:
+        dict: {频率: 按时间排序的K线数据帧}
+    """
+    rollups = {}
+    for frequency in ROLLUP_FREQUENCIES:
+        df = aggregate_bars(df_year, frequency).reset_index(drop=True)
+        if df.empty:
+            # 没有数据的周期统一为带类型的空数据帧
+            df = pd.DataFrame({'date': np.array([], dtype='datetime64[ns]'),
+                               **{column: np.array([], dtype=np.float64) for column in BAR_COLUMNS[1:]}})
+        rollups[frequency] = df
+    return rollups
+
+
+def _frame_nbytes(rollups):
+    return int(sum(df.memory_usage(index=True).sum() for df in rollups.values()))
+
+
+def write_rollups(code, year, signature, rollups):
+    """把汇总结果原子写入文件，返回是否写入成功"""
+    file_path = get_rollup_file_path(code, year)
+    try:
+        file_dir = os.path.dirname(file_path)
+        os.makedirs(file_dir, exist_ok=True)
+
+        arrays = {'meta': np.array([ROLLUP_FORMAT_VERSION, signature[0], signature[1]], dtype=np.int64)}
+        for frequency, df in rollups.items():
+            arrays[f"{frequency}_date"] = df['date'].values.astype('datetime64[ns]').view(np.int64)
+            for column in BAR_COLUMNS[1:]:
+                arrays[f"{frequency}_{column}"] = df[column].to_numpy()
+
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=file_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, file_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+    except Exception as e:
+        logger.warning("写入汇总文件 %s 失败: %s", file_path, e)
+        return False
+    return True
+
+
+def _load_rollups(file_path, signature):
+    """加载汇总文件，不存在、版本不符或源文件已变化时返回None"""
+    try:
+        with np.load(file_path, allow_pickle=False) as data:
+            meta = data['meta']
+            if int(meta[0]) != ROLLUP_FORMAT_VERSION or (int(meta[1]), int(meta[2])) != tuple(signature):
+                return None
+            rollups = {}
+            for frequency in ROLLUP_FREQUENCIES:
+                columns = {'date': data[f"{frequency}_date"].view('datetime64[ns]')}
+                for column in BAR_COLUMNS[1:]:
+                    columns[column] = data[f"{frequency}_{column}"]
+                rollups[frequency] = pd.DataFrame(columns, columns=BAR_COLUMNS)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("读取汇总文件 %s 失败: %s", file_path, e)
+        return None
+    return rollups
+
+
+def rollup_signature(code, year):
+    """汇总文件记录的源文件签名；文件不存在、损坏或版本不符时返回None"""
+    try:
+        with np.load(get_rollup_file_path(code, year), allow_pickle=False) as data:
+            meta = data['meta']
+            if int(meta[0]) != ROLLUP_FORMAT_VERSION:
+                return None
+            return int(meta[1]), int(meta[2])
+    except Exception:
+        return None
+
+
+def load_year_rollups(code, year):
+    """
+    读取某只股票某一年的各周期汇总，依次使用内存缓存、汇总文件，都没有时由分钟数据生成并保存
+
+    Returns:
+        dict: {频率: K线数据帧}；该年份数据格式不正确时返回None
+
+    Raises:
+        FileNotFoundError: 数据文件不存在
+    """
+    market, stock_code, filename = get_stock_filename(code)
+    key = (market, stock_code, int(year), 'rollups')
+    signature = get_catalog().signature(code, year)
+    if signature is None:
+        raise FileNotFoundError(f"数据文件不存在: {year}/{filename}")
+
+    rollups = frame_cache.get(key, signature)
+    if rollups is not None:
+        return rollups
+
+    rollups = _load_rollups(get_rollup_file_path(code, year), signature)
+    if rollups is None:
+        df_year = load_year_frame(code, year)
+        if df_year is None:
+            return None
+        rollups = build_rollups(df_year)
+        write_rollups(code, year, signature, rollups)
+
+    frame_cache.put(key, rollups, _frame_nbytes(rollups), signature)
+    return rollups
+
+
+def _date_bounds(start_date, end_date):
+    """与 Ashare._read_local_minutes 相同的日期解析：开始日当天0点，截止日当天23:59:59"""
+    start_timestamp = None
+    end_timestamp = None
+    if start_date:
+        start_timestamp = pd.to_datetime(start_date.split(' ')[0] if isinstance(start_date, str) else start_date)
+    if end_date:
+        end_date_str = end_date.split(' ')[0] if isinstance(end_date, str) else str(end_date)
+        end_timestamp = pd.to_datetime(end_date_str + ' 23:59:59')
+    return start_timestamp, end_timestamp
+
+
+def _filter_bars(df, start_timestamp, end_timestamp):
+    if start_timestamp is not None:
+        df = df[df['date'] >= start_timestamp]
+    if end_timestamp is not None:
+        df = df[df['date'] <= end_timestamp]
+    return df
+
+
+def read_rollup_bars(code, frequency, start_date='', end_date='', count=1000):
+    """
+    从预聚合汇总读取K线，读取范围规则与 Ashare._read_local_minutes 一致
+
+    未指定开始日期时从截止年份向前逐年读取，K线数量足够时停止；
+    指定了开始日期时读取开始年份到截止年份（未指定时为当前年份）的全部K线。
+
+    Args:
+        code: 股票代码
+        frequency: 目标频率，须为 ROLLUP_FREQUENCIES 或 DERIVED_FREQUENCIES 之一
+        start_date: 开始日期
+        end_date: 结束日期
+        count: 需要的K线数量（仅在未指定开始日期时用于决定读取的年份）
+
+    Returns:
+        DataFrame: 按时间排序的K线，最多 MAX_BARS 条；该股票没有数据时返回None
+    """
+    source_frequency = '1d' if frequency in DERIVED_FREQUENCIES else frequency
+    if source_frequency not in ROLLUP_FREQUENCIES:
+        return None
+
+    catalog = get_catalog()
+    available_years = catalog.years(code)
+    if not available_years:
+        return None
+
+    start_timestamp, end_timestamp = _date_bounds(start_date, end_date)
+    if start_timestamp is None:
+        end_year = end_timestamp.year if end_timestamp is not None else available_years[-1]
+        years = [year for year in reversed(available_years) if year <= end_year]
+        # 多读一条，以免最早的周线、月线不完整
+        bars_needed = min(count, MAX_BARS) + 1
+    else:
+        end_year = end_timestamp.year if end_timestamp is not None else datetime.datetime.now().year
+        start_year = min(start_timestamp.year, end_year)
+        end_year = max(start_timestamp.year, end_year)
+        years = [year for year in reversed(available_years) if start_year <= year <= end_year]
+        bars_needed = None
+
+    frames = []
+    result = None
+    for year in years:
+        rollups = load_year_rollups(code, year)
+        if rollups is None:
+            continue
+        frames.insert(0, _filter_bars(rollups[source_frequency], start_timestamp, end_timestamp))
+        if bars_needed is not None:
+            result = _combine(frames, frequency, source_frequency)
+            if len(result) >= bars_needed:
+                break
+
+    if not frames:
+        return None
+    if result is None:
+        result = _combine(frames, frequency, source_frequency)
+    return result.tail(MAX_BARS)
+
+
+def _combine(frames, frequency, source_frequency):
+    """拼接各年份的K线，周线、月线再由日线聚合"""
+    df = pd.concat(frames, ignore_index=True)
+    if frequency != source_frequency:
+        df = aggregate_bars(df, frequency)
+    return df
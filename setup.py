@@ -12,6 +12,8 @@ setup(
     entry_points={
         "console_scripts": [
             "ashare-mcp=ashare_mcp.__main__:main",
+            "ashare-ingest=ashare_ingest.__main__:main",
+            "ashare-serve=ashare_serve.__main__:main",
         ],
     },
     description="Ashare stock data as MCP service",
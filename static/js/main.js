@@ -12,6 +12,7 @@ let allCandleData = [];
 let startDate = null;
 let checkDataCallDepth = 0; // 防止递归调用的计数器
 let lastKlineDate = null; // 记录最后一根K线的日期
+let tradingCalendar = null; // 交易日历（/api/calendar），加载前按周末计算交易日
 
 // 步幅相关变量
 // New stride variables
@@ -24,10 +25,8 @@ let strideModeActive = false; // Boolean, true if stepping is active for the cur
 // 动画播放相关变量
 let isPlaying = false; // 是否正在播放
 let playbackSpeed = 5; // 播放速度倍数
-let animationTimer = null; // 动画定时器
-let minuteData = []; // 分钟级数据
-let currentAnimationIndex = 0; // 当前动画播放到的分钟数据索引
-let currentKlineBuffer = null; // 当前正在构建的K线数据缓冲区
+let replayStream = null; // 分钟数据回放连接（EventSource）
+let replayPosition = null; // 回放位置：{ start } 或 { after: 最后收到的分钟 }，继续、改变速度时从这里重新打开连接
 let animationState = 'stopped'; // 动画状态: 'stopped', 'playing', 'paused'
 
 // 前端日志记录
@@ -836,12 +835,18 @@ function loadKlineData(loadMore = false) {
     document.getElementById('loading').style.display = 'flex';
     
     // 构建API URL
-    let apiUrl = `/api/kline?code=${stockCode}&period=${period}&limit=${limit}&page=${currentPage}`;
-    if (endDate) {
-        apiUrl += `&end_date=${endDate}`;
-    }
-    if (startDate) {
-        apiUrl += `&start_date=${startDate}`;
+    let apiUrl = `/api/kline?code=${stockCode}&period=${period}&limit=${limit}&format=columnar`;
+    if (loadMore && allCandleData.length > 0) {
+        // 加载更多：按游标只请求早于当前最早一根K线的数据
+        apiUrl += `&before=${encodeURIComponent(allCandleData[0].date)}`;
+    } else {
+        apiUrl += `&page=${currentPage}`;
+        if (endDate) {
+            apiUrl += `&end_date=${endDate}`;
+        }
+        if (startDate) {
+            apiUrl += `&start_date=${startDate}`;
+        }
     }
     
     // 从后端API获取数据
@@ -855,7 +860,7 @@ function loadKlineData(loadMore = false) {
             return response.json();
         })
         .then(data => {
-            logToFile('INFO', `📊 解析JSON数据`, { dataType: typeof data, isArray: Array.isArray(data), length: data?.length });
+            logToFile('INFO', `📊 解析JSON数据`, { dataType: typeof data, isArray: Array.isArray(data), length: data?.length ?? data?.t?.length });
 
             // 隐藏加载中
             document.getElementById('loading').style.display = 'none';
@@ -895,8 +900,84 @@ function loadKlineData(loadMore = false) {
         });
 }
 
-// 处理并渲染数据
+// K线二进制格式（布局见 kline_binary.py），所有数值为小端序
+const KLINE_BINARY_MIME = 'application/x-ashare-kline';
+const KLINE_BINARY_FLAG_FLOAT64_PRICES = 1;
+
+// 解析二进制K线数据，返回与JSON行格式相同的数组
+function decodeKlineBinary(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    const version = view.getUint16(4, true);
+    if (magic !== 'AKLN' || version !== 1) {
+        throw new Error(`不支持的K线数据格式: ${magic} 版本 ${version}`);
+    }
+    const flags = view.getUint16(6, true);
+    const count = view.getUint32(8, true);
+
+    // TypedArray 按平台字节序读取，浏览器运行的平台均为小端序
+    let offset = 16;
+    const seconds = new BigInt64Array(buffer, offset, count);
+    offset += 8 * count;
+    const volume = new Float64Array(buffer, offset, count);
+    offset += 8 * count;
+    const float64Prices = (flags & KLINE_BINARY_FLAG_FLOAT64_PRICES) !== 0;
+    const PriceArray = float64Prices ? Float64Array : Float32Array;
+    const prices = new PriceArray(buffer, offset, count * 4);
+    // float32 价格四舍五入到3位小数还原
+    const price = float64Prices ? (value => value) : (value => Math.round(value * 1000) / 1000);
+
+    const rows = new Array(count);
+    for (let i = 0; i < count; i++) {
+        rows[i] = {
+            date: new Date(Number(seconds[i]) * 1000).toISOString().slice(0, 19).replace('T', ' '),
+            open: price(prices[i]),
+            high: price(prices[count + i]),
+            low: price(prices[2 * count + i]),
+            close: price(prices[3 * count + i]),
+            volume: volume[i]
+        };
+    }
+    return rows;
+}
+
+// 请求K线数据，优先使用二进制格式；返回行格式数组，后端出错时返回 {error}
+async function fetchKlineData(url) {
+    const response = await fetch(url, {
+        headers: { 'Accept': `${KLINE_BINARY_MIME}, application/json;q=0.9` }
+    });
+    if (!response.ok) {
+        throw new Error(`网络请求错误: ${response.status} ${response.statusText}`);
+    }
+    const contentType = response.headers.get('Content-Type') || '';
+    if (contentType.startsWith(KLINE_BINARY_MIME)) {
+        return decodeKlineBinary(await response.arrayBuffer());
+    }
+    return response.json();
+}
+
+// 把列式K线数据（{t, o, h, l, c, v}）转换为行格式（[{date, open, high, low, close, volume}]）
+function columnarToRows(data) {
+    const rows = new Array(data.t.length);
+    for (let i = 0; i < data.t.length; i++) {
+        rows[i] = {
+            date: data.t[i],
+            open: data.o[i],
+            high: data.h[i],
+            low: data.l[i],
+            close: data.c[i],
+            volume: data.v[i]
+        };
+    }
+    return rows;
+}
+
+// 处理并渲染数据，data 可以是行格式数组，也可以是列式对象
 function processAndRenderData(data, loadMore) {
+    if (!Array.isArray(data) && data && Array.isArray(data.t)) {
+        data = columnarToRows(data);
+    }
+
     logToFile('INFO', `🔄 开始处理数据`, { dataLength: data.length, loadMore });
 
     // 如果数据量太大，限制数量并警告用户
@@ -1291,17 +1372,13 @@ function loadHistoricalData(direction, referenceDate) {
     let startDate, endDate;
     const oneDay = 24 * 60 * 60 * 1000; // 一天的毫秒数
     const loadDays = 60; // 每次加载60天的数据
+    let url;
 
     if (direction === 'earlier') {
-        // 加载更早的数据 - 从参考日期往前推
-        endDate = new Date(referenceDate.getTime() - oneDay);
-        startDate = new Date(endDate.getTime() - loadDays * oneDay);
-
-        // 确保不会请求太早的数据（比如2020年之前）
-        const earliestDate = new Date('2020-01-01');
-        if (startDate < earliestDate) {
-            startDate = earliestDate;
-        }
+        // 加载更早的数据 - 按游标只请求早于当前最早一根K线的1000根K线
+        const oldestDate = allCandleData.length > 0 ? allCandleData[0].date : referenceDate.toISOString().split('T')[0];
+        url = `/api/kline?code=${stockCode}&period=${period}&limit=1000&before=${encodeURIComponent(oldestDate)}`;
+        console.log(`请求早于 ${oldestDate} 的数据`);
     } else {
         // 加载更晚的数据 - 从参考日期往后推
         startDate = new Date(referenceDate.getTime() + oneDay);
@@ -1335,17 +1412,17 @@ function loadHistoricalData(direction, referenceDate) {
         if (endDate > today) {
             endDate = today;
         }
-    }
 
-    // 格式化日期
-    const formatDate = (date) => date.toISOString().split('T')[0];
-    const startDateStr = formatDate(startDate);
-    const endDateStr = formatDate(endDate);
+        // 格式化日期
+        const formatDate = (date) => date.toISOString().split('T')[0];
+        const startDateStr = formatDate(startDate);
+        const endDateStr = formatDate(endDate);
 
-    console.log(`请求数据范围: ${startDateStr} 到 ${endDateStr}`);
+        console.log(`请求数据范围: ${startDateStr} 到 ${endDateStr}`);
 
-    // 构建API URL
-    const url = `/api/kline?code=${stockCode}&period=${period}&limit=1000&start_date=${startDateStr}&end_date=${endDateStr}`;
+        // 构建API URL
+        url = `/api/kline?code=${stockCode}&period=${period}&limit=1000&start_date=${startDateStr}&end_date=${endDateStr}`;
+    }
 
     fetch(url)
         .then(response => response.json())
@@ -1523,6 +1600,32 @@ function calculateMA(dayCount, data) {
     return result;
 }
 
+// 只计算最后一根K线的MA值，新增或更新K线时不必重新扫描整个数组
+function calculateLastMA(dayCount, data) {
+    if (!data || data.length < dayCount) return null;
+
+    let sum = 0;
+    for (let i = data.length - dayCount; i < data.length; i++) {
+        sum += data[i].close;
+    }
+    return {
+        time: data[data.length - 1].time,
+        value: parseFloat((sum / dayCount).toFixed(2))
+    };
+}
+
+// 更新最后一根K线的MA5/MA10/MA20
+function updateLastMovingAverages() {
+    if (!ma5Series || !ma10Series || !ma20Series || allCandleData.length < 5) return;
+
+    [[5, ma5Series], [10, ma10Series], [20, ma20Series]].forEach(([dayCount, series]) => {
+        const lastMA = calculateLastMA(dayCount, allCandleData);
+        if (lastMA) {
+            series.update(lastMA);
+        }
+    });
+}
+
 // 页面加载完成后自动加载K线图
 document.addEventListener('DOMContentLoaded', function() {
     // 初始化图表
@@ -1548,13 +1651,95 @@ document.addEventListener('DOMContentLoaded', function() {
     // 添加键盘事件监听器
     document.addEventListener('keydown', handleKeyboardEvent);
 
+    // 加载交易日历，加载完成前按周末计算交易日
+    loadTradingCalendar();
+
     // 加载K线数据
     loadKlineData();
 
-// 计算下一个交易日（跳过周末）
+// 从后端加载交易日历（交易日、半日市、各周期的K线时间）
+function loadTradingCalendar() {
+    return fetch('/api/calendar')
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            tradingCalendar = {
+                days: data.trading_days || [],
+                daySet: new Set(data.trading_days || []),
+                earlyCloses: data.early_closes || {},
+                barTimes: data.bar_times || {}
+            };
+            console.log('📅 交易日历加载完成:', tradingCalendar.days.length, '个交易日');
+        })
+        .catch(error => {
+            console.warn('⚠️ 交易日历加载失败，按周末计算交易日:', error);
+        });
+}
+
+// 在交易日历中查找 dateStr 之后（step > 0）或之前（step < 0）的交易日，超出日历范围时返回null
+function findCalendarTradingDay(dateStr, step) {
+    if (!tradingCalendar || !dateStr) return null;
+
+    const days = tradingCalendar.days;
+    dateStr = dateStr.split(' ')[0].split('T')[0];
+    if (days.length === 0 || dateStr < days[0] || dateStr > days[days.length - 1]) return null;
+
+    // 二分查找第一个大于（step > 0）或大于等于（step < 0）dateStr 的交易日
+    let lo = 0;
+    let hi = days.length;
+    while (lo < hi) {
+        const mid = (lo + hi) >> 1;
+        if (step > 0 ? days[mid] <= dateStr : days[mid] < dateStr) {
+            lo = mid + 1;
+        } else {
+            hi = mid;
+        }
+    }
+    const index = step > 0 ? lo : lo - 1;
+    return index >= 0 && index < days.length ? days[index] : null;
+}
+
+// 某个交易日某个周期的全部K线时间（HH:MM:SS），半日市使用当天的K线时间
+function getCalendarBarTimes(dateStr, period) {
+    if (!tradingCalendar) return null;
+    const earlyClose = tradingCalendar.earlyCloses[dateStr];
+    const barTimes = earlyClose ? earlyClose.bar_times : tradingCalendar.barTimes;
+    return barTimes[period] || null;
+}
+
+// 按交易日历计算下一根日内K线的时间，日历未加载或周期不支持时返回null
+function getNextKlineTimeFromCalendar(lastKline, period) {
+    if (!tradingCalendar || !lastKline.date) return null;
+
+    const [dateOnly, timePart] = lastKline.date.split(' ');
+    const times = getCalendarBarTimes(dateOnly, period);
+    if (!times || !timePart) return null;
+
+    if (tradingCalendar.daySet.has(dateOnly)) {
+        const nextTime = times.find(time => time > timePart);
+        if (nextTime) {
+            return new Date(dateOnly + ' ' + nextTime);
+        }
+    }
+
+    // 当天已收盘：下一个交易日的第一根K线
+    const nextDay = findCalendarTradingDay(dateOnly, 1);
+    const nextTimes = nextDay ? getCalendarBarTimes(nextDay, period) : null;
+    if (!nextTimes || nextTimes.length === 0) return null;
+    return new Date(nextDay + ' ' + nextTimes[0]);
+}
+
+// 计算下一个交易日（优先使用交易日历，否则只跳过周末）
 function getNextTradingDay(dateStr) {
     if (!dateStr) return null;
 
+    const calendarDay = findCalendarTradingDay(dateStr, 1);
+    if (calendarDay) {
+        return calendarDay;
+    }
+
     console.log('📅 计算下一个交易日，输入:', dateStr);
 
     let date = new Date(dateStr);
@@ -1594,6 +1779,18 @@ function getNextKlineTime(lastKline, period) {
         period: period
     });
 
+    // 交易日历已加载时，按后端给出的K线时间计算，跳过午休、节假日和半日市
+    if (period !== 'D') {
+        const calendarTime = getNextKlineTimeFromCalendar(lastKline, period);
+        if (calendarTime) {
+            console.log('📅 按交易日历计算的下一根K线时间:', calendarTime);
+            return calendarTime;
+        }
+    }
+
+    // 以下为日历不可用时的回退计算
+    const lastDate = lastKline.date ? new Date(lastKline.date) : new Date(lastKline.time * 1000);
+
     switch (period) {
         case 'D': // 日线
             const dateStr = lastKline.date ? lastKline.date.split(' ')[0] : new Date(lastKline.time * 1000).toISOString().split('T')[0];
@@ -1732,10 +1929,15 @@ function getNextKlineTime(lastKline, period) {
     return null;
 }
 
-// 计算上一个交易日（跳过周末）
+// 计算上一个交易日（优先使用交易日历，否则只跳过周末）
 function getPreviousTradingDay(dateStr) {
     if (!dateStr) return null;
 
+    const calendarDay = findCalendarTradingDay(dateStr, -1);
+    if (calendarDay) {
+        return calendarDay;
+    }
+
     let date = new Date(dateStr);
 
     // 减少一天
@@ -1925,8 +2127,7 @@ async function processDailyKlineStep(stepToAddInMinutes) {
         try {
             const apiUrl = `/api/kline?code=${stockCode}&period=1&limit=300&start_date=${currentDayBeingBuiltBySteps}&end_date=${currentDayBeingBuiltBySteps}`;
             logToFile('INFO', `Fetching minute data from: ${apiUrl}`);
-            const response = await fetch(apiUrl);
-            const rawMinuteData = await response.json();
+            const rawMinuteData = await fetchKlineData(apiUrl);
 
             if (rawMinuteData.error || !rawMinuteData || rawMinuteData.length === 0) {
                 logToFile('ERROR', `processDailyKlineStep: No minute data found for ${currentDayBeingBuiltBySteps}. Error: ${rawMinuteData.error}`);
@@ -2133,11 +2334,7 @@ async function findNextKlineFromData(lastKline, period, specificDateToFetch = nu
         const apiUrl = `/api/kline?code=${stockCode}&period=1&limit=300&start_date=${dateForApiCall}&end_date=${dateForApiCall}`;
         logToFile('DEBUG', `findNextKlineFromData: API URL: ${apiUrl}`);
 
-        const response = await fetch(apiUrl);
-        if (!response.ok) {
-            throw new Error(`Network request error: ${response.status} ${response.statusText}`);
-        }
-        const minuteData = await response.json();
+        const minuteData = await fetchKlineData(apiUrl);
 
         if (minuteData && minuteData.length > 0) {
             logToFile('INFO', `findNextKlineFromData: Received ${minuteData.length} minute data points for ${dateForApiCall}.`);
@@ -2709,12 +2906,7 @@ async function fetchSingleKline(klineTime, period) {
     logToFile('INFO', '🌐 请求单根K线数据:', { apiUrl });
 
     try {
-        const response = await fetch(apiUrl);
-        if (!response.ok) {
-            throw new Error(`网络请求错误: ${response.status} ${response.statusText}`);
-        }
-
-        const data = await response.json();
+        const data = await fetchKlineData(apiUrl);
 
         if (data && data.length > 0) {
             // 找到匹配目标时间的K线
@@ -2908,28 +3100,7 @@ function  addKlineToChart(klineData, period) {
 
 // 为新K线更新移动平均线
 function updateMovingAveragesForNewKline() {
-    if (!ma5Series || !ma10Series || !ma20Series || allCandleData.length < 5) return;
-
-    // 重新计算移动平均线（只计算最后几个点）
-    const ma5Data = calculateMA(5, allCandleData);
-    const ma10Data = calculateMA(10, allCandleData);
-    const ma20Data = calculateMA(20, allCandleData);
-
-    // 更新最后一个点
-    if (ma5Data.length > 0) {
-        const lastMA5 = ma5Data[ma5Data.length - 1];
-        ma5Series.update(lastMA5);
-    }
-
-    if (ma10Data.length > 0) {
-        const lastMA10 = ma10Data[ma10Data.length - 1];
-        ma10Series.update(lastMA10);
-    }
-
-    if (ma20Data.length > 0) {
-        const lastMA20 = ma20Data[ma20Data.length - 1];
-        ma20Series.update(lastMA20);
-    }
+    updateLastMovingAverages();
 }
 
 // 生成模拟K线数据（用于未来数据）
@@ -5776,6 +5947,13 @@ window.setDrawingTool = setDrawingTool;
 window.clearAllDrawings = clearAllDrawings;
 window.setupDrawingEventListeners = setupDrawingEventListeners;
 
+// 暴露K线动画播放控制函数到全局作用域（页面按钮的 onclick 在全局作用域中查找函数）
+window.togglePlayback = togglePlayback;
+window.stopAnimation = stopAnimation;
+window.resetAnimation = resetAnimation;
+window.seekReplay = seekReplay;
+window.updateSpeed = updateSpeed;
+
 // ==================== K线动画播放功能 ====================
 
 // 切换播放/暂停状态
@@ -5791,49 +5969,45 @@ function togglePlayback() {
 function startAnimation() {
     if (isPlaying) return;
 
+    const stockCode = document.getElementById('stockCode').value.trim();
+    if (!stockCode) {
+        alert('请输入股票代码');
+        return;
+    }
+
     logToFile('INFO', '🎬 开始K线动画播放');
 
-    // 如果是从暂停状态恢复，直接继续播放
-    if (animationState === 'paused' && minuteData.length > 0) {
-        isPlaying = true;
-        animationState = 'playing';
-        updatePlaybackUI();
-        runAnimation();
+    // 如果是从暂停状态恢复，从最后收到的分钟之后继续
+    if (animationState === 'paused' && replayPosition) {
+        openReplayStream(replayPosition);
         return;
     }
 
-    // 首次播放，获取分钟级数据
-    loadMinuteDataForAnimation().then(() => {
-        // 清空现有数据，准备动画播放
-        clearChartForAnimation();
-
-        isPlaying = true;
-        animationState = 'playing';
-        currentAnimationIndex = 0;
-        currentKlineBuffer = null;
+    // 首次播放，从截止日期的下一个交易日开始；未设置截止日期时重放图表最后一天
+    const endDate = document.getElementById('endDate').value;
+    let startDate = '';
+    if (endDate) {
+        startDate = getNextTradingDay(endDate);
+        logToFile('INFO', '📅 从截止日期的下一个交易日开始播放', { endDate, startDate });
+    } else if (allCandleData.length > 0) {
+        startDate = allCandleData[allCandleData.length - 1].date.split(' ')[0];
+    }
 
-        updatePlaybackUI();
-        runAnimation();
-    }).catch(error => {
-        logToFile('ERROR', '❌ 获取分钟级数据失败:', error);
-        alert('获取分钟级数据失败，请检查网络连接');
-        animationState = 'stopped';
-        updatePlaybackUI();
-    });
+    // 清空现有数据，准备动画播放
+    clearChartForAnimation();
+    openReplayStream(startDate ? { start: startDate } : {});
 }
 
 // 暂停动画播放
 function pauseAnimation() {
     if (!isPlaying) return;
 
-    logToFile('INFO', '⏸️ 暂停K线动画播放');
+    logToFile('INFO', '⏸️ 暂停K线动画播放', replayPosition);
 
+    // 暂停即关闭回放连接，继续时从 replayPosition 重新打开
+    closeReplayStream();
     isPlaying = false;
     animationState = 'paused';
-    if (animationTimer) {
-        clearTimeout(animationTimer);
-        animationTimer = null;
-    }
     updatePlaybackUI();
 }
 
@@ -5842,17 +6016,10 @@ function stopAnimation() {
     logToFile('INFO', '⏹️ 停止K线动画播放');
 
     // 停止播放
+    closeReplayStream();
     isPlaying = false;
     animationState = 'stopped';
-    if (animationTimer) {
-        clearTimeout(animationTimer);
-        animationTimer = null;
-    }
-
-    // 重置所有动画相关状态
-    currentAnimationIndex = 0;
-    currentKlineBuffer = null;
-    minuteData = [];
+    replayPosition = null;
 
     // 重新加载原始数据（到截止日期为止的数据）
     loadKlineData();
@@ -5865,17 +6032,10 @@ function resetAnimation() {
     logToFile('INFO', '🔄 重置K线动画');
 
     // 停止播放
+    closeReplayStream();
     isPlaying = false;
     animationState = 'stopped';
-    if (animationTimer) {
-        clearTimeout(animationTimer);
-        animationTimer = null;
-    }
-
-    // 重置所有状态
-    currentAnimationIndex = 0;
-    currentKlineBuffer = null;
-    minuteData = []; // 清空分钟数据
+    replayPosition = null;
 
     // 重新加载原始数据（到截止日期为止的数据）
     loadKlineData();
@@ -5883,6 +6043,19 @@ function resetAnimation() {
     updatePlaybackUI();
 }
 
+// 跳转到指定日期或时间继续播放
+function seekReplay() {
+    const target = prompt('跳转到（YYYY-MM-DD 或 YYYY-MM-DD HH:MM）', replayPosition?.after || '');
+    if (!target) return;
+
+    const position = /^\d{4}-\d{2}-\d{2}$/.test(target.trim()) ? { start: target.trim() } : { after: target.trim() };
+    logToFile('INFO', '⏩ 跳转K线动画', position);
+
+    // 图表只能在末尾追加K线，跳转后从新位置重新绘制
+    clearChartForAnimation();
+    openReplayStream(position);
+}
+
 // 更新播放速度
 function updateSpeed() {
     const slider = document.getElementById('speedSlider');
@@ -5890,6 +6063,11 @@ function updateSpeed() {
     document.getElementById('speedDisplay').textContent = playbackSpeed + 'x';
 
     logToFile('INFO', '⚡ 更新播放速度:', { playbackSpeed });
+
+    // 播放中以新速度从当前位置重新打开回放连接
+    if (isPlaying && replayPosition) {
+        openReplayStream(replayPosition);
+    }
 }
 
 // 更新播放控制UI
@@ -5927,360 +6105,106 @@ function updatePlaybackUI() {
     }
 }
 
-// 获取分钟级数据用于动画播放
-async function loadMinuteDataForAnimation() {
-    const stockCode = document.getElementById('stockCode').value.trim();
-    const endDate = document.getElementById('endDate').value;
-    const limit = 1440; // 一天的分钟数，获取足够的数据
-
-    if (!stockCode) {
-        throw new Error('股票代码为空');
-    }
-
-    logToFile('INFO', '📊 获取分钟级数据用于动画播放', { stockCode, endDate, limit });
-
-    // 如果有截止日期，从截止日期的下一个交易日开始获取数据
-    let startDate = endDate;
-    if (endDate) {
-        startDate = getNextTradingDay(endDate);
-        logToFile('INFO', '📅 从截止日期的下一个交易日开始播放', { endDate, startDate });
-    }
-
-    // 构建API URL，获取1分钟数据，从startDate开始向未来获取
-    let apiUrl = `/api/kline?code=${stockCode}&period=1&limit=${limit}`;
-    if (startDate) {
-        apiUrl += `&start_date=${startDate}`;
-    }
+// 打开回放连接：服务端按播放速度（每秒分钟数）推送分钟数据聚合成的当前周期K线
+function openReplayStream(position) {
+    closeReplayStream();
 
-    try {
-        const response = await fetch(apiUrl);
-        if (!response.ok) {
-            throw new Error(`网络请求错误: ${response.status} ${response.statusText}`);
-        }
-
-        const data = await response.json();
-        logToFile('INFO', '✅ 分钟级数据获取成功', { dataLength: data.length });
-
-        // 转换数据格式（动画播放时总是使用1分钟数据）
-        minuteData = data.map(item => {
-            // 动画播放时，数据总是1分钟级的，直接使用原始时间
-            let timestamp = new Date(item.date).getTime() / 1000;
-
-            return {
-                time: timestamp,
-                open: parseFloat(item.open),
-                high: parseFloat(item.high),
-                low: parseFloat(item.low),
-                close: parseFloat(item.close),
-                volume: parseFloat(item.volume || 0),
-                date: item.date // 保存原始日期字符串
-            };
-        });
-
-        // 按时间排序
-        minuteData.sort((a, b) => a.time - b.time);
-
-        logToFile('INFO', '📊 分钟级数据处理完成', {
-            dataLength: minuteData.length,
-            firstDate: minuteData[0]?.date,
-            lastDate: minuteData[minuteData.length - 1]?.date
-        });
-
-    } catch (error) {
-        logToFile('ERROR', '❌ 获取分钟级数据失败:', error);
-        throw error;
-    }
-}
-
-// 运行动画的核心函数
-function runAnimation() {
-    if (!isPlaying) {
-        return;
-    }
-
-    // 如果当前数据播放完了，尝试获取下一天的数据
-    if (currentAnimationIndex >= minuteData.length) {
-        logToFile('INFO', '🎬 当前数据播放完成，获取下一天数据');
-        loadNextDayData().then(() => {
-            if (minuteData.length > 0) {
-                currentAnimationIndex = 0; // 重置索引
-                runAnimation(); // 继续播放
-            } else {
-                logToFile('INFO', '🎬 没有更多数据，动画播放完成');
-                stopAnimation();
-            }
-        }).catch(error => {
-            logToFile('ERROR', '❌ 获取下一天数据失败:', error);
-            stopAnimation();
-        });
-        return;
-    }
-
-    const currentPeriod = document.getElementById('period').value;
-    const intervalMs = Math.max(50, 1000 / playbackSpeed); // 最小50ms间隔
-
-    // 处理当前分钟数据
-    processMinuteDataForAnimation(currentPeriod);
-
-    currentAnimationIndex++;
-
-    // 设置下一次动画
-    animationTimer = setTimeout(() => {
-        runAnimation();
-    }, intervalMs);
-}
-
-// 处理分钟数据并更新图表
-function processMinuteDataForAnimation(period) {
-    if (currentAnimationIndex >= minuteData.length) return;
-
-    const currentMinute = minuteData[currentAnimationIndex];
-
-    logToFile('DEBUG', '🎬 处理分钟数据', {
-        index: currentAnimationIndex,
-        date: currentMinute.date,
-        period: period
+    const params = new URLSearchParams({
+        code: document.getElementById('stockCode').value.trim(),
+        period: document.getElementById('period').value,
+        speed: playbackSpeed,
+        ...position
     });
-
-    // 根据不同周期处理数据
-    switch (period) {
-        case '1': // 1分钟线，直接添加
-            addMinuteToChart(currentMinute);
-            break;
-        case '5': // 5分钟线
-            buildKlineFromMinutes(currentMinute, 5);
-            break;
-        case '15': // 15分钟线
-            buildKlineFromMinutes(currentMinute, 15);
-            break;
-        case '30': // 30分钟线
-            buildKlineFromMinutes(currentMinute, 30);
-            break;
-        case '60': // 60分钟线
-            buildKlineFromMinutes(currentMinute, 60);
-            break;
-        case 'D': // 日线
-            buildDailyKlineFromMinutes(currentMinute);
-            break;
-        default:
-            logToFile('WARN', '⚠️ 不支持的周期类型:', period);
-            break;
-    }
-}
-
-// 直接添加1分钟K线到图表
-function addMinuteToChart(minuteData) {
-    if (!candleSeries) return;
-
-    // 直接更新图表，添加新的1分钟K线
-    const newCandle = {
-        time: minuteData.time,
-        open: minuteData.open,
-        high: minuteData.high,
-        low: minuteData.low,
-        close: minuteData.close
-    };
-
-    // 添加到全局数据数组
-    allCandleData.push(minuteData);
-
-    // 更新图表
-    candleSeries.update(newCandle);
-
-    // 更新成交量
-    if (volumeSeries) {
-        volumeSeries.update({
-            time: minuteData.time,
-            value: minuteData.volume,
-            color: minuteData.close >= minuteData.open ? 'rgba(0, 150, 136, 0.8)' : 'rgba(255, 82, 82, 0.8)'
+    replayPosition = position;
+    replayStream = new EventSource(`/api/replay?${params}`);
+
+    logToFile('INFO', '📡 打开分钟数据回放连接', Object.fromEntries(params));
+
+    // 每条消息包含本批新建或更新过的K线，消息 id 为本批最后一分钟
+    replayStream.onmessage = event => {
+        const message = JSON.parse(event.data);
+        replayPosition = { after: message.minute };
+        message.bars.forEach(bar => {
+            applyReplayBar(bar);
+            updateMovingAveragesForAnimation();
         });
-    }
-
-    logToFile('DEBUG', '📊 添加1分钟K线', { time: minuteData.date, close: minuteData.close });
-}
-
-// 从分钟数据构建更大周期的K线
-function buildKlineFromMinutes(minuteData, periodMinutes) {
-    const minuteTime = new Date(minuteData.time * 1000);
-
-    // 计算当前分钟数据属于哪个周期的K线
-    const periodStartTime = getPeriodStartTime(minuteTime, periodMinutes);
-    const periodTimestamp = periodStartTime.getTime() / 1000;
+    };
 
-    // 如果是新的周期，完成上一个周期的K线并开始新的
-    if (!currentKlineBuffer || currentKlineBuffer.time !== periodTimestamp) {
-        // 完成上一个K线
-        if (currentKlineBuffer) {
-            finishCurrentKline();
+    replayStream.addEventListener('end', event => {
+        const message = JSON.parse(event.data);
+        if (message.error) {
+            logToFile('ERROR', '❌ 分钟数据回放出错:', message.error);
         }
+        logToFile('INFO', '🎬 没有更多数据，动画播放完成');
+        closeReplayStream();
+        isPlaying = false;
+        animationState = 'stopped';
+        replayPosition = null;
+        updatePlaybackUI();
+    });
 
-        // 开始新的K线
-        currentKlineBuffer = {
-            time: periodTimestamp,
-            open: minuteData.open,
-            high: minuteData.high,
-            low: minuteData.low,
-            close: minuteData.close,
-            volume: minuteData.volume,
-            minuteCount: 1,
-            targetMinutes: periodMinutes
-        };
-
-        logToFile('DEBUG', `📊 开始新的${periodMinutes}分钟K线`, {
-            startTime: periodStartTime.toISOString(),
-            open: minuteData.open
-        });
-    } else {
-        // 更新当前K线
-        currentKlineBuffer.high = Math.max(currentKlineBuffer.high, minuteData.high);
-        currentKlineBuffer.low = Math.min(currentKlineBuffer.low, minuteData.low);
-        currentKlineBuffer.close = minuteData.close;
-        currentKlineBuffer.volume += minuteData.volume;
-        currentKlineBuffer.minuteCount++;
-
-        logToFile('DEBUG', `📊 更新${periodMinutes}分钟K线`, {
-            minuteCount: currentKlineBuffer.minuteCount,
-            close: minuteData.close
-        });
-    }
-
-    // 实时更新图表显示当前正在构建的K线
-    updateCurrentKlineOnChart();
-}
-
-// 构建日线K线
-function buildDailyKlineFromMinutes(minuteData) {
-    const minuteTime = new Date(minuteData.time * 1000);
-    const dayStart = new Date(minuteTime.getFullYear(), minuteTime.getMonth(), minuteTime.getDate());
-    const dayTimestamp = dayStart.getTime() / 1000;
-
-    // 如果是新的一天，完成上一天的K线并开始新的
-    if (!currentKlineBuffer || currentKlineBuffer.time !== dayTimestamp) {
-        // 完成上一个K线
-        if (currentKlineBuffer) {
-            finishCurrentKline();
+    // 连接中断时浏览器凭最后的消息 id 自动重连；请求被拒绝时连接直接关闭
+    replayStream.onerror = () => {
+        if (replayStream && replayStream.readyState === EventSource.CLOSED) {
+            logToFile('ERROR', '❌ 分钟数据回放连接失败', Object.fromEntries(params));
+            alert('获取分钟级数据失败，请检查股票代码和网络连接');
+            closeReplayStream();
+            isPlaying = false;
+            animationState = 'stopped';
+            updatePlaybackUI();
         }
+    };
 
-        // 开始新的日K线
-        currentKlineBuffer = {
-            time: dayTimestamp,
-            open: minuteData.open,
-            high: minuteData.high,
-            low: minuteData.low,
-            close: minuteData.close,
-            volume: minuteData.volume,
-            minuteCount: 1,
-            isDaily: true
-        };
+    isPlaying = true;
+    animationState = 'playing';
+    updatePlaybackUI();
+}
 
-        logToFile('DEBUG', '📊 开始新的日K线', {
-            date: dayStart.toISOString().split('T')[0],
-            open: minuteData.open
-        });
-    } else {
-        // 更新当前日K线
-        currentKlineBuffer.high = Math.max(currentKlineBuffer.high, minuteData.high);
-        currentKlineBuffer.low = Math.min(currentKlineBuffer.low, minuteData.low);
-        currentKlineBuffer.close = minuteData.close;
-        currentKlineBuffer.volume += minuteData.volume;
-        currentKlineBuffer.minuteCount++;
-
-        logToFile('DEBUG', '📊 更新日K线', {
-            minuteCount: currentKlineBuffer.minuteCount,
-            close: minuteData.close
-        });
+// 关闭回放连接
+function closeReplayStream() {
+    if (replayStream) {
+        replayStream.close();
+        replayStream = null;
     }
-
-    // 实时更新图表显示当前正在构建的K线
-    updateCurrentKlineOnChart();
 }
 
-// 获取周期开始时间
-function getPeriodStartTime(currentTime, periodMinutes) {
-    const minutes = currentTime.getMinutes();
-    const periodStart = Math.floor(minutes / periodMinutes) * periodMinutes;
-
-    return new Date(
-        currentTime.getFullYear(),
-        currentTime.getMonth(),
-        currentTime.getDate(),
-        currentTime.getHours(),
-        periodStart,
-        0,
-        0
-    );
-}
+// 把回放推送的K线画到图表上：与最后一根K线时间相同时更新，否则追加
+function applyReplayBar(bar) {
+    if (!candleSeries) return;
 
-// 完成当前K线并添加到图表
-function finishCurrentKline() {
-    if (!currentKlineBuffer || !candleSeries) return;
-
-    const klineData = {
-        time: currentKlineBuffer.time,
-        open: currentKlineBuffer.open,
-        high: currentKlineBuffer.high,
-        low: currentKlineBuffer.low,
-        close: currentKlineBuffer.close,
-        volume: currentKlineBuffer.volume
+    const candle = {
+        time: new Date(bar.date).getTime() / 1000,
+        open: bar.open,
+        high: bar.high,
+        low: bar.low,
+        close: bar.close,
+        volume: bar.volume,
+        date: bar.date
     };
 
-    // 添加到全局数据数组
-    allCandleData.push(klineData);
-
-    // 更新图表
-    candleSeries.update({
-        time: currentKlineBuffer.time,
-        open: currentKlineBuffer.open,
-        high: currentKlineBuffer.high,
-        low: currentKlineBuffer.low,
-        close: currentKlineBuffer.close
-    });
-
-    // 更新成交量
-    if (volumeSeries) {
-        volumeSeries.update({
-            time: currentKlineBuffer.time,
-            value: currentKlineBuffer.volume,
-            color: currentKlineBuffer.close >= currentKlineBuffer.open ? 'rgba(0, 150, 136, 0.8)' : 'rgba(255, 82, 82, 0.8)'
-        });
+    const lastCandle = allCandleData[allCandleData.length - 1];
+    if (lastCandle && lastCandle.time === candle.time) {
+        allCandleData[allCandleData.length - 1] = candle;
+    } else {
+        allCandleData.push(candle);
     }
 
-    // 更新移动平均线
-    updateMovingAveragesForAnimation();
-
-    const period = currentKlineBuffer.isDaily ? '日' : `${currentKlineBuffer.targetMinutes}分钟`;
-    logToFile('INFO', `✅ 完成${period}K线`, {
-        time: new Date(currentKlineBuffer.time * 1000).toISOString(),
-        open: currentKlineBuffer.open,
-        close: currentKlineBuffer.close,
-        minuteCount: currentKlineBuffer.minuteCount
-    });
-}
-
-// 实时更新当前正在构建的K线
-function updateCurrentKlineOnChart() {
-    if (!currentKlineBuffer || !candleSeries) return;
-
-    // 实时更新图表上当前正在构建的K线
     candleSeries.update({
-        time: currentKlineBuffer.time,
-        open: currentKlineBuffer.open,
-        high: currentKlineBuffer.high,
-        low: currentKlineBuffer.low,
-        close: currentKlineBuffer.close
+        time: candle.time,
+        open: candle.open,
+        high: candle.high,
+        low: candle.low,
+        close: candle.close
     });
 
     // 更新成交量
     if (volumeSeries) {
         volumeSeries.update({
-            time: currentKlineBuffer.time,
-            value: currentKlineBuffer.volume,
-            color: currentKlineBuffer.close >= currentKlineBuffer.open ? 'rgba(0, 150, 136, 0.8)' : 'rgba(255, 82, 82, 0.8)'
+            time: candle.time,
+            value: candle.volume,
+            color: candle.close >= candle.open ? 'rgba(0, 150, 136, 0.8)' : 'rgba(255, 82, 82, 0.8)'
         });
     }
-
-    // 更新移动平均线（如果有足够的数据）
-    updateMovingAveragesForAnimation();
 }
 
 // 清空图表准备动画播放
@@ -6304,95 +6228,6 @@ function clearChartForAnimation() {
 
 // 更新移动平均线（动画播放时）
 function updateMovingAveragesForAnimation() {
-    if (!ma5Series || !ma10Series || !ma20Series || allCandleData.length < 5) return;
-
-    // 计算移动平均线
-    const ma5Data = calculateMA(5, allCandleData);
-    const ma10Data = calculateMA(10, allCandleData);
-    const ma20Data = calculateMA(20, allCandleData);
-
-    // 只更新最后一个点，避免重新设置整个数据集
-    if (ma5Data.length > 0) {
-        const lastMA5 = ma5Data[ma5Data.length - 1];
-        ma5Series.update(lastMA5);
-    }
-
-    if (ma10Data.length > 0) {
-        const lastMA10 = ma10Data[ma10Data.length - 1];
-        ma10Series.update(lastMA10);
-    }
-
-    if (ma20Data.length > 0) {
-        const lastMA20 = ma20Data[ma20Data.length - 1];
-        ma20Series.update(lastMA20);
-    }
-}
-
-// 获取下一天的数据继续播放
-async function loadNextDayData() {
-    if (minuteData.length === 0) {
-        throw new Error('没有当前数据，无法确定下一天');
-    }
-
-    // 获取当前数据的最后一天
-    const lastMinute = minuteData[minuteData.length - 1];
-    const lastDate = new Date(lastMinute.time * 1000);
-    const nextDay = getNextTradingDay(lastDate.toISOString().split('T')[0]);
-
-    logToFile('INFO', '📅 获取下一天数据', {
-        lastDate: lastDate.toISOString().split('T')[0],
-        nextDay
-    });
-
-    const stockCode = document.getElementById('stockCode').value.trim();
-    const limit = 1440; // 一天的分钟数
-
-    // 构建API URL，获取下一天的1分钟数据
-    let apiUrl = `/api/kline?code=${stockCode}&period=1&limit=${limit}&start_date=${nextDay}`;
-
-    try {
-        const response = await fetch(apiUrl);
-        if (!response.ok) {
-            throw new Error(`网络请求错误: ${response.status} ${response.statusText}`);
-        }
-
-        const data = await response.json();
-
-        if (data.length === 0) {
-            logToFile('WARN', '⚠️ 下一天没有数据');
-            return;
-        }
-
-        logToFile('INFO', '✅ 下一天数据获取成功', { dataLength: data.length });
-
-        // 转换数据格式并替换当前的minuteData（动画播放时总是使用1分钟数据）
-        minuteData = data.map(item => {
-            // 动画播放时，数据总是1分钟级的，直接使用原始时间
-            let timestamp = new Date(item.date).getTime() / 1000;
-
-            return {
-                time: timestamp,
-                open: parseFloat(item.open),
-                high: parseFloat(item.high),
-                low: parseFloat(item.low),
-                close: parseFloat(item.close),
-                volume: parseFloat(item.volume || 0),
-                date: item.date // 保存原始日期字符串
-            };
-        });
-
-        // 按时间排序
-        minuteData.sort((a, b) => a.time - b.time);
-
-        logToFile('INFO', '📊 下一天数据处理完成', {
-            dataLength: minuteData.length,
-            firstDate: minuteData[0]?.date,
-            lastDate: minuteData[minuteData.length - 1]?.date
-        });
-
-    } catch (error) {
-        logToFile('ERROR', '❌ 获取下一天数据失败:', error);
-        throw error;
-    }
+    updateLastMovingAverages();
 }
 });
\ No newline at end of file
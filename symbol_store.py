@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按股票组织的内存映射行情存储
+
+把一只股票所有年份的分钟数据合并为按时间排序的连续列文件：
+    date.npy   int64，纳秒时间戳
+    open.npy / high.npy / low.npy / close.npy / volume.npy   定长数值列
+
+通过 np.load(mmap_mode='r') 打开，日期范围查询用 searchsorted 二分定位下标区间，
+返回的是内存映射数组的切片视图，不复制数据。
+
+存储目录按源文件签名生成摘要命名（{CACHE_PATH}/store/{MARKET}.{code}/{digest}/），
+目录建成后不再修改；源文件变化时摘要改变，自动构建新目录。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from config import CACHE_PATH, get_stock_filename
+from catalog import get_catalog
+from local_store import FRAME_COLUMNS, PRICE_COLUMNS, load_year_frame
+
+# 存储格式版本，格式变化时递增
+STORE_FORMAT_VERSION = 1
+
+# 已打开的存储，键为 (market, stock_code)
+_open_stores = {}
+
+
+def get_store_root(code):
+    """获取某只股票的存储根目录"""
+    market, stock_code, filename = get_stock_filename(code)
+    return os.path.join(CACHE_PATH, 'store', f"{market}.{stock_code}")
+
+
+def _sources_digest(sources):
+    """根据各年份源文件签名计算存储目录名"""
+    payload = json.dumps({'version': STORE_FORMAT_VERSION, 'sources': sources}, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def _collect_sources(code):
+    """收集各年份源文件签名 {year: [mtime_ns, size]}"""
+    catalog = get_catalog()
+    sources = {}
+    for year in catalog.years(code):
+        sources[str(year)] = list(catalog.signature(code, year))
+    return sources
+
+
+class SymbolStore:
+    """单只股票的内存映射列存储"""
+
+    def __init__(self, code, directory, digest):
+        self.code = code
+        self.directory = directory
+        self.digest = digest
+        self.columns = {}
+        for column in FRAME_COLUMNS:
+            self.columns[column] = np.load(os.path.join(directory, f"{column}.npy"), mmap_mode='r')
+
+        lengths = {len(values) for values in self.columns.values()}
+        if len(lengths) != 1:
+            raise ValueError(f"存储目录 {directory} 列长度不一致")
+
+    def __len__(self):
+        return len(self.columns['date'])
+
+    @property
+    def dates(self):
+        """int64 纳秒时间戳"""
+        return self.columns['date']
+
+    def first_timestamp(self):
+        return pd.Timestamp(int(self.dates[0])) if len(self) else None
+
+    def last_timestamp(self):
+        return pd.Timestamp(int(self.dates[-1])) if len(self) else None
+
+    def locate(self, start=None, end=None, count=None):
+        """
+        把时间范围解析为下标区间
+
+        Args:
+            start: 开始时间（含），None 表示从头开始
+            end: 结束时间（含），None 表示到末尾
+            count: 只保留区间内最后 count 行
+
+        Returns:
+            tuple: (lo, hi)，对应 [lo, hi) 的行
+        """
+        lo = 0
+        hi = len(self)
+        if start is not None:
+            lo = int(np.searchsorted(self.dates, pd.Timestamp(start).value, side='left'))
+        if end is not None:
+            hi = int(np.searchsorted(self.dates, pd.Timestamp(end).value, side='right'))
+        if count is not None:
+            lo = max(lo, hi - count)
+        return lo, max(lo, hi)
+
+    def slice(self, start=None, end=None, count=None):
+        """返回时间范围内各列的切片视图（零拷贝）"""
+        lo, hi = self.locate(start, end, count)
+        return {column: values[lo:hi] for column, values in self.columns.items()}
+
+    def frame(self, start=None, end=None, count=None):
+        """返回时间范围内的数据帧，与 local_store.load_year_frame 的列一致"""
+        views = self.slice(start, end, count)
+        columns = {'date': views['date'].view('datetime64[ns]')}
+        for column in PRICE_COLUMNS:
+            columns[column] = views[column]
+        return pd.DataFrame(columns, columns=FRAME_COLUMNS)
+
+
+def build_symbol_store(code, sources=None):
+    """
+    从各年份数据构建某只股票的存储目录
+
+    Args:
+        code: 股票代码
+        sources: 源文件签名，默认重新收集
+
+    Returns:
+        str: 存储目录；没有任何数据时返回None
+    """
+    if sources is None:
+        sources = _collect_sources(code)
+    if not sources:
+        return None
+
+    root = get_store_root(code)
+    digest = _sources_digest(sources)
+    directory = os.path.join(root, digest)
+    if os.path.isdir(directory):
+        return directory
+
+    frames = []
+    for year in sorted(sources, key=int):
+        df_year = load_year_frame(code, int(year))
+        if df_year is not None and not df_year.empty:
+            frames.append(df_year)
+
+    if frames:
+        df = pd.concat(frames, ignore_index=True)
+        df = df.sort_values('date', kind='stable')
+    else:
+        df = pd.DataFrame({column: [] for column in FRAME_COLUMNS})
+        df['date'] = pd.to_datetime(df['date'])
+
+    os.makedirs(root, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.build-', dir=root)
+    try:
+        np.save(os.path.join(tmp_dir, 'date.npy'), df['date'].values.astype('datetime64[ns]').view(np.int64))
+        for column in PRICE_COLUMNS:
+            np.save(os.path.join(tmp_dir, f"{column}.npy"), df[column].to_numpy(dtype=np.float64))
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': STORE_FORMAT_VERSION, 'sources': sources, 'rows': len(df)}, f)
+        os.rename(tmp_dir, directory)
+    except OSError:
+        # 其他进程已经构建了相同的目录
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(directory):
+            raise
+
+    _remove_stale_builds(root, digest)
+    return directory
+
+
+def _remove_stale_builds(root, digest):
+    """删除旧摘要目录；在Windows上仍被映射的目录会删除失败，留待下次清理"""
+    for name in os.listdir(root):
+        if name != digest and not name.startswith('.build-'):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def open_symbol_store(code, build=True):
+    """
+    打开某只股票的存储，源文件变化时重新构建
+
+    Args:
+        code: 股票代码
+        build: 存储不存在或已过期时是否构建
+
+    Returns:
+        SymbolStore: 没有数据或不允许构建时返回None
+    """
+    market, stock_code, filename = get_stock_filename(code)
+    key = (market, stock_code)
+
+    sources = _collect_sources(code)
+    if not sources:
+        return None
+    digest = _sources_digest(sources)
+
+    store = _open_stores.get(key)
+    if store is not None and store.digest == digest:
+        return store
+
+    directory = os.path.join(get_store_root(code), digest)
+    if not os.path.isdir(directory):
+        if not build:
+            return None
+        directory = build_symbol_store(code, sources)
+
+    store = SymbolStore(code, directory, digest)
+    _open_stores[key] = store
+    return store
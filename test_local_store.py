@@ -0,0 +1,792 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试本地数据读取层（二进制列缓存、内存缓存、内存映射存储）
+"""
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import local_store
+from frame_cache import ByteLRUCache
+from catalog import get_catalog
+from config import get_data_file_path
+
+
+def test_binary_cache_roundtrip(tmp_path, monkeypatch):
+    """首次读取写入缓存，再次读取直接命中缓存且结果一致"""
+    monkeypatch.setattr(local_store, 'CACHE_PATH', str(tmp_path))
+    monkeypatch.setattr(local_store, 'frame_cache', ByteLRUCache(64 * 1024 * 1024))
+
+    expected = local_store.parse_csv_file(get_data_file_path('sh600000', 2024))
+    first = local_store.load_year_frame('sh600000', 2024)
+    cache_path = local_store.get_cache_file_path('sh600000', 2024)
+    assert os.path.exists(cache_path)
+
+    # 缓存命中时不应再解析CSV
+    def fail_parse(*args):
+        raise AssertionError('缓存命中时不应解析CSV')
+
+    monkeypatch.setattr(local_store, 'frame_cache', ByteLRUCache(64 * 1024 * 1024))
+    monkeypatch.setattr(local_store, '_read_csv', fail_parse)
+    second = local_store.load_year_frame('sh600000', 2024)
+
+    pd.testing.assert_frame_equal(first, expected)
+    pd.testing.assert_frame_equal(second, expected)
+
+
+def test_binary_cache_invalidated_by_source_change(tmp_path, monkeypatch):
+    """源文件签名变化时缓存失效"""
+    monkeypatch.setattr(local_store, 'CACHE_PATH', str(tmp_path))
+    monkeypatch.setattr(local_store, 'frame_cache', ByteLRUCache(64 * 1024 * 1024))
+    local_store.load_year_frame('sz000001', 2024)
+
+    mtime_ns, size = local_store.get_source_signature(get_data_file_path('sz000001', 2024))
+    cache_path = local_store.get_cache_file_path('sz000001', 2024)
+    assert local_store._load_binary_cache(cache_path, (mtime_ns, size)) is not None
+    assert local_store._load_binary_cache(cache_path, (mtime_ns + 1, size)) is None
+
+
+def test_symbol_store_matches_year_path(tmp_path, monkeypatch):
+    """内存映射存储的查询结果与按年份读取一致"""
+    import Ashare
+    import symbol_store
+    monkeypatch.setattr(local_store, 'CACHE_PATH', str(tmp_path))
+    monkeypatch.setattr(local_store, 'frame_cache', ByteLRUCache(64 * 1024 * 1024))
+    monkeypatch.setattr(symbol_store, 'CACHE_PATH', str(tmp_path))
+    monkeypatch.setattr(Ashare, 'ROLLUPS_ENABLED', False)
+
+    queries = [
+        dict(count=10, frequency='1d'),
+        dict(count=5, frequency='1w'),
+        dict(count=10, frequency='1d', end_date='2024-02-20'),
+        dict(count=10, frequency='1d', start_date='2024-01-10', end_date='2024-02-20'),
+    ]
+    for query in queries:
+        monkeypatch.setattr(Ashare, 'SYMBOL_STORE_ENABLED', False)
+        expected = Ashare.get_price_local('sh600000', **query)
+        monkeypatch.setattr(Ashare, 'SYMBOL_STORE_ENABLED', True)
+        actual = Ashare.get_price_local('sh600000', **query)
+        assert not expected.empty
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+    store = symbol_store.open_symbol_store('sh600000')
+    lo, hi = store.locate('2024-01-03', '2024-01-05 23:59:59')
+    assert hi - lo == 3
+    assert isinstance(store.slice(count=2)['close'], np.memmap)
+
+
+def test_frame_cache_hits_and_invalidation(tmp_path, monkeypatch):
+    """重复读取命中内存缓存，源文件签名变化后重新加载"""
+    monkeypatch.setattr(local_store, 'CACHE_PATH', str(tmp_path))
+    cache = ByteLRUCache(64 * 1024 * 1024)
+    monkeypatch.setattr(local_store, 'frame_cache', cache)
+
+    first = local_store.load_year_frame('sh600000', 2024)
+    second = local_store.load_year_frame('sh600000', 2024)
+    assert second is first
+    assert cache.stats()['hits'] == 1
+
+    record = get_catalog().entry('sh600000', 2024)
+    monkeypatch.setitem(record, 'mtime_ns', record['mtime_ns'] + 1)
+    third = local_store.load_year_frame('sh600000', 2024)
+    assert third is not first
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_byte_lru_eviction():
+    """超过字节预算时淘汰最久未使用的条目"""
+    cache = ByteLRUCache(100)
+    cache.put('a', 1, 40)
+    cache.put('b', 2, 40)
+    assert cache.get('a') == 1
+    cache.put('c', 3, 40)
+
+    assert 'b' not in cache
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+    assert not cache.put('d', 4, 101)
+
+
+def test_catalog_index(tmp_path):
+    """数据目录索引记录年份、行数和首末时间，并可从索引文件恢复"""
+    from catalog import DataCatalog
+    from config import LOCAL_DATA_PATH
+
+    index_path = str(tmp_path / 'catalog.json')
+    catalog = DataCatalog(LOCAL_DATA_PATH, index_path)
+    catalog.refresh()
+
+    expected = local_store.parse_csv_file(get_data_file_path('sh600000', 2024))
+    record = catalog.entry('600000.XSHG', 2024)
+    assert catalog.years('sh600000') == [2024]
+    assert record['rows'] == len(expected)
+    assert record['first'] == expected['date'].iloc[0].strftime('%Y-%m-%d %H:%M:%S')
+    assert catalog.latest_timestamp('sh600000') == expected['date'].iloc[-1].strftime('%Y-%m-%d %H:%M:%S')
+    assert ('SH', '600000') in catalog.symbols()
+
+    reloaded = DataCatalog(LOCAL_DATA_PATH, index_path)
+    assert reloaded._load_index() == catalog._files
+
+
+def test_read_csv_tail(monkeypatch):
+    """从文件末尾读取的数据与完整解析结果的尾部一致"""
+    monkeypatch.setattr(local_store, 'TAIL_READ_BLOCK_SIZE', 200)
+    file_path = get_data_file_path('sh600000', 2024)
+    expected = local_store.parse_csv_file(file_path)
+
+    tail, complete = local_store.read_csv_tail(file_path, 5, '1d')
+    assert not complete
+    assert 5 < len(tail) < len(expected)
+    pd.testing.assert_frame_equal(tail, expected.tail(len(tail)).reset_index(drop=True))
+
+    whole, complete = local_store.read_csv_tail(file_path, len(expected) + 10, '1d')
+    assert complete
+    pd.testing.assert_frame_equal(whole, expected)
+
+
+def test_gbk_encoding_sniffed_and_normalized(tmp_path):
+    """索引识别GBK编码，转换为UTF-8后内容不变"""
+    from catalog import DataCatalog
+
+    source = get_data_file_path('sh600000', 2024)
+    with open(source, 'r', encoding='utf-8') as f:
+        text = f.read()
+    year_dir = tmp_path / 'data' / '2024'
+    year_dir.mkdir(parents=True)
+    gbk_path = str(year_dir / 'SH.600000.csv')
+    with open(gbk_path, 'w', encoding='gbk') as f:
+        f.write(text)
+
+    catalog = DataCatalog(str(tmp_path / 'data'), str(tmp_path / 'catalog.json'))
+    catalog.refresh()
+    assert catalog.encoding('sh600000', 2024) == 'gbk'
+
+    expected = local_store.parse_csv_file(source)
+    pd.testing.assert_frame_equal(local_store.parse_csv_file(gbk_path, 'gbk'), expected)
+
+    assert local_store.normalize_csv_encoding(gbk_path, 'gbk')
+    assert not local_store.normalize_csv_encoding(gbk_path)
+    pd.testing.assert_frame_equal(local_store.parse_csv_file(gbk_path, 'utf-8'), expected)
+
+
+def test_ingest_file_skips_up_to_date_cache(tmp_path, monkeypatch):
+    """批量导入写入二进制缓存，缓存已是最新时跳过"""
+    import rollups
+    from ashare_ingest.ingest import ingest_file
+    monkeypatch.setattr(local_store, 'CACHE_PATH', str(tmp_path))
+    monkeypatch.setattr(rollups, 'CACHE_PATH', str(tmp_path))
+
+    signature = get_catalog().signature('sh600000', 2024)
+    first = ingest_file('sh600000', 2024, signature)
+    assert first['status'] == 'converted'
+    assert first['rows'] == len(local_store.parse_csv_file(get_data_file_path('sh600000', 2024)))
+    assert local_store.binary_cache_signature('sh600000', 2024) == signature
+    assert first['rollups'] and rollups.rollup_signature('sh600000', 2024) == signature
+
+    assert ingest_file('sh600000', 2024, signature)['status'] == 'skipped'
+    assert ingest_file('sh600000', 2024, signature, force=True)['status'] == 'converted'
+
+
+def test_compact_frame_roundtrip(tmp_path, monkeypatch):
+    """紧凑存储无损还原，启用后内存缓存按紧凑大小计算"""
+    from compact_frame import CompactFrame
+
+    expected = local_store.parse_csv_file(get_data_file_path('sh600000', 2024))
+    compact = CompactFrame.from_frame(expected)
+    assert compact.columns['open'].dtype == np.int32 and compact.columns['date'].dtype == np.int32
+    assert compact.nbytes * 2 <= expected.memory_usage(index=True).sum()
+    pd.testing.assert_frame_equal(compact.to_frame(), expected, check_exact=True)
+
+    # 无法用分或整分钟表示的数据保留原始类型
+    irregular = pd.DataFrame({'date': pd.to_datetime(['2024-01-02 09:31:07', '2024-01-02 09:32:00']),
+                              'close': [1.234567, 2.5]})
+    pd.testing.assert_frame_equal(CompactFrame.from_frame(irregular).to_frame(), irregular, check_exact=True)
+
+    monkeypatch.setattr(local_store, 'CACHE_PATH', str(tmp_path))
+    monkeypatch.setattr(local_store, 'COMPACT_FRAME_CACHE', True)
+    cache = ByteLRUCache(64 * 1024 * 1024)
+    monkeypatch.setattr(local_store, 'frame_cache', cache)
+    local_store.load_year_frame('sh600000', 2024)
+    pd.testing.assert_frame_equal(local_store.load_year_frame('sh600000', 2024), expected, check_exact=True)
+    assert cache.stats()['hits'] == 1 and cache.stats()['bytes'] == compact.nbytes
+
+
+def test_hourly_aggregation_matches_daily_loop():
+    """向量化小时线聚合与逐日循环的结果一致"""
+    import Ashare
+    from bench_aggregation import legacy_aggregate_hourly, make_minute_data
+
+    df = make_minute_data(years=1)
+    pd.testing.assert_frame_equal(Ashare.aggregate_hourly_trading_data(df), legacy_aggregate_hourly(df))
+
+
+def test_rollups_match_minute_aggregation(tmp_path, monkeypatch):
+    """预聚合K线与实时聚合分钟数据的结果一致"""
+    import Ashare
+    import rollups
+    monkeypatch.setattr(local_store, 'CACHE_PATH', str(tmp_path))
+    monkeypatch.setattr(rollups, 'CACHE_PATH', str(tmp_path))
+    monkeypatch.setattr(local_store, 'frame_cache', ByteLRUCache(64 * 1024 * 1024))
+    monkeypatch.setattr(rollups, 'frame_cache', local_store.frame_cache)
+
+    queries = [
+        dict(count=10, frequency='1d'),
+        dict(count=5, frequency='1w'),
+        dict(count=2, frequency='1M'),
+        dict(count=10, frequency='1d', end_date='2024-02-20'),
+        dict(count=10, frequency='1d', start_date='2024-01-10', end_date='2024-02-20'),
+    ]
+    for query in queries:
+        monkeypatch.setattr(Ashare, 'ROLLUPS_ENABLED', False)
+        expected = Ashare.get_price_local('sh600000', **query)
+        monkeypatch.setattr(Ashare, 'ROLLUPS_ENABLED', True)
+        actual = Ashare.get_price_local('sh600000', **query)
+        assert not expected.empty
+        pd.testing.assert_frame_equal(actual, expected)
+
+    assert os.path.exists(rollups.get_rollup_file_path('sh600000', 2024))
+
+
+def test_bar_aggregator_matches_batch_aggregation():
+    """逐根推入分钟数据的增量聚合与批量聚合一致，同一分钟再次推入时替换而不是累加"""
+    from aggregation import aggregate_bars
+    from bar_aggregator import BarAggregator
+    from bench_aggregation import make_minute_data
+
+    df = make_minute_data(years=1).head(5000)
+    for frequency in ('5m', '60m', '1d'):
+        aggregator = BarAggregator(frequency, max_bars=10000)
+        aggregator.push_frame(df)
+        expected = aggregate_bars(df, frequency).set_index('date')[['open', 'close', 'high', 'low', 'volume']]
+        expected.index.name = ''
+        pd.testing.assert_frame_equal(aggregator.bars(), expected, check_dtype=False)
+
+    aggregator = BarAggregator('5m')
+    assert aggregator.push('2024-01-02 09:31', 10.0, 10.5, 9.9, 10.2, 100)['type'] == 'new'
+    assert aggregator.push('2024-01-02 09:32', 10.2, 10.8, 10.1, 10.3, 50)['type'] == 'update'
+    event = aggregator.push('2024-01-02 09:32', 10.2, 10.4, 10.1, 10.25, 70)
+    assert event['type'] == 'update'
+    assert (event['bar']['high'], event['bar']['close'], event['bar']['volume']) == (10.5, 10.25, 170)
+    assert aggregator.push('2024-01-02 09:31', 1.0, 1.0, 1.0, 1.0, 1) is None
+
+
+def test_count_aware_aggregation_matches_full():
+    """只聚合尾部窗口得到的最后 count 根K线与聚合全部数据一致"""
+    from aggregation import aggregate_bars
+    from bench_aggregation import make_minute_data
+
+    df = make_minute_data(years=1)
+    df = df[(df['date'] < '2015-02-09') | (df['date'] >= '2015-02-23')]
+    for frequency in ('1m', '5m', '30m', '60m', '1d', '1w', '1M'):
+        for count in (1, 7, 100):
+            expected = aggregate_bars(df, frequency).tail(count).reset_index(drop=True)
+            actual = aggregate_bars(df, frequency, count).tail(count).reset_index(drop=True)
+            pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_trading_calendar_skips_holidays_and_breaks():
+    """交易日历跳过周末、节假日和午休，K线时间与聚合结果一致"""
+    from aggregation import aggregate_bars
+    from bench_aggregation import make_minute_data
+    from trading_calendar import TradingCalendar
+
+    calendar = TradingCalendar(['2024-10-01', '2024-10-02', '2024-10-03', '2024-10-04', '2024-10-07'],
+                               {'2024-12-31': '11:30'})
+    assert not calendar.is_trading_day('2024-10-01')
+    assert calendar.next_trading_day('2024-09-30') == pd.Timestamp('2024-10-08')
+    assert calendar.previous_trading_day('2024-10-08') == pd.Timestamp('2024-09-30')
+    assert len(calendar.trading_days('2024-09-28', '2024-10-13')) == 5
+
+    assert calendar.next_bar_time('2024-09-30 11:30', '60m') == pd.Timestamp('2024-09-30 14:00')
+    assert calendar.next_bar_time('2024-09-30 15:00', '5m') == pd.Timestamp('2024-10-08 09:30')
+    assert calendar.next_bar_time('2024-12-31 11:30', '30m') == pd.Timestamp('2025-01-01 09:30')
+    assert calendar.next_bar_time('2024-09-25', '1w') == pd.Timestamp('2024-10-06')
+    assert calendar.next_bar_time('2024-09-30', '1M') == pd.Timestamp('2024-10-31')
+
+    # 只比较交易时段内的分钟（模拟数据含集合竞价和盘后数据）
+    df = make_minute_data(years=1).head(5000)
+    time_of_day = df['date'] - df['date'].dt.normalize()
+    df = df[(time_of_day >= pd.Timedelta('09:30:00')) & (time_of_day <= pd.Timedelta('15:00:00'))]
+    for frequency in ('5m', '15m', '30m', '60m'):
+        times = aggregate_bars(df, frequency)['date']
+        times = np.unique((times - times.dt.normalize()).values.view(np.int64))
+        np.testing.assert_array_equal(times, calendar.bar_times(frequency))
+
+
+def test_get_price_many_matches_single_reads():
+    """批量读取与逐只读取结果一致，单只股票失败不影响其他股票"""
+    import Ashare
+    from batch_fetch import get_price_many
+
+    codes = ['sh600000', 'sz000001', 'sh999999']
+    for workers in (1, 2):
+        frames, errors = get_price_many(codes, frequency='1d', count=50, workers=workers)
+        assert list(frames) == ['sh600000', 'sz000001']
+        assert list(errors) == ['sh999999']
+        for code, df in frames.items():
+            pd.testing.assert_frame_equal(df, Ashare.get_price_local(code, count=50, frequency='1d'))
+
+    df, errors = get_price_many(codes, frequency='1d', count=50, workers=1, long_format=True)
+    assert df['code'].unique().tolist() == ['sh600000', 'sz000001']
+    assert list(df.columns) == ['code', 'date', 'open', 'close', 'high', 'low', 'volume']
+
+
+def test_end_date_only_query_returns_last_count_bars():
+    """只指定结束日期时返回截止到该日期的最后 count 根K线；同时指定开始日期时返回区间内全部K线"""
+    import Ashare
+
+    df = Ashare.read_local_bars('sh600000', end_date='2024-02-29', count=5, frequency='1d')
+    assert list(df.index.strftime('%Y-%m-%d')) == ['2024-02-23', '2024-02-26', '2024-02-27', '2024-02-28', '2024-02-29']
+
+    df = Ashare.read_local_bars('sh600000', start_date='2024-02-01', end_date='2024-02-29', count=5, frequency='1d')
+    assert len(df) == 16 and df.index[0] == pd.Timestamp('2024-02-01') and df.index[-1] == pd.Timestamp('2024-02-29')
+
+
+def test_kline_json_matches_row_serialization():
+    """向量化序列化与逐行构造字典再 json.dumps 的结果一致，NaN/无穷大写为 null"""
+    import json
+    from kline_json import kline_to_json
+
+    index = pd.date_range('2024-01-02 09:35', periods=50, freq='5min')
+    df = pd.DataFrame({'open': np.linspace(10, 11, 50), 'close': np.linspace(10.1, 11.1, 50),
+                       'high': np.linspace(10.2, 11.2, 50), 'low': np.linspace(9.9, 10.9, 50),
+                       'volume': np.arange(50) * 100}, index=index)
+    df.iloc[3, 0] = np.nan
+    df.iloc[7] = np.nan
+    df.iloc[9, 4] = np.inf
+
+    def number(value):
+        return float(value) if np.isfinite(value) else None
+
+    expected = [{'date': date.strftime('%Y-%m-%d %H:%M:%S'), 'open': number(row['open']),
+                 'close': number(row['close']), 'low': number(row['low']), 'high': number(row['high']),
+                 'volume': number(row['volume'])} for date, row in df.iterrows()]
+    assert kline_to_json(df) == json.dumps(expected, separators=(',', ':'), allow_nan=False)
+
+    def reject(constant):
+        raise ValueError(f"不是合法的JSON: {constant}")
+
+    columnar = json.loads(kline_to_json(df, 'columnar'), parse_constant=reject)
+    assert columnar['t'] == [row['date'] for row in expected]
+    assert columnar['o'][3] is None and columnar['c'][7] is None and columnar['v'][9] is None
+    assert columnar['v'] == [row['volume'] for row in expected]
+
+
+def test_kline_binary_roundtrip():
+    """二进制格式无损还原价格，float32 无法还原时改用 float64"""
+    from kline_binary import FLAG_FLOAT64_PRICES, pack_kline, unpack_kline
+
+    index = pd.date_range('2024-01-02 09:31', periods=240, freq='1min')
+    df = pd.DataFrame({'open': np.linspace(10, 11, 240).round(2), 'close': np.linspace(10.1, 11.1, 240).round(3),
+                       'high': np.linspace(3000, 3100, 240).round(2), 'low': np.linspace(9.9, 10.9, 240).round(2),
+                       'volume': np.arange(240) * 123456789.0}, index=index)
+    df.index.name = ''
+
+    data = pack_kline(df)
+    assert len(data) == 16 + 240 * (8 + 8 + 4 * 4)
+    pd.testing.assert_frame_equal(unpack_kline(data), df, check_freq=False)
+
+    df['high'] += 0.0001
+    data = pack_kline(df)
+    assert int.from_bytes(data[6:8], 'little') & FLAG_FLOAT64_PRICES
+    pd.testing.assert_frame_equal(unpack_kline(data), df, check_freq=False)
+
+
+def test_get_price_before_pages_are_contiguous():
+    """按游标向前翻页，各页拼接后与一次读取的结果相同，没有重叠和遗漏"""
+    import Ashare
+
+    expected = Ashare.get_price_local('sh600000', count=1000, frequency='1d')
+    pages = []
+    before = expected.index[-1] + pd.Timedelta(days=1)
+    while True:
+        page = Ashare.get_price_before('sh600000', before, count=10, frequency='1d')
+        if page.empty:
+            break
+        assert len(page) <= 10 and (page.index < before).all()
+        pages.insert(0, page)
+        before = page.index[0]
+
+    pd.testing.assert_frame_equal(pd.concat(pages), expected)
+
+
+def test_http_cache_validators_and_compression():
+    """ETag 由文件签名和参数决定，客户端缓存有效时判定为未修改；压缩后内容可还原"""
+    import gzip
+    from flask import Flask, Response
+    from http_cache import compress_response, is_not_modified, kline_validators
+
+    query = ('SH', '600000', '1d', None, '2024-01-05', None, 100, 'rows')
+    etag, last_modified, closed = kline_validators('sh600000', '2024-01-05', query)
+    assert kline_validators('sh600000', '2024-01-05', query)[0] == etag
+    assert kline_validators('sh600000', '2024-01-05', query[:-1] + ('columnar',))[0] != etag
+    assert closed and not kline_validators('sh600000', None, query)[2]
+    assert kline_validators('sh999999', None, query) is None
+
+    app = Flask(__name__)
+    with app.test_request_context(headers={'If-None-Match': f'W/"{etag}"'}) as context:
+        assert is_not_modified(context.request, (etag, last_modified, closed))
+    with app.test_request_context(headers={'If-None-Match': '"other"'}) as context:
+        assert not is_not_modified(context.request, (etag, last_modified, closed))
+
+    body = b'[' + b','.join(b'{"close":10.0}' for _ in range(1000)) + b']'
+    with app.test_request_context(headers={'Accept-Encoding': 'gzip'}) as context:
+        response = compress_response(Response(body, mimetype='application/json'), context.request.accept_encodings)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()) == body
+
+
+def test_response_cache_canonical_query_and_invalidation(monkeypatch):
+    """不同写法的同一查询命中同一条目，数据文件签名变化后条目失效"""
+    import response_cache
+
+    monkeypatch.setattr(response_cache, 'response_cache', ByteLRUCache(1024 * 1024))
+    query = response_cache.canonical_query('sh600000', '60m', 100, end_date='2024-01-05')
+    assert response_cache.canonical_query('600000.XSHG', '60m', 100, end_date='2024-01-05 15:00:00') == query
+    assert response_cache.canonical_query('600000', '60m', 200, end_date='2024-01-05') != query
+    assert response_cache.canonical_query('600000', '60m', 100, end_date='bad') is None
+
+    cached, signature = response_cache.lookup_response(query, 'rows')
+    assert cached is None and signature
+    response_cache.store_response(query, 'rows', signature, b'[]', 'application/json', {'X-Next-Before': 'x'})
+    assert response_cache.lookup_response(query, 'rows')[0] == (b'[]', 'application/json', {'X-Next-Before': 'x'})
+    assert response_cache.lookup_response(query, 'columnar')[0] is None
+
+    monkeypatch.setattr(response_cache, 'query_signature', lambda query: signature + ((2025, 0, 0),))
+    assert response_cache.lookup_response(query, 'rows')[0] is None
+    assert response_cache.cache_stats()['invalidations'] == 1
+
+
+def test_request_log_one_record_per_request_with_sampling(caplog, monkeypatch):
+    """每个请求输出一条结构化记录，成功的请求按比例抽样，出错的请求总是记录"""
+    import json
+    import logging
+    from flask import Flask
+    import request_log
+
+    app = Flask(__name__)
+    request_log.install_request_logging(app)
+
+    @app.route('/ok')
+    def ok():
+        with request_log.stage('read'):
+            request_log.note(rows=3)
+        return 'ok'
+
+    @app.route('/fail')
+    def fail():
+        request_log.note(error='boom')
+        return 'fail'
+
+    client = app.test_client()
+    with caplog.at_level(logging.INFO, logger=request_log.REQUEST_LOGGER):
+        client.get('/ok?code=sh600000')
+        monkeypatch.setattr(request_log, 'LOG_SAMPLE_RATE', 0.0)
+        client.get('/ok')
+        client.get('/fail')
+
+    records = [json.loads(record.getMessage()) for record in caplog.records]
+    assert [record['path'] for record in records] == ['/ok', '/fail']
+    assert records[0]['params'] == {'code': 'sh600000'} and records[0]['rows'] == 3 and 'read' in records[0]['stages']
+    assert records[1]['error'] == 'boom'
+
+
+def test_preload_fills_frame_cache(tmp_path, monkeypatch):
+    """预加载把各股票最近的年份数据载入内存缓存，之后读取直接命中"""
+    from ashare_serve import preload as preload_module
+
+    cache = ByteLRUCache(64 * 1024 * 1024)
+    monkeypatch.setattr(local_store, 'CACHE_PATH', str(tmp_path))
+    monkeypatch.setattr(local_store, 'frame_cache', cache)
+    monkeypatch.setattr(preload_module, 'frame_cache', cache)
+    monkeypatch.setattr(preload_module, 'ROLLUPS_ENABLED', False)
+
+    codes = preload_module.resolve_preload_codes(['*'])
+    assert 'sh600000' in codes
+    summary = preload_module.preload(codes, years=1)
+    assert summary['complete'] and summary['files'] == len(codes) and summary['failed'] == 0
+
+    hits = cache.stats()['hits']
+    local_store.load_year_frame('sh600000', 2024)
+    assert cache.stats()['hits'] == hits + 1
+
+
+def test_replay_batches_match_aggregation_and_resume(monkeypatch):
+    """回放推送的K线最终状态与批量聚合一致，从中途的消息 id 续播得到相同结果"""
+    from types import SimpleNamespace
+
+    import replay
+    from aggregation import aggregate_bars
+    from bench_aggregation import make_minute_data
+
+    minutes = make_minute_data(years=1)
+    monkeypatch.setattr(replay, 'get_catalog', lambda: SimpleNamespace(years=lambda code: [2015]))
+    monkeypatch.setattr(replay, 'load_year_frame', lambda code, year: minutes)
+
+    end = '2015-02-27 15:00:00'
+    df = minutes[minutes['date'] <= end]
+    for frequency in ('1m', '30m', '1d', '1w'):
+        expected = aggregate_bars(df, frequency)
+        expected['date'] = expected['date'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        expected = expected[['date', 'open', 'high', 'low', 'close', 'volume']].to_dict('records')
+
+        batches = list(replay.replay_batches('sh600000', frequency, end=end, batch_minutes=7))
+        replayed = {}
+        for minute, bars in batches:
+            replayed.update((bar['date'], bar) for bar in bars)
+        assert list(replayed.values()) == expected
+
+        # 断开后从某条消息的 id 续播，正在形成的K线从已发生的分钟继续
+        cursor = len(batches) // 2 + 3
+        resumed = {}
+        for minute, bars in batches[:cursor]:
+            resumed.update((bar['date'], bar) for bar in bars)
+        for minute, bars in replay.replay_batches('sh600000', frequency, after=batches[cursor - 1][0], end=end,
+                                                  batch_minutes=5):
+            resumed.update((bar['date'], bar) for bar in bars)
+        assert list(resumed.values()) == expected
+
+
+def test_indicators_match_mytt_and_serialize_nulls():
+    """指标参数解析、按K线对齐的列式结果与直接调用 MyTT 一致，数据不足的位置为 null"""
+    import json
+
+    import MyTT
+    from indicators import compute_indicators, indicators_to_json, parse_indicator_specs
+
+    specs = parse_indicator_specs('MA:5, ma:5,MACD,KDJ:9:3:3,BOLL:20:2.5')
+    assert specs == (('MA', (5,)), ('MACD', ()), ('KDJ', (9, 3, 3)), ('BOLL', (20, 2.5)))
+    for names in ('FOO', 'MA', 'MA:5:6', 'MA:x', 'MA:0', ''):
+        with pytest.raises(ValueError):
+            parse_indicator_specs(names)
+    # 周期参数须为整数，BOLL 的倍数可以是小数
+    for names in ('MA:2.5', 'BOLL:20.5:2', 'KDJ:9:3.5:3'):
+        with pytest.raises(ValueError, match='指标参数应为整数'):
+            parse_indicator_specs(names)
+    assert parse_indicator_specs('MA:5.0') == (('MA', (5,)),)
+
+    dates = pd.date_range('2024-01-02', periods=60, freq='D')
+    close = 10 + np.sin(np.arange(60) / 5)
+    df = pd.DataFrame({'open': close, 'close': close + 0.1, 'high': close + 0.3, 'low': close - 0.2,
+                       'volume': np.full(60, 1000.0)}, index=dates)
+    result = json.loads(indicators_to_json(df, compute_indicators(df, specs)))
+
+    assert result['t'][0] == '2024-01-02 00:00:00' and len(result['t']) == 60
+    assert result['MA:5'][:4] == [None] * 4
+    np.testing.assert_allclose(result['MA:5'][4:], MyTT.MA(df['close'].values, 5)[4:], atol=1e-4)
+    dif, dea, macd = MyTT.MACD(df['close'].values)
+    np.testing.assert_allclose(result['MACD']['DEA'], dea, atol=1e-4)
+    assert set(result['KDJ:9:3:3']) == {'K', 'D', 'J'} and result['BOLL:20:2.5']['MID'][18] is None
+
+
+def test_kline_batch_matches_single_queries_and_shares_cache(tmp_path, monkeypatch):
+    """批量查询的各项结果与单独读取一致、顺序与请求相同，失败的项不影响其他项，再次查询命中响应缓存"""
+    import json
+
+    import Ashare
+    import response_cache
+    from kline_batch import batch_to_json, fetch_batch
+    from kline_json import kline_to_json
+
+    monkeypatch.setattr(local_store, 'CACHE_PATH', str(tmp_path))
+    monkeypatch.setattr(local_store, 'frame_cache', ByteLRUCache(64 * 1024 * 1024))
+    monkeypatch.setattr(response_cache, 'response_cache', ByteLRUCache(1024 * 1024))
+
+    specs = [
+        {'code': 'sh600000', 'frequency': '1d', 'count': 3},
+        {'code': 'sz000001', 'frequency': '1d', 'count': 10, 'start_date': '2024-01-03'},
+        {'code': 'sh999999', 'frequency': '1d', 'count': 3},
+        {'code': '600000.XSHG', 'frequency': '1d', 'count': 2, 'before': '2024-01-05'},
+    ]
+    results = fetch_batch(specs, 'columnar')
+    assert [result.get('cache') for result in results] == ['miss', 'miss', None, 'miss']
+    assert 'error' in results[2]
+
+    body = json.loads(batch_to_json(results))
+    expected = Ashare.get_price_local('sz000001', frequency='1d', count=10, start_date='2024-01-03')
+    assert body['results'][1] == {'data': json.loads(kline_to_json(expected, 'columnar'))}
+    assert body['results'][3]['data']['t'] == ['2024-01-03 00:00:00', '2024-01-04 00:00:00']
+    assert body['results'][3]['next_before'] == '2024-01-03 00:00:00'
+
+    again = fetch_batch(specs, 'columnar')
+    assert [result.get('cache') for result in again] == ['hit', 'hit', None, 'hit']
+    assert batch_to_json(again) == batch_to_json(results)
+
+
+def test_kline_batch_reports_read_errors(tmp_path, monkeypatch):
+    """有本地数据但读取失败的查询在结果中为错误，而不是空数据"""
+    import Ashare
+    import response_cache
+    from kline_batch import fetch_batch
+
+    monkeypatch.setattr(local_store, 'CACHE_PATH', str(tmp_path))
+    monkeypatch.setattr(response_cache, 'response_cache', ByteLRUCache(1024 * 1024))
+    read_local_bars = Ashare.read_local_bars
+
+    def failing_read(code, **kwargs):
+        if code == 'sz000001':
+            raise ValueError('数据文件损坏')
+        return read_local_bars(code, **kwargs)
+
+    monkeypatch.setattr(Ashare, 'read_local_bars', failing_read)
+    results = fetch_batch([
+        {'code': 'sz000001', 'frequency': '1d', 'count': 3},
+        {'code': 'sz000001', 'frequency': '1d', 'count': 3, 'before': '2024-01-05'},
+        {'code': 'sh600000', 'frequency': '1d', 'count': 3},
+    ], 'columnar')
+    assert results[0] == {'error': 'ValueError: 数据文件损坏'}
+    assert results[1] == {'error': 'ValueError: 数据文件损坏'}
+    assert results[2]['cache'] == 'miss'
+
+
+def test_small_count_aggregates_only_trailing_minutes(monkeypatch):
+    """未指定开始日期且 count 较小时，只聚合最后 count 根K线所需的分钟数据，结果与聚合全部数据的末尾一致"""
+    import Ashare
+    import aggregation
+    from bench_aggregation import make_minute_data
+
+    minutes = make_minute_data(years=1)
+    monkeypatch.setattr(Ashare, 'ROLLUPS_ENABLED', False)
+    monkeypatch.setattr(Ashare, 'SYMBOL_STORE_ENABLED', False)
+    monkeypatch.setattr(Ashare, '_read_local_minutes', lambda *args, **kwargs: minutes.copy())
+
+    windows = []
+    trailing_window = aggregation.trailing_window
+
+    def spy(df, frequency, count):
+        window = trailing_window(df, frequency, count)
+        windows.append((count, len(window)))
+        return window
+
+    monkeypatch.setattr(aggregation, 'trailing_window', spy)
+    df = Ashare.read_local_bars('sh600000', count=10, frequency='60m')
+    assert windows == [(10, windows[0][1])] and windows[0][1] <= 11 * 60
+
+    expected = aggregation.aggregate_bars(minutes, '60m').tail(10)
+    assert list(df.index) == list(expected['date'])
+    np.testing.assert_allclose(df['close'].to_numpy(), expected['close'].to_numpy())
+
+
+def test_latest_bars_reseed_on_rewrite_and_per_key_seeding(monkeypatch):
+    """数据文件只在末尾追加时增量更新，改写时重新初始化；冷启动读取不阻塞其他股票；聚合器数量受字节预算限制"""
+    import threading
+    from types import SimpleNamespace
+
+    import bar_aggregator
+
+    state = {'latest': pd.Timestamp('2024-01-02 15:00'), 'signatures': {}}
+    seeds = []
+    seeding, release = threading.Event(), threading.Event()
+
+    def seed_bars(code, count, frequency):
+        seeds.append(code)
+        if code == 'sz000001':
+            seeding.set()
+            release.wait(5)
+        return pd.DataFrame({'open': [1.0], 'close': [1.0], 'high': [1.0], 'low': [1.0], 'volume': [1.0]},
+                            index=pd.DatetimeIndex(['2024-01-02']))
+
+    catalog = SimpleNamespace(latest_timestamp=lambda code: state['latest'],
+                              signatures=lambda code: state['signatures'].get(code, ((2024, 1, 100),)))
+    monkeypatch.setattr(bar_aggregator, 'get_catalog', lambda: catalog)
+    monkeypatch.setattr(bar_aggregator, 'get_price_local', seed_bars)
+    monkeypatch.setattr(bar_aggregator, '_new_minutes', lambda code, after: None)
+    monkeypatch.setattr(bar_aggregator, 'latest_bars_cache',
+                        ByteLRUCache(2 * bar_aggregator.DEFAULT_MAX_BARS * bar_aggregator.BAR_BYTES))
+
+    # sz000001 冷启动读取期间，其他股票的请求照常完成
+    slow = threading.Thread(target=bar_aggregator.get_latest_bars, args=('sz000001', '1d', 10))
+    slow.start()
+    seeding.wait(5)
+    bar_aggregator.get_latest_bars('sh600000', '1d', 10)
+    assert seeds == ['sz000001', 'sh600000']
+    release.set()
+    slow.join()
+
+    # 最新年份的文件变大视为追加，增量更新；更早年份变化或文件大小不变视为改写，重新初始化
+    state['signatures']['sh600000'] = ((2024, 2, 200),)
+    state['latest'] = pd.Timestamp('2024-01-03 15:00')
+    bar_aggregator.get_latest_bars('sh600000', '1d', 10)
+    assert seeds.count('sh600000') == 1
+    state['signatures']['sh600000'] = ((2024, 3, 200),)
+    bar_aggregator.get_latest_bars('sh600000', '1d', 10)
+    assert seeds.count('sh600000') == 2
+    state['signatures']['sh600000'] = ((2023, 1, 50), (2024, 3, 200))
+    bar_aggregator.get_latest_bars('sh600000', '1d', 10)
+    assert seeds.count('sh600000') == 3
+
+    # 预算只容纳两个聚合器，第三个加入时淘汰最久未使用的
+    bar_aggregator.get_latest_bars('sh600001', '1d', 10)
+    assert len(bar_aggregator.latest_bars_cache) == 2
+    assert bar_aggregator.latest_bars_cache.stats()['evictions'] == 1
+
+
+def test_stale_catalog_refreshes_once_in_background(monkeypatch):
+    import threading
+    import catalog as catalog_module
+
+    current = get_catalog()
+    started, release = threading.Event(), threading.Event()
+    refreshes = []
+
+    def slow_refresh():
+        refreshes.append(threading.current_thread().name)
+        started.set()
+        release.wait(5)
+        current.built_at = time.time()
+        return False
+
+    monkeypatch.setattr(current, 'refresh', slow_refresh)
+    monkeypatch.setattr(current, 'built_at', 0.0)
+    # 过期后的调用不等待扫描，扫描进行中的调用也不再启动新的扫描
+    assert get_catalog() is current
+    assert started.wait(5)
+    assert get_catalog() is current
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name == 'catalog-refresh':
+            thread.join(5)
+    assert refreshes == ['catalog-refresh']
+
+
+def test_pause_auto_refresh_waits_for_running_scan(monkeypatch):
+    """暂停自动刷新时等待正在进行的后台扫描结束，暂停期间不再启动扫描，恢复后照常刷新"""
+    import threading
+    from catalog import pause_auto_refresh, resume_auto_refresh
+
+    current = get_catalog()
+    started, release = threading.Event(), threading.Event()
+    refreshes = []
+
+    def slow_refresh():
+        refreshes.append(time.time())
+        started.set()
+        release.wait(5)
+        return False
+
+    monkeypatch.setattr(current, 'refresh', slow_refresh)
+    monkeypatch.setattr(current, 'built_at', 0.0)
+    get_catalog()
+    assert started.wait(5)
+
+    paused = threading.Event()
+    pauser = threading.Thread(target=lambda: (pause_auto_refresh(), paused.set()))
+    pauser.start()
+    assert not paused.wait(0.2)
+    release.set()
+    assert paused.wait(5)
+    pauser.join(5)
+
+    get_catalog()
+    assert len(refreshes) == 1
+    resume_auto_refresh()
+    get_catalog()
+    for thread in threading.enumerate():
+        if thread.name == 'catalog-refresh':
+            thread.join(5)
+    assert len(refreshes) == 2
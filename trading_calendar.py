@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A股交易日历与交易时段
+
+    交易时段    09:30-11:30、13:00-15:00
+    休市日      周六、周日，以及 HOLIDAYS_FILE 中列出的节假日
+    半日市      HOLIDAYS_FILE 中带收盘时间的日期，当天在该时间提前收盘
+
+bar_times() 给出每个周期在一个交易日内的全部K线时间（与 aggregation.py 的聚合规则一致），
+按 (周期, 收盘时间) 计算一次后缓存；next_bar_time() 据此推算下一根K线的时间，
+前端通过 /api/calendar 获取同样的数据，不再自行猜测交易日和K线时间。
+"""
+
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from config import HOLIDAYS_FILE
+
+logger = logging.getLogger(__name__)
+
+# 交易时段：(开盘时间, 收盘时间)，两端的分钟都有数据
+TRADING_SESSIONS = [
+    ('09:30:00', '11:30:00'),
+    ('13:00:00', '15:00:00'),
+]
+
+# 小时线的交易时段划分：(开始时间, 结束时间, K线时间)，开始时间含、结束时间不含，15:00 的收盘K线计入最后一段
+HOURLY_SESSION_BUCKETS = [
+    ('09:30:00', '10:30:00', '10:30:00'),
+    ('10:30:00', '11:30:00', '11:30:00'),
+    ('13:00:00', '14:00:00', '14:00:00'),
+    ('14:00:00', '15:00:00.000000001', '15:00:00'),
+]
+
+# 日内周期
+INTRADAY_FREQUENCIES = ('1m', '5m', '15m', '30m', '60m')
+
+MINUTE_NS = 60 * 10 ** 9
+DAY_NS = 24 * 60 * MINUTE_NS
+
+_LINE_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2})(?:\s+(\d{1,2}:\d{2}))?$')
+
+
+def _time_of_day(value):
+    """'HH:MM[:SS]' -> 当日纳秒偏移"""
+    return pd.Timedelta(value if value.count(':') == 2 else value + ':00').value
+
+
+def _day(value):
+    """日期或时间 -> numpy datetime64[D]"""
+    return np.datetime64(pd.Timestamp(value).date(), 'D')
+
+
+def load_holidays(file_path):
+    """
+    读取休市日文件
+
+    Returns:
+        tuple: (休市日列表, {提前收盘的日期: 收盘时间字符串})
+    """
+    holidays = []
+    early_closes = {}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            match = _LINE_PATTERN.match(line)
+            if match is None:
+                raise ValueError(f"休市日文件 {file_path} 第{line_number}行格式错误: {line}")
+            if match.group(2):
+                early_closes[match.group(1)] = match.group(2)
+            else:
+                holidays.append(match.group(1))
+    return holidays, early_closes
+
+
+class TradingCalendar:
+    """A股交易日历"""
+
+    def __init__(self, holidays=(), early_closes=None):
+        self.holidays = sorted({_day(day) for day in holidays})
+        self.early_closes = {_day(day): _time_of_day(close) for day, close in (early_closes or {}).items()}
+        self._busdays = np.busdaycalendar(weekmask='1111100', holidays=self.holidays)
+        self._bar_times = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, file_path):
+        """从休市日文件创建日历，文件不存在时只按周末休市"""
+        if not os.path.exists(file_path):
+            logger.info("休市日文件不存在: %s，只按周末判断交易日", file_path)
+            return cls()
+        holidays, early_closes = load_holidays(file_path)
+        return cls(holidays, early_closes)
+
+    def is_trading_day(self, day):
+        return bool(np.is_busday(_day(day), busdaycal=self._busdays))
+
+    def trading_days(self, start, end):
+        """开始日期到结束日期（都包含）之间的交易日"""
+        start_day = _day(start)
+        end_day = _day(end) + 1
+        if end_day <= start_day:
+            return pd.DatetimeIndex([])
+        days = np.arange(start_day, end_day, dtype='datetime64[D]')
+        return pd.DatetimeIndex(days[np.is_busday(days, busdaycal=self._busdays)].astype('datetime64[ns]'))
+
+    def next_trading_day(self, day):
+        """某日之后的第一个交易日"""
+        return pd.Timestamp(np.busday_offset(_day(day) + 1, 0, roll='forward', busdaycal=self._busdays))
+
+    def previous_trading_day(self, day):
+        """某日之前的最后一个交易日"""
+        return pd.Timestamp(np.busday_offset(_day(day) - 1, 0, roll='backward', busdaycal=self._busdays))
+
+    def close_time(self, day):
+        """某个交易日的收盘时间（当日纳秒偏移），半日市时提前"""
+        return self.early_closes.get(_day(day), _time_of_day(TRADING_SESSIONS[-1][1]))
+
+    def session_minutes(self, day=None):
+        """某个交易日有数据的全部分钟（当日纳秒偏移），day 为None时按完整交易日计算"""
+        close = self.close_time(day) if day is not None else _time_of_day(TRADING_SESSIONS[-1][1])
+        minutes = [np.arange(_time_of_day(start), _time_of_day(end) + 1, MINUTE_NS, dtype=np.int64)
+                   for start, end in TRADING_SESSIONS]
+        minutes = np.concatenate(minutes)
+        return minutes[minutes <= close]
+
+    def bar_times(self, frequency, day=None):
+        """
+        某个周期在一个交易日内的全部K线时间
+
+        Args:
+            frequency: 日内周期 ('1m', '5m', '15m', '30m', '60m')
+            day: 交易日，用于处理半日市；None 表示完整交易日
+
+        Returns:
+            ndarray: 升序的当日纳秒偏移
+        """
+        if frequency not in INTRADAY_FREQUENCIES:
+            raise ValueError(f"不是日内周期: {frequency}")
+        close = self.close_time(day) if day is not None else _time_of_day(TRADING_SESSIONS[-1][1])
+        key = (frequency, close)
+        times = self._bar_times.get(key)
+        if times is None:
+            # aggregation 依赖本模块的时段定义，这里在函数内导入以避免循环导入
+            from aggregation import NAT, bar_labels
+
+            minutes = self.session_minutes(day)
+            labels = bar_labels(minutes, frequency)
+            times = np.unique(labels[labels != NAT])
+            with self._lock:
+                self._bar_times[key] = times
+        return times
+
+    def next_bar_time(self, timestamp, frequency):
+        """
+        某根K线之后下一根K线的时间，跳过午休、收盘后、周末和节假日
+
+        Args:
+            timestamp: 当前K线时间
+            frequency: 周期，日内周期或 '1d' / '1w' / '1M'
+
+        Returns:
+            pd.Timestamp
+        """
+        timestamp = pd.Timestamp(timestamp)
+        day = timestamp.normalize()
+
+        if frequency in INTRADAY_FREQUENCIES:
+            if self.is_trading_day(day):
+                times = self.bar_times(frequency, day)
+                index = int(np.searchsorted(times, timestamp.value - day.value, side='right'))
+                if index < len(times):
+                    return day + pd.Timedelta(int(times[index]))
+            next_day = self.next_trading_day(day)
+            return next_day + pd.Timedelta(int(self.bar_times(frequency, next_day)[0]))
+
+        from aggregation import bar_labels
+
+        # 日线及以上：当前K线（周线为周日、月线为月末）之后第一个交易日所在K线的时间
+        label = int(bar_labels(np.array([day.value], dtype=np.int64), frequency)[0])
+        next_day = self.next_trading_day(pd.Timestamp(label))
+        return pd.Timestamp(int(bar_labels(np.array([next_day.value], dtype=np.int64), frequency)[0]))
+
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+
+def get_calendar():
+    """获取全局交易日历，首次调用时读取 HOLIDAYS_FILE"""
+    global _calendar
+    if _calendar is None:
+        with _calendar_lock:
+            if _calendar is None:
+                _calendar = TradingCalendar.from_file(HOLIDAYS_FILE)
+    return _calendar
+
+
+if __name__ == '__main__':
+    calendar = get_calendar()
+    today = pd.Timestamp.now().normalize()
+    print(f"休市日文件: {HOLIDAYS_FILE}")
+    print(f"今天是否交易日: {calendar.is_trading_day(today)}")
+    print(f"下一个交易日: {calendar.next_trading_day(today).date()}")
+    for frequency in INTRADAY_FREQUENCIES:
+        times = [str(pd.Timedelta(int(value)))[-8:] for value in calendar.bar_times(frequency)]
+        print(f"  {frequency}: {len(times)} 根, {times[0]} ... {times[-1]}")